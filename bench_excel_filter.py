@@ -0,0 +1,69 @@
+import openpyxl
+import argparse
+import os
+import random
+import tempfile
+from excel_filter import filter_excel, parse_predicate
+
+# 每组条件分别用两个后端各跑一次
+PREDICATE_SETS = [
+    ['单位级别=1'],
+    ['地区 in 北京,上海'],
+    ['单位名称~^北京.*公司$'],
+    ['金额 between 1000,5000', '单位级别 in 1,2'],
+]
+
+def generate_workbook(path, rows, seed=0):
+    """生成测试用工作簿，单位级别混用'1级'、'１ 级'、2等写法"""
+    rng = random.Random(seed)
+    regions = ['北京', '上海', '广州', '深圳', '成都']
+    levels = ['1级', '１ 级', '1', 2, '2级', '３级']
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('数据')
+    ws.append(['单位名称', '单位级别', '地区', '金额', '备注'])
+    for i in range(rows):
+        region = rng.choice(regions)
+        ws.append([
+            f"{region}第{i}分公司",
+            rng.choice(levels),
+            region,
+            round(rng.uniform(0, 10000), 2),
+            f"备注{i % 97}",
+        ])
+    wb.save(path)
+
+def main():
+    parser = argparse.ArgumentParser(description='对比excel_filter两个后端在相同条件下的耗时')
+    parser.add_argument('-n', '--rows', type=int, default=100000, help='测试数据行数（默认100000）')
+    parser.add_argument('-f', '--file', type=str, help='使用已有的Excel文件（条件需与该文件的列匹配）')
+    parser.add_argument('-w', '--where', action='append', help='自定义一组筛选条件，可重复指定')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = args.file
+        if not input_path:
+            input_path = os.path.join(tmp_dir, f'bench_{args.rows}.xlsx')
+            print(f"正在生成 {args.rows} 行测试数据...")
+            generate_workbook(input_path, args.rows)
+        print(f"测试文件: {input_path} ({os.path.getsize(input_path) / (1024 * 1024):.1f}MB)\n")
+
+        predicate_sets = [args.where] if args.where else PREDICATE_SETS
+        print(f"{'筛选条件':<40}{'匹配行数':>10}{'stream(秒)':>12}{'pandas(秒)':>12}{'加速比':>8}")
+        for expressions in predicate_sets:
+            predicates = [parse_predicate(e) for e in expressions]
+            results = {}
+            for backend in ('stream', 'pandas'):
+                output_path = os.path.join(tmp_dir, f'out_{backend}.xlsx')
+                results[backend] = filter_excel(input_path, predicates, output_path,
+                                                backend=backend, show_progress=False)
+
+            stream, pandas_result = results['stream'], results['pandas']
+            if stream['matched_rows'] != pandas_result['matched_rows']:
+                print(f"警告: 两个后端匹配行数不一致 ({stream['matched_rows']} != {pandas_result['matched_rows']})")
+            speedup = stream['elapsed'] / pandas_result['elapsed'] if pandas_result['elapsed'] > 0 else 0
+            print(f"{'; '.join(expressions):<40}{stream['matched_rows']:>10}"
+                  f"{stream['elapsed']:>12.2f}{pandas_result['elapsed']:>12.2f}{speedup:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,79 @@
+import numpy as np
 import pandas as pd
 import sys
 import argparse
 import os
+from excel_cache import read_excel_cached
+import memory_profile
 
-def check_column_duplicates(file_path, column=None):
+# 支持的归一化规则：
+# strip   - 去除首尾空白
+# case    - 忽略大小写
+# width   - 全角字符转半角（如'１'→'1'，'Ａ'→'A'）
+# numeric - 数字与数字文本视为相同（如'001'与1）
+NORMALIZE_RULES = ('strip', 'case', 'width', 'numeric')
+
+# 可以按数字比较的文本格式（如'-1.50'、'1e3'）
+NUMBER_PATTERN = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+
+def parse_normalize_rules(rules_input):
+    """解析归一化规则输入（如'strip,case'或'all'），返回规则元组"""
+    if not rules_input:
+        return ()
+    if isinstance(rules_input, str):
+        rules_input = rules_input.replace('，', ',').split(',')
+    rules = []
+    for rule in rules_input:
+        rule = rule.strip().lower()
+        if not rule:
+            continue
+        if rule == 'all':
+            return NORMALIZE_RULES
+        if rule not in NORMALIZE_RULES:
+            raise ValueError(f"未知的归一化规则'{rule}'，可选: {', '.join(NORMALIZE_RULES)}, all")
+        if rule not in rules:
+            rules.append(rule)
+    return tuple(rules)
+
+def normalize_values(col_data, rules):
+    """
+    按归一化规则处理列数据，全部使用pandas向量化字符串操作，不逐行调用Python函数
+    
+    返回:
+    与col_data索引一致的字符串Series，空值保持为缺失值
+    """
+    normalized = col_data.astype('string')
+    
+    if 'width' in rules:
+        # NFKC会把全角数字、字母和符号折叠为半角形式
+        normalized = normalized.str.normalize('NFKC')
+    if 'strip' in rules:
+        normalized = normalized.str.strip()
+    if 'case' in rules:
+        normalized = normalized.str.casefold()
+    if 'numeric' in rules:
+        stripped = normalized.str.strip()
+        # 纯整数文本直接去掉正负号和前导零再补回负号，无需转换成数字
+        is_int_text = stripped.str.fullmatch(r'[+-]?\d+', na=False)
+        int_text = stripped[is_int_text]
+        digits = int_text.str.lstrip('+-').str.lstrip('0').replace('', '0')
+        is_negative = int_text.str.startswith('-') & (digits != '0')
+        digits = digits.mask(is_negative, '-' + digits)
+        normalized = normalized.mask(is_int_text, digits)
+        
+        # 小数和科学计数法先用正则筛选，避免to_numeric在大量非数字文本上逐个抛异常
+        is_number = ~is_int_text & stripped.str.fullmatch(NUMBER_PATTERN, na=False)
+        if is_number.any():
+            numbers = pd.to_numeric(stripped[is_number]).astype('float64')
+            # 值为整数的（如'1.0'、'1e3'）写成整数形式，与整数文本保持一致
+            is_integer = (numbers == numbers.round()) & (numbers.abs() < 2 ** 53)
+            number_text = numbers[~is_integer].astype('string')
+            integer_text = numbers[is_integer].astype('int64').astype('string')
+            normalized = normalized.mask(is_number, pd.concat([number_text, integer_text]))
+    
+    return normalized
+
+def check_column_duplicates(file_path, column=None, normalize=None):
     """
     检查Excel文件指定列的重复项
     
@@ -11,15 +81,19 @@ def check_column_duplicates(file_path, column=None):
     file_path: Excel文件路径
     column: 列名或列索引（例如'A'或0代表第一列，'B'或1代表第二列，以此类推）
             如果不指定，则默认检查第一列(A列)
+    normalize: 归一化规则（见NORMALIZE_RULES），可以是逗号分隔的字符串或列表，
+               不指定时按原始值比较
     
     返回:
     字符串，表示检查结果
     """
     # 读取Excel文件
+    memory_profile.profiler.begin()
     try:
-        df = pd.read_excel(file_path)
+        df = read_excel_cached(file_path)
     except Exception as e:
         return f"读取Excel文件出错: {str(e)}"
+    memory_profile.profiler.stage("读取Excel")
     
     # 检查文件是否为空
     if len(df.columns) == 0:
@@ -56,22 +130,51 @@ def check_column_duplicates(file_path, column=None):
         else:
             return f"找不到列'{column}'，请检查列名或使用列字母(A-Z)"
     
+    try:
+        rules = parse_normalize_rules(normalize)
+    except ValueError as e:
+        return str(e)
+    
+    # 计算用于比较的键，空值不参与比较
+    col_data = col_data.reset_index(drop=True)
+    keys = normalize_values(col_data, rules) if rules else col_data
+    keys = keys[keys.notna()]
+    memory_profile.profiler.stage("计算比较键")
+    
     # 检查重复值
-    duplicates = col_data[col_data.duplicated()]
+    duplicates = keys[keys.duplicated(keep=False)]
+    memory_profile.profiler.stage("查找重复")
     
     if duplicates.empty:
         return f"{col_name}中没有重复项"
     else:
-        # 获取所有重复的值及其所有出现的位置（行号）
+        # 按比较键分组（组的顺序为首次出现的顺序），排序后一次切分出每组所有出现的位置
+        codes, keys_unique = pd.factorize(duplicates)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        # 行号从1开始，符合Excel习惯
+        row_groups = np.split(duplicates.index.to_numpy()[order] + 1, bounds)
+        
         result = []
-        duplicate_values = set(duplicates)
-        for value in duplicate_values:
-            # 找出该值在列中出现的所有行位置（行号从1开始，符合Excel习惯）
-            rows = [i + 1 for i, v in enumerate(col_data) if v == value]
-            if len(rows) > 1:  # 确保至少有2行才算重复
-                result.append(f"值 '{value}' 在{col_name}中重复出现，行号为: {rows}")
+        if rules:
+            # 同组内出现过的原始值（按出现顺序去重），文本加引号以区分数字1和文本'1'
+            originals = pd.DataFrame({'code': codes, 'value': col_data[duplicates.index].to_numpy()})
+            originals = originals.drop_duplicates().sort_values('code', kind='stable')
+            is_text = originals['value'].map(type) == str
+            originals_text = originals['value'].astype(str)
+            originals_text = originals_text.mask(is_text, "'" + originals_text + "'").tolist()
+            originals_bounds = np.flatnonzero(np.diff(originals['code'].to_numpy())) + 1
+            starts = [0] + originals_bounds.tolist()
+            ends = originals_bounds.tolist() + [len(originals_text)]
+            for key, start, end, rows in zip(keys_unique, starts, ends, row_groups):
+                result.append(f"值 '{key}' 在{col_name}中重复出现（原始值: {', '.join(originals_text[start:end])}），行号为: {rows.tolist()}")
+        else:
+            for key, rows in zip(keys_unique, row_groups):
+                result.append(f"值 '{key}' 在{col_name}中重复出现，行号为: {rows.tolist()}")
         
-        return "\n".join(result)
+        report = "\n".join(result)
+        memory_profile.profiler.stage("生成结果")
+        return report
 
 def interactive_mode():
     """交互式模式，引导用户完成Excel重复项检查"""
@@ -110,8 +213,8 @@ def interactive_mode():
         return
     
     try:
-        # 读取文件以获取列信息
-        df = pd.read_excel(file_path)
+        # 读取文件以获取列信息（写入解析缓存，之后每次检查直接复用）
+        df = read_excel_cached(file_path)
         num_columns = len(df.columns)
         
         print(f"\n文件 '{file_path}' 包含 {num_columns} 列")
@@ -127,8 +230,12 @@ def interactive_mode():
         if not column_choice:
             column_choice = "A"  # 默认检查A列
         
+        # 询问是否启用归一化匹配
+        print(f"\n可选归一化规则: {', '.join(NORMALIZE_RULES)}（all表示全部）")
+        normalize_choice = input("请输入要启用的归一化规则（逗号分隔，直接按回车按原始值比较）: ").strip()
+        
         # 执行检查
-        result = check_column_duplicates(file_path, column_choice)
+        result = check_column_duplicates(file_path, column_choice, normalize_choice)
         
         print("\n===== 检查结果 =====")
         print(result)
@@ -141,7 +248,10 @@ def interactive_mode():
             
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write(f"文件: {file_path}\n")
-                f.write(f"检查列: {column_choice}\n\n")
+                f.write(f"检查列: {column_choice}\n")
+                if normalize_choice:
+                    f.write(f"归一化规则: {normalize_choice}\n")
+                f.write("\n")
                 f.write(result)
             print(f"结果已保存到 {output_file}")
             
@@ -151,7 +261,7 @@ def interactive_mode():
             # 递归调用，让用户选择新的列
             column_choice = input("\n请输入要检查的列字母（如A、B、C...）: ")
             if column_choice:
-                result = check_column_duplicates(file_path, column_choice)
+                result = check_column_duplicates(file_path, column_choice, normalize_choice)
                 print("\n===== 检查结果 =====")
                 print(result)
     
@@ -165,7 +275,10 @@ def main():
     parser = argparse.ArgumentParser(description='检查Excel文件中的重复项')
     parser.add_argument('file', type=str, nargs='?', help='Excel文件路径')
     parser.add_argument('-c', '--column', type=str, help='要检查的列(例如: A, B, C...或列名)')
+    parser.add_argument('-n', '--normalize', type=str,
+                        help=f"比较前的归一化规则，逗号分隔（可选: {', '.join(NORMALIZE_RULES)}, all）")
     parser.add_argument('-i', '--interactive', action='store_true', help='使用交互式模式')
+    parser.add_argument('--profile-memory', action='store_true', help='记录各阶段的内存峰值、RSS和新增内存最多的代码位置（会明显变慢）')
     
     # 解析命令行参数
     args = parser.parse_args()
@@ -187,9 +300,13 @@ def main():
                 # 不是数字，则按字母或列名处理
                 column = args.column
         
+        if args.profile_memory:
+            memory_profile.profiler.start()
+        
         # 调用主函数
-        result = check_column_duplicates(file_path, column)
+        result = check_column_duplicates(file_path, column, args.normalize)
         print(result)
+        memory_profile.profiler.report()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,103 @@
+import json
+import os
+
+# 同一文本累计失败这么多次后视为永久失败，--retry-failed不再重试
+DEAD_LETTER_MAX_ATTEMPTS = 3
+DIRECTIONS = ('zh_to_en', 'en_to_zh')
+
+def dead_letter_path(output_path):
+    """翻译结果文件对应的重试队列文件，如 data_translated.xlsx → data_translated_failed.json"""
+    name, _ = os.path.splitext(output_path)
+    return f'{name}_failed.json'
+
+class DeadLetterQueue:
+    """
+    未能翻译的文本的持久化重试队列（死信队列）
+
+    每次翻译结束时记录仍然失败的文本、失败次数和对应的单元格数，以及输出文件中原文列与翻译列的对应关系，
+    之后可以只重试这些文本并把译文补进输出文件，不必重新翻译整个文件。
+    因预算用完或取消而没有翻译的文本也记录在队列中（不计失败次数），重试时一并翻译。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # [{'source': 原文列名, 'target': 翻译列名, 'direction': 方向}]
+        self.columns = []
+        # {方向: {原文: {'attempts': 失败次数, 'cells': 单元格数}}}
+        self.texts = {direction: {} for direction in DIRECTIONS}
+        # 输出文件是否为部分结果（有因预算或取消没有翻译的文本）
+        self.partial = False
+
+    @classmethod
+    def load(cls, path):
+        """读取重试队列，文件不存在时返回None"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        queue = cls(path)
+        queue.columns = data.get('columns', [])
+        queue.partial = data.get('partial', False)
+        for direction in DIRECTIONS:
+            queue.texts[direction] = data.get('texts', {}).get(direction, {})
+        return queue
+
+    def record_run(self, columns, failures, skipped=None):
+        """
+        记录一次完整翻译的结果：failures和skipped为{方向: {原文: 单元格数}}
+
+        输出文件已经重新生成，队列中只保留这次仍然失败的文本，之前也失败过的累加失败次数；
+        skipped为因预算或取消没有翻译的文本，保留之前的失败次数。
+        """
+        self.columns = columns
+        skipped = skipped or {}
+        self.partial = any(skipped.values())
+        for direction in DIRECTIONS:
+            previous = self.texts[direction]
+            entries = {
+                text: {'attempts': previous.get(text, {}).get('attempts', 0), 'cells': cells}
+                for text, cells in skipped.get(direction, {}).items()
+            }
+            entries.update({
+                text: {'attempts': previous.get(text, {}).get('attempts', 0) + 1, 'cells': cells}
+                for text, cells in failures.get(direction, {}).items()
+            })
+            self.texts[direction] = entries
+
+    def record_retry(self, direction, recovered, failed):
+        """记录一次重试：recovered中的文本移出队列，failed中的文本失败次数加一"""
+        entries = self.texts[direction]
+        for text in recovered:
+            entries.pop(text, None)
+        for text in failed:
+            if text in entries:
+                entries[text]['attempts'] += 1
+
+    def retryable(self, direction):
+        """还没有达到失败次数上限的文本"""
+        return [text for text, entry in self.texts[direction].items()
+                if entry['attempts'] < DEAD_LETTER_MAX_ATTEMPTS]
+
+    def cell_count(self):
+        return sum(entry['cells'] for entries in self.texts.values() for entry in entries.values())
+
+    def permanent_cell_count(self):
+        """永久失败（达到失败次数上限）的文本对应的单元格数"""
+        return sum(entry['cells'] for entries in self.texts.values() for entry in entries.values()
+                   if entry['attempts'] >= DEAD_LETTER_MAX_ATTEMPTS)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.texts.values())
+
+    def save(self):
+        """保存队列；队列为空时删除文件"""
+        if not len(self):
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        # 先写入临时文件再替换，中断时不会留下写了一半的文件
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'columns': self.columns, 'partial': self.partial, 'texts': self.texts}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
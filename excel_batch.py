@@ -0,0 +1,182 @@
+import concurrent.futures
+import csv
+import datetime
+import glob
+import os
+import time
+import traceback
+from tqdm import tqdm
+
+# Excel文件扩展名（~$开头的是Excel打开文件时生成的锁文件）
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+def default_workers():
+    """默认进程数：CPU核数，至少为1"""
+    return os.cpu_count() or 1
+
+def collect_input_files(input_dir=None, pattern=None, recursive=False):
+    """
+    收集批量处理的Excel文件
+
+    参数:
+    input_dir: 目录，处理其中所有xlsx/xlsm文件
+    pattern: glob模式（如 'reports/*.xlsx' 或 'reports/**/*.xlsx'）
+    recursive: 目录模式下是否包含子目录
+
+    返回:
+    排序后的文件路径列表
+    """
+    if pattern:
+        files = glob.glob(pattern, recursive=True)
+    elif input_dir:
+        if not os.path.isdir(input_dir):
+            raise ValueError(f"目录 '{input_dir}' 不存在")
+        sub_pattern = os.path.join(input_dir, '**', '*') if recursive else os.path.join(input_dir, '*')
+        files = glob.glob(sub_pattern, recursive=recursive)
+    else:
+        raise ValueError("请指定输入目录或glob模式")
+
+    return sorted(
+        f for f in files
+        if os.path.isfile(f) and f.lower().endswith(EXCEL_EXTENSIONS) and not os.path.basename(f).startswith('~$')
+    )
+
+def plan_outputs(input_files, output_dir, suffix=''):
+    """
+    为每个输入文件确定输出路径：输出目录下的同名文件（可加后缀）
+
+    返回:
+    [(输入路径, 输出路径)]列表
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    seen = set()
+    for input_path in input_files:
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        output_path = os.path.join(output_dir, f'{name}{suffix}{ext}')
+        if os.path.abspath(output_path) == os.path.abspath(input_path):
+            raise ValueError(f"输出文件会覆盖输入文件 '{input_path}'，请指定其他输出目录")
+        if output_path in seen:
+            raise ValueError(f"多个输入文件对应同一个输出文件 '{output_path}'，请避免同名文件")
+        seen.add(output_path)
+        jobs.append((input_path, output_path))
+    return jobs
+
+def _run_job(task, input_path, output_path, kwargs):
+    """在工作进程中执行单个文件的任务，记录耗时和错误，不向外抛出异常"""
+    start_time = time.time()
+    try:
+        result = task(input_path, output_path=output_path, **kwargs)
+        return {'input': input_path, 'output': output_path, 'ok': True,
+                'elapsed': time.time() - start_time, 'result': result, 'error': None}
+    except Exception as e:
+        return {'input': input_path, 'output': output_path, 'ok': False,
+                'elapsed': time.time() - start_time, 'result': None,
+                'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}
+
+def run_batch(task, jobs, workers=None, **kwargs):
+    """
+    用进程池并行处理多个文件
+
+    参数:
+    task: 顶层函数，调用方式为 task(input_path, output_path=..., **kwargs)
+    jobs: [(输入路径, 输出路径)]列表
+    workers: 进程数，默认为CPU核数；为1时在当前进程中顺序执行
+
+    返回:
+    与jobs顺序一致的结果字典列表
+    """
+    workers = workers or default_workers()
+    results = [None] * len(jobs)
+
+    if workers == 1 or len(jobs) <= 1:
+        for i, (input_path, output_path) in enumerate(tqdm(jobs, desc="处理文件", unit="个")):
+            results[i] = _run_job(task, input_path, output_path, kwargs)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            future_to_index = {
+                executor.submit(_run_job, task, input_path, output_path, kwargs): i
+                for i, (input_path, output_path) in enumerate(jobs)
+            }
+            for future in tqdm(concurrent.futures.as_completed(future_to_index), total=len(jobs),
+                               desc="处理文件", unit="个"):
+                i = future_to_index[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    # 工作进程异常退出等无法在_run_job中捕获的错误
+                    input_path, output_path = jobs[i]
+                    results[i] = {'input': input_path, 'output': output_path, 'ok': False,
+                                  'elapsed': 0, 'result': None, 'error': f"{type(e).__name__}: {e}"}
+
+    return results
+
+def print_batch_summary(results, wall_time):
+    """输出批量处理摘要：每个文件的耗时、失败原因和总体统计"""
+    succeeded = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    total_task_time = sum(r['elapsed'] for r in results)
+
+    print("\n===== 批量处理结果 =====")
+    for r in sorted(results, key=lambda r: r['elapsed'], reverse=True):
+        status = "成功" if r['ok'] else "失败"
+        print(f"[{status}] {r['elapsed']:7.2f}秒  {os.path.basename(r['input'])}")
+    if failed:
+        print("\n失败的文件:")
+        for r in failed:
+            print(f"- {r['input']}: {r['error']}")
+
+    print(f"\n共 {len(results)} 个文件，成功 {len(succeeded)} 个，失败 {len(failed)} 个")
+    print(f"总耗时: {datetime.timedelta(seconds=int(wall_time))} (时:分:秒)，"
+          f"各文件耗时合计 {total_task_time:.1f} 秒")
+    if succeeded:
+        slowest = max(succeeded, key=lambda r: r['elapsed'])
+        print(f"单个文件平均 {sum(r['elapsed'] for r in succeeded) / len(succeeded):.2f} 秒，"
+              f"最慢 {slowest['elapsed']:.2f} 秒 ({os.path.basename(slowest['input'])})")
+
+def write_batch_report(results, report_path):
+    """将每个文件的处理结果写入CSV报告"""
+    with open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['输入文件', '输出文件', '状态', '耗时(秒)', '错误'])
+        for r in results:
+            writer.writerow([r['input'], r['output'], '成功' if r['ok'] else '失败',
+                             f"{r['elapsed']:.3f}", r['error'] or ''])
+
+def add_batch_arguments(parser):
+    """为命令行工具添加批量模式参数"""
+    group = parser.add_argument_group('批量模式（指定--input-dir或--glob时启用）')
+    group.add_argument('-d', '--input-dir', type=str, help='处理目录中的所有Excel文件')
+    group.add_argument('-g', '--glob', type=str, help="处理匹配glob模式的文件，如 'reports/**/*.xlsx'")
+    group.add_argument('--recursive', action='store_true', help='目录模式下包含子目录')
+    group.add_argument('--output-dir', type=str, help='批量模式的输出目录（输出文件与输入文件同名）')
+    group.add_argument('-j', '--workers', type=int, default=None, help=f'并行进程数（默认: CPU核数，当前为{default_workers()}）')
+    group.add_argument('--report', type=str, help='将每个文件的耗时和错误写入CSV报告')
+    return group
+
+def is_batch_mode(args):
+    """命令行参数是否要求批量模式"""
+    return bool(args.input_dir or args.glob)
+
+def run_batch_from_args(args, task, **kwargs):
+    """根据add_batch_arguments添加的参数执行批量处理并输出摘要，返回结果列表"""
+    if not args.output_dir:
+        raise ValueError("批量模式需要通过--output-dir指定输出目录")
+    if args.workers is not None and args.workers < 1:
+        raise ValueError("--workers必须大于0")
+
+    input_files = collect_input_files(args.input_dir, args.glob, args.recursive)
+    if not input_files:
+        print("没有找到需要处理的Excel文件")
+        return []
+    jobs = plan_outputs(input_files, args.output_dir)
+    workers = min(args.workers or default_workers(), len(jobs))
+    print(f"找到 {len(jobs)} 个文件，使用 {workers} 个进程处理，输出到 {args.output_dir}")
+
+    start_time = time.time()
+    results = run_batch(task, jobs, workers, **kwargs)
+    print_batch_summary(results, time.time() - start_time)
+    if args.report:
+        write_batch_report(results, args.report)
+        print(f"处理报告已保存到 {args.report}")
+    return results
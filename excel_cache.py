@@ -0,0 +1,195 @@
+import pandas as pd
+import hashlib
+import os
+import pickle
+# 条件导入pyarrow，用于Arrow IPC格式的缓存文件（读取快、可内存映射）
+try:
+    import pyarrow
+    import pyarrow.feather
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+# 缓存目录和容量，可通过环境变量修改；EXCEL_PARSE_CACHE=0 关闭缓存
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.excel_translator', 'cache')
+DEFAULT_CACHE_MAX_MB = 2048
+
+# 读取文件计算内容哈希时的块大小
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 缓存文件格式版本，格式变化时修改以使旧缓存失效
+CACHE_VERSION = 1
+
+# Arrow缓存中保存原始列名的元数据键
+COLUMNS_METADATA_KEY = b'excel_cache_columns'
+
+def cache_enabled():
+    """是否启用解析缓存（环境变量 EXCEL_PARSE_CACHE=0 时关闭）"""
+    return os.environ.get('EXCEL_PARSE_CACHE', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+
+def cache_dir():
+    """缓存目录（环境变量 EXCEL_PARSE_CACHE_DIR 可修改）"""
+    return os.environ.get('EXCEL_PARSE_CACHE_DIR') or DEFAULT_CACHE_DIR
+
+def cache_max_bytes():
+    """缓存总容量上限（环境变量 EXCEL_PARSE_CACHE_MB 可修改，单位MB）"""
+    try:
+        max_mb = float(os.environ.get('EXCEL_PARSE_CACHE_MB', DEFAULT_CACHE_MAX_MB))
+    except ValueError:
+        max_mb = DEFAULT_CACHE_MAX_MB
+    return int(max_mb * 1024 * 1024)
+
+def file_content_hash(path):
+    """分块计算文件内容的BLAKE2哈希"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(path, read_options):
+    """
+    缓存键：由路径、文件大小、修改时间、内容哈希和读取参数共同决定
+
+    文件被修改（即使大小和修改时间碰巧相同）或读取参数不同都会得到不同的键
+    """
+    stat = os.stat(path)
+    parts = [
+        f'v{CACHE_VERSION}',
+        os.path.abspath(path),
+        str(stat.st_size),
+        str(stat.st_mtime_ns),
+        file_content_hash(path),
+        repr(sorted(read_options.items())),
+    ]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+def _save_arrow(df, path):
+    """保存为Arrow IPC文件，列名按位置存为字符串，原始列名保存在元数据中"""
+    table_df = df.copy(deep=False)
+    table_df.columns = [str(i) for i in range(df.shape[1])]
+    table = pyarrow.Table.from_pandas(table_df.reset_index(drop=True), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[COLUMNS_METADATA_KEY] = pickle.dumps(list(df.columns))
+    pyarrow.feather.write_feather(table.replace_schema_metadata(metadata), path)
+
+def _load_arrow(path):
+    table = pyarrow.feather.read_table(path, memory_map=True)
+    df = table.to_pandas()
+    df.columns = pickle.loads(table.schema.metadata[COLUMNS_METADATA_KEY])
+    return df
+
+def _write_entry(df, base_path):
+    """
+    写入缓存文件：优先使用Arrow IPC，如果Arrow无法无损保存（如同一列中混有数字和文本）则使用pickle
+
+    返回:
+    写入的文件路径
+    """
+    if pyarrow_available and isinstance(df.index, pd.RangeIndex):
+        arrow_path = base_path + '.arrow'
+        tmp_path = f'{arrow_path}.{os.getpid()}.tmp'
+        try:
+            _save_arrow(df, tmp_path)
+            # 读回校验，类型或数值有变化时改用pickle
+            loaded = _load_arrow(tmp_path)
+            if loaded.equals(df) and list(loaded.dtypes) == list(df.dtypes):
+                os.replace(tmp_path, arrow_path)
+                return arrow_path
+        except (pyarrow.ArrowException, ValueError, TypeError):
+            pass
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    pickle_path = base_path + '.pkl'
+    tmp_path = f'{pickle_path}.{os.getpid()}.tmp'
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, pickle_path)
+    return pickle_path
+
+def _find_entry(base_path):
+    for ext in ('.arrow', '.pkl'):
+        if os.path.exists(base_path + ext):
+            return base_path + ext
+    return None
+
+def _load_entry(entry_path):
+    if entry_path.endswith('.arrow'):
+        return _load_arrow(entry_path)
+    return pd.read_pickle(entry_path)
+
+def evict_cache(max_bytes=None, directory=None):
+    """按最近使用时间淘汰缓存文件，直到总大小不超过上限，返回删除的文件数"""
+    max_bytes = cache_max_bytes() if max_bytes is None else max_bytes
+    directory = directory or cache_dir()
+    if not os.path.isdir(directory):
+        return 0
+
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(('.arrow', '.pkl')):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+def clear_cache(directory=None):
+    """删除所有缓存文件"""
+    return evict_cache(0, directory)
+
+def read_excel_cached(path, **read_options):
+    """
+    带缓存的pd.read_excel：首次解析后把DataFrame保存为列式缓存文件，
+    之后同一文件、同样参数的读取直接从缓存加载，不再解析xlsx
+
+    缓存按最近使用时间淘汰（LRU），总大小受 EXCEL_PARSE_CACHE_MB 限制。
+    读取参数（sheet_name、usecols、dtype等）与pd.read_excel相同，但不能包含函数等无法稳定表示的值。
+    """
+    if not cache_enabled():
+        return pd.read_excel(path, **read_options)
+
+    directory = cache_dir()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        base_path = os.path.join(directory, cache_key(path, read_options))
+    except OSError as e:
+        print(f"无法使用解析缓存（{e}），直接读取Excel文件")
+        return pd.read_excel(path, **read_options)
+
+    entry_path = _find_entry(base_path)
+    if entry_path:
+        try:
+            df = _load_entry(entry_path)
+            # 更新修改时间作为最近使用时间
+            os.utime(entry_path)
+            return df
+        except Exception as e:
+            print(f"解析缓存已损坏（{e}），重新读取Excel文件")
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+
+    df = pd.read_excel(path, **read_options)
+    try:
+        _write_entry(df, base_path)
+        evict_cache(directory=directory)
+    except Exception as e:
+        print(f"写入解析缓存失败: {e}")
+    return df
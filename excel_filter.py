@@ -0,0 +1,518 @@
+import openpyxl
+import numpy as np
+import pandas as pd
+import argparse
+import datetime
+import os
+import re
+import sys
+import time
+import unicodedata
+import zipfile
+import xml.etree.ElementTree as ET
+from tqdm import tqdm
+from excel_batch import add_batch_arguments, is_batch_mode, run_batch_from_args
+from excel_cache import read_excel_cached
+# 条件导入python-calamine，解析xlsx比openpyxl快一个数量级
+try:
+    import python_calamine
+    calamine_available = True
+except ImportError:
+    calamine_available = False
+
+# 归一化时默认忽略的字符（如'1级'与'1'视为相同）
+DEFAULT_IGNORE_CHARS = '级'
+
+# 筛选后端：stream=openpyxl逐行流式处理，pandas=按列向量化计算，auto=按文件大小自动选择
+BACKENDS = ('auto', 'stream', 'pandas')
+# 工作表XML（解压后）小于该值时auto使用pandas后端，更大的文件使用流式后端以控制内存
+PANDAS_MAX_SHEET_MB = 200
+# pandas后端读取Excel使用的引擎
+PANDAS_ENGINE = 'calamine' if calamine_available else 'openpyxl'
+
+# 可以转换为数字的文本格式（用于向量化数字比较前的筛选）
+NUMBER_PATTERN = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+
+# 谓词表达式：关键字形式（列名 in 值1,值2 / 列名 not in 值1,值2 / 列名 between 下限,上限）
+KEYWORD_PATTERN = re.compile(r'^\s*(?P<column>.+?)\s+(?P<op>not\s+in|in|between)\s+(?P<value>.+?)\s*$', re.IGNORECASE)
+# 谓词表达式：运算符形式（列名=值 / 列名!=值 / 列名~正则 / 列名>=数字 等）
+OPERATOR_PATTERN = re.compile(r'^\s*(?P<column>.+?)\s*(?P<op>==|!=|>=|<=|=|>|<|~)\s*(?P<value>.*?)\s*$')
+
+def normalize_value(value, ignore_chars=DEFAULT_IGNORE_CHARS):
+    """
+    单元格值归一化：全角转半角（如'１'→'1'），去掉所有空白和忽略字符（如'级'）
+
+    返回:
+    归一化后的字符串，空值返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Excel中的整数经常以浮点数读出，1.0与'1'视为相同
+        value = int(value)
+    text = unicodedata.normalize('NFKC', str(value))
+    text = ''.join(text.split())
+    for char in ignore_chars:
+        text = text.replace(char, '')
+    return text
+
+def text_mask(series):
+    """标记Series中的文本单元格（object列中数字、日期等其他类型为False）"""
+    if series.dtype == object:
+        try:
+            return series.str.len().notna()
+        except AttributeError:
+            # 整列都不是文本时pandas不允许使用.str
+            pass
+    return pd.Series(False, index=series.index)
+
+def normalize_series(series, ignore_chars=DEFAULT_IGNORE_CHARS):
+    """normalize_value的向量化版本，返回字符串Series，空值保持为缺失值"""
+    text = series.astype('string')
+    # 非文本的整数浮点值（如1.0）去掉小数部分，与normalize_value保持一致
+    is_text = text_mask(series)
+    text = text.mask(~is_text & text.str.fullmatch(r'-?\d+\.0', na=False), text.str[:-2])
+    text = text.str.normalize('NFKC').str.replace(r'\s+', '', regex=True)
+    if ignore_chars:
+        text = text.str.replace(f"[{re.escape(ignore_chars)}]", '', regex=True)
+    return text
+
+def to_number_series(series, ignore_chars=DEFAULT_IGNORE_CHARS):
+    """to_number的向量化版本，无法转换的值为NaN"""
+    if pd.api.types.is_bool_dtype(series):
+        return pd.Series(float('nan'), index=series.index)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    # 原本就是数字的单元格直接使用，文本先归一化，再用正则筛出形如数字的部分转换
+    is_text = text_mask(series)
+    is_bool = series.map(type) == bool
+    numbers = pd.to_numeric(series.where(~is_text & ~is_bool), errors='coerce')
+    text = normalize_series(series.where(is_text), ignore_chars)
+    is_number = text.str.fullmatch(NUMBER_PATTERN, na=False)
+    return numbers.mask(is_number, pd.to_numeric(text[is_number]).astype('float64'))
+
+class RawCell:
+    """
+    read_excel转换器：把每个单元格的值包装起来，原样保留读取到的值
+
+    pandas解析Excel时会把同一列中相等的值合并（如True与1、False与0），布尔单元格因此变成数字、
+    数字单元格变成布尔值。包装后pandas不再处理这些值，再用raw_values还原。
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+def _unwrap_cell(value):
+    if isinstance(value, RawCell):
+        value = value.value
+        return None if value == '' else value
+    # 没有转换器的列（表头之外的列）中pandas填充的缺失值
+    return None if pd.isna(value) else value
+
+_unwrap_cells = np.frompyfunc(_unwrap_cell, 1, 1)
+
+def raw_converters(columns):
+    """按列位置为read_excel（header=None）生成保留原始值的转换器"""
+    return {idx: RawCell for idx in columns}
+
+def raw_values(frame):
+    """把使用raw_converters读取的DataFrame还原为单元格原始值的object数组，空单元格为None"""
+    return _unwrap_cells(frame.to_numpy(dtype=object)).astype(object)
+
+def to_number(value, ignore_chars=DEFAULT_IGNORE_CHARS):
+    """将单元格值转换为数字，无法转换时返回None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    text = normalize_value(value, ignore_chars)
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+class Predicate:
+    """针对单列的筛选条件"""
+
+    OPERATORS = ('==', '!=', 'in', 'not in', '~', '>', '>=', '<', '<=', 'between')
+
+    def __init__(self, column, op, value, normalize=True, ignore_chars=DEFAULT_IGNORE_CHARS):
+        if op not in self.OPERATORS:
+            raise ValueError(f"不支持的运算符'{op}'，可选: {', '.join(self.OPERATORS)}")
+        self.column = column
+        self.op = op
+        self.value = value
+        self.normalize = normalize
+        self.ignore_chars = ignore_chars
+
+        # 预先处理比较值，避免每行重复计算
+        if op in ('==', '!='):
+            self.target = self._key(value)
+        elif op in ('in', 'not in'):
+            values = value if isinstance(value, (list, tuple, set)) else split_values(value)
+            self.targets = {self._key(v) for v in values}
+        elif op == '~':
+            self.pattern = re.compile(value)
+        elif op == 'between':
+            values = value if isinstance(value, (list, tuple)) else split_values(value)
+            if len(values) != 2:
+                raise ValueError(f"between需要两个值（下限,上限），收到: {value}")
+            self.low, self.high = (self._number(v) for v in values)
+            if self.low is None or self.high is None:
+                raise ValueError(f"between的上下限必须是数字，收到: {value}")
+        else:
+            self.target = self._number(value)
+            if self.target is None:
+                raise ValueError(f"运算符'{op}'需要数字，收到: {value}")
+
+    def _key(self, value):
+        """比较用的键：归一化字符串或原始字符串"""
+        if self.normalize:
+            return normalize_value(value, self.ignore_chars)
+        return None if value is None else str(value).strip()
+
+    def _number(self, value):
+        return to_number(value, self.ignore_chars if self.normalize else '')
+
+    def _key_series(self, series):
+        if self.normalize:
+            return normalize_series(series, self.ignore_chars)
+        return series.astype('string').str.strip()
+
+    def mask(self, series):
+        """matches的向量化版本：对整列求值，返回布尔Series"""
+        if self.op == '~':
+            return series.astype('string').str.contains(self.pattern.pattern, regex=True, na=False)
+        if self.op in ('==', '!=', 'in', 'not in'):
+            keys = self._key_series(series)
+            if self.op in ('==', '!='):
+                matched = (keys == self.target).fillna(False)
+            else:
+                matched = keys.isin(self.targets) & keys.notna()
+            return ~matched if self.op in ('!=', 'not in') else matched.astype(bool)
+
+        numbers = to_number_series(series, self.ignore_chars if self.normalize else '')
+        if self.op == '>':
+            return numbers > self.target
+        if self.op == '>=':
+            return numbers >= self.target
+        if self.op == '<':
+            return numbers < self.target
+        if self.op == '<=':
+            return numbers <= self.target
+        return (numbers >= self.low) & (numbers <= self.high)
+
+    def matches(self, value):
+        """判断单元格值是否满足条件，空值只满足!=和not in"""
+        if value is None:
+            return self.op in ('!=', 'not in')
+        if self.op == '==':
+            return self._key(value) == self.target
+        if self.op == '!=':
+            return self._key(value) != self.target
+        if self.op == 'in':
+            return self._key(value) in self.targets
+        if self.op == 'not in':
+            return self._key(value) not in self.targets
+        if self.op == '~':
+            # 正则匹配原始文本，不做归一化
+            return self.pattern.search(str(value)) is not None
+
+        number = self._number(value)
+        if number is None:
+            return False
+        if self.op == '>':
+            return number > self.target
+        if self.op == '>=':
+            return number >= self.target
+        if self.op == '<':
+            return number < self.target
+        if self.op == '<=':
+            return number <= self.target
+        return self.low <= number <= self.high
+
+    def __repr__(self):
+        return f"{self.column} {self.op} {self.value}"
+
+def split_values(value_input):
+    """拆分逗号分隔的值列表（支持中文逗号）"""
+    return [v.strip() for v in value_input.replace('，', ',').split(',') if v.strip()]
+
+def parse_predicate(expression, normalize=True, ignore_chars=DEFAULT_IGNORE_CHARS):
+    """
+    解析筛选表达式
+
+    支持的格式:
+    列名=值 / 列名==值      等于（归一化后比较）
+    列名!=值                不等于
+    列名 in 值1,值2         属于列表
+    列名 not in 值1,值2     不属于列表
+    列名~正则               正则匹配原始文本
+    列名>=数字（>、<、<=）  数字比较
+    列名 between 下限,上限  数字区间（含两端）
+    """
+    match = KEYWORD_PATTERN.match(expression)
+    if match:
+        op = ' '.join(match.group('op').lower().split())
+    else:
+        match = OPERATOR_PATTERN.match(expression)
+        if not match:
+            raise ValueError(f"无法解析筛选条件'{expression}'，示例: 单位级别=1、地区 in 北京,上海、金额>=100")
+        op = match.group('op')
+        if op == '=':
+            op = '=='
+
+    column = match.group('column').strip()
+    if not column:
+        raise ValueError(f"筛选条件'{expression}'缺少列名")
+    return Predicate(column, op, match.group('value'), normalize, ignore_chars)
+
+def resolve_column(header, column):
+    """根据表头名称或列字母（A、B...）确定列索引（从0开始）"""
+    if column in header:
+        return header.index(column)
+    if re.fullmatch(r'[A-Za-z]{1,3}', column):
+        col_idx = openpyxl.utils.column_index_from_string(column.upper()) - 1
+        if col_idx < len(header):
+            return col_idx
+    raise ValueError(f"未在表头 {header} 中找到列'{column}'")
+
+def default_output_path(input_path):
+    """自动生成输出文件名：原文件名加_filtered"""
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    return os.path.join(os.path.dirname(input_path), f'{name}_filtered{ext}')
+
+def estimate_sheet_size(input_path):
+    """估算工作表数据量：xlsx中工作表和共享字符串XML解压后的总字节数，无法读取时使用文件大小"""
+    try:
+        with zipfile.ZipFile(input_path) as zf:
+            return sum(info.file_size for info in zf.infolist()
+                       if info.filename.startswith('xl/worksheets/') or info.filename == 'xl/sharedStrings.xml')
+    except (zipfile.BadZipFile, OSError):
+        return os.path.getsize(input_path)
+
+def active_sheet_name(input_path):
+    """直接从xlsx的workbook.xml读取活动工作表名称，不加载工作表数据"""
+    ns = {'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+    with zipfile.ZipFile(input_path) as zf:
+        root = ET.fromstring(zf.read('xl/workbook.xml'))
+    view = root.find('main:bookViews/main:workbookView', ns)
+    active_tab = int(view.get('activeTab', 0)) if view is not None else 0
+    sheets = root.findall('main:sheets/main:sheet', ns)
+    return sheets[active_tab].get('name') if active_tab < len(sheets) else sheets[0].get('name')
+
+def select_backend(input_path, backend='auto'):
+    """
+    确定筛选后端：auto时中小文件使用pandas，大文件使用流式处理
+
+    pandas后端需要两次解析工作表，没有安装python-calamine时解析比流式后端慢，此时auto总是选择流式后端
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的筛选后端'{backend}'，可选: {', '.join(BACKENDS)}")
+    if backend != 'auto':
+        return backend
+    if not calamine_available:
+        return 'stream'
+    size_mb = estimate_sheet_size(input_path) / (1024 * 1024)
+    return 'pandas' if size_mb <= PANDAS_MAX_SHEET_MB else 'stream'
+
+def filter_excel(input_path, predicates, output_path=None, match_any=False, sheet_name=None,
+                 backend='auto', show_progress=True):
+    """
+    按条件筛选Excel行并写入新文件
+
+    参数:
+    input_path: 输入Excel文件路径
+    predicates: Predicate列表或筛选表达式字符串列表
+    output_path: 输出文件路径，默认为 原文件名_filtered.xlsx
+    match_any: True表示满足任一条件即保留，默认需要满足全部条件
+    sheet_name: 工作表名称，默认为活动工作表
+    backend: 'stream'、'pandas'或'auto'（按估算的文件大小选择）
+
+    返回:
+    包含行数统计、所用后端和耗时的字典
+    """
+    predicates = [p if isinstance(p, Predicate) else parse_predicate(p) for p in predicates]
+    if not predicates:
+        raise ValueError("请至少指定一个筛选条件")
+    output_path = output_path or default_output_path(input_path)
+
+    if select_backend(input_path, backend) == 'pandas':
+        return filter_excel_pandas(input_path, predicates, output_path, match_any, sheet_name)
+    return filter_excel_stream(input_path, predicates, output_path, match_any, sheet_name, show_progress)
+
+def filter_excel_stream(input_path, predicates, output_path, match_any=False, sheet_name=None, show_progress=True):
+    """流式筛选：只读模式逐行读取，只写模式逐行写出，内存占用与文件大小无关"""
+    start_time = time.time()
+
+    wb = openpyxl.load_workbook(input_path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = list(next(rows, None) or [])
+        if not header:
+            raise ValueError(f"工作表 '{ws.title}' 为空")
+
+        checks = [(resolve_column(header, p.column), p) for p in predicates]
+        combine = any if match_any else all
+
+        new_wb = openpyxl.Workbook(write_only=True)
+        new_ws = new_wb.create_sheet(ws.title)
+        new_ws.append(header)
+
+        total_rows = 0
+        matched_rows = 0
+        for row in tqdm(rows, desc="筛选行", unit="行", mininterval=1, disable=not show_progress):
+            total_rows += 1
+            row_len = len(row)
+            # 只读模式下行尾的空单元格不会返回，缺失的列按空值处理
+            if combine(p.matches(row[idx] if idx < row_len else None) for idx, p in checks):
+                new_ws.append(row)
+                matched_rows += 1
+    finally:
+        wb.close()
+
+    new_wb.save(output_path)
+
+    return {
+        'input': input_path,
+        'output': output_path,
+        'sheet': ws.title,
+        'backend': 'stream',
+        'total_rows': total_rows,
+        'matched_rows': matched_rows,
+        'elapsed': time.time() - start_time,
+    }
+
+def _combine_masks(masks, match_any):
+    """合并各条件的布尔掩码，返回numpy布尔数组"""
+    keep = masks[0]
+    for mask in masks[1:]:
+        keep = (keep | mask) if match_any else (keep & mask)
+    return keep.to_numpy(dtype=bool)
+
+def filter_excel_pandas(input_path, predicates, output_path, match_any=False, sheet_name=None):
+    """
+    向量化筛选：只读取条件涉及的列计算布尔掩码，再只读取匹配的行写出
+
+    适合内存充足的中等大小文件，比逐行判断快得多。
+    启用解析缓存时条件列的解析结果写入缓存（缓存键包含读取的列），之后用同样的条件列筛选同一文件时
+    第一遍直接从缓存加载；第二遍只读取匹配的行，不经过缓存。
+    单元格按原始值读取（见RawCell），布尔值、数字和文本的比较结果与流式后端相同，写出的也是原始值。
+    """
+    start_time = time.time()
+    sheet_title = sheet_name or active_sheet_name(input_path)
+
+    # 读取表头，确定条件列的位置（openpyxl只读模式打开工作表时会扫描整个工作表，这里不使用）
+    header_df = pd.read_excel(input_path, sheet_name=sheet_title, header=None, nrows=1, dtype=object, engine=PANDAS_ENGINE)
+    header = [None if pd.isna(v) else v for v in header_df.iloc[0]] if not header_df.empty else []
+    if not header:
+        raise ValueError(f"工作表 '{sheet_title}' 为空")
+    checks = [(resolve_column(header, p.column), p) for p in predicates]
+    used_columns = sorted({idx for idx, _ in checks})
+
+    # 第一遍：只读取条件列，向量化计算掩码（第0行为表头）；没有启用缓存时read_excel_cached直接读取
+    df = raw_values(read_excel_cached(input_path, sheet_name=sheet_title, header=None, usecols=used_columns,
+                                      engine=PANDAS_ENGINE, converters=raw_converters(used_columns)))
+    total_rows = len(df) - 1
+    keep = _combine_masks([p.mask(pd.Series(df[1:, used_columns.index(idx)], dtype=object)) for idx, p in checks],
+                          match_any)
+    del df
+
+    # 第二遍：只物化匹配的行（第0行为表头）
+    matched = raw_values(pd.read_excel(
+        input_path,
+        sheet_name=sheet_title,
+        header=None,
+        engine=PANDAS_ENGINE,
+        converters=raw_converters(range(len(header))),
+        skiprows=lambda i: i > 0 and (i > total_rows or not keep[i - 1])
+    ))
+
+    new_wb = openpyxl.Workbook(write_only=True)
+    new_ws = new_wb.create_sheet(sheet_title)
+    if not len(matched):
+        new_ws.append(header)
+    for row in matched:
+        new_ws.append(list(row))
+    new_wb.save(output_path)
+
+    return {
+        'input': input_path,
+        'output': output_path,
+        'sheet': sheet_title,
+        'backend': 'pandas',
+        'total_rows': total_rows,
+        'matched_rows': int(keep.sum()),
+        'elapsed': time.time() - start_time,
+    }
+
+def print_summary(summary, predicates):
+    """输出筛选结果摘要"""
+    elapsed = summary['elapsed']
+    rate = summary['total_rows'] / elapsed if elapsed > 0 else 0
+    print(f"\n筛选完成，已生成 {summary['output']}")
+    print(f"工作表: {summary['sheet']}，筛选后端: {summary['backend']}")
+    print(f"筛选条件: {'; '.join(str(p) for p in predicates)}")
+    print(f"数据行: {summary['total_rows']}，匹配: {summary['matched_rows']}")
+    print(f"总耗时: {datetime.timedelta(seconds=int(elapsed))} (时:分:秒)，约 {rate:.0f} 行/秒")
+
+def main():
+    # 创建命令行参数解析器
+    parser = argparse.ArgumentParser(
+        description='按列条件筛选Excel行',
+        epilog='条件示例: "单位级别=1"、"地区 in 北京,上海"、"名称~^北京"、"金额>=100"、"金额 between 10,20"'
+    )
+    parser.add_argument('file', type=str, nargs='?', help='Excel文件路径（批量模式下不需要）')
+    parser.add_argument('-w', '--where', action='append', required=True, help='筛选条件，可重复指定')
+    parser.add_argument('-o', '--output', type=str, help='输出文件路径（默认: 原文件名_filtered.xlsx）')
+    parser.add_argument('-s', '--sheet', type=str, help='工作表名称（默认: 活动工作表）')
+    parser.add_argument('--any', action='store_true', help='满足任一条件即保留（默认需满足全部条件）')
+    parser.add_argument('--ignore-chars', type=str, default=DEFAULT_IGNORE_CHARS,
+                        help=f"归一化时忽略的字符（默认: '{DEFAULT_IGNORE_CHARS}'）")
+    parser.add_argument('--no-normalize', action='store_true', help='按原始文本比较，不做全角转换和空白/字符清理')
+    parser.add_argument('--backend', type=str, choices=BACKENDS, default='auto',
+                        help=f'筛选后端：stream=流式逐行，pandas=按列向量化，auto=工作表不超过{PANDAS_MAX_SHEET_MB}MB时用pandas（默认）')
+
+    add_batch_arguments(parser)
+
+    # 解析命令行参数
+    args = parser.parse_args()
+
+    try:
+        predicates = [parse_predicate(w, not args.no_normalize, args.ignore_chars) for w in args.where]
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    if is_batch_mode(args):
+        try:
+            results = run_batch_from_args(args, filter_excel, predicates=predicates, match_any=args.any,
+                                          sheet_name=args.sheet, backend=args.backend, show_progress=False)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        if any(not r['ok'] for r in results):
+            sys.exit(1)
+        return
+
+    if not args.file:
+        parser.error('请指定Excel文件路径，或使用--input-dir/--glob进入批量模式')
+    if not os.path.exists(args.file):
+        print(f"错误：文件 '{args.file}' 不存在")
+        sys.exit(1)
+
+    try:
+        summary = filter_excel(args.file, predicates, args.output, args.any, args.sheet, args.backend)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    print_summary(summary, predicates)
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,350 @@
 import openpyxl
-from openpyxl.styles import Font
+from openpyxl.utils import column_index_from_string
+import argparse
+import copy
 import os
+import posixpath
+import re
+import shutil
+import sys
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from excel_batch import add_batch_arguments, is_batch_mode, run_batch_from_args
 
-# 获取当前脚本所在目录
-base_dir = os.path.dirname(os.path.abspath(__file__))
-input_path = os.path.join(base_dir, '1.xlsx')
-output_path = os.path.join(base_dir, 'output_py.xlsx')
-
-# 加载Excel文件
-wb = openpyxl.load_workbook(input_path)
-ws = wb.active  # 默认第一个sheet
-
-# 设置表头（第一行）字体：偶数列为绿色，其余为红色
-for idx, cell in enumerate(ws[1], start=1):
-    if idx % 2 == 0:
-        cell.font = Font(color='00B050')  # 绿色
-    else:
-        cell.font = Font(color='FF0000')  # 红色
-
-# 保存新文件
-wb.save(output_path)
-print('处理完成，表头偶数列为绿色，其余为红色！（Python版）') 
\ No newline at end of file
+# 默认颜色规则：偶数列为绿色，其余为红色
+DEFAULT_COLOR_RULES = 'odd=FF0000,even=00B050'
+
+# 处理模式：fast=直接修改xlsx中的样式和表头XML，openpyxl=加载整个工作簿后保存
+MODES = ('fast', 'openpyxl')
+
+# 查找第一行时每次从工作表XML读取的字节数
+CHUNK_SIZE = 1024 * 1024
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+def parse_color_rules(rules_input):
+    """
+    解析颜色规则，例如'odd=FF0000,even=00B050'或'all=0000FF,A-C=FF0000'
+
+    选择器: odd(奇数列)、even(偶数列)、all(所有列)、列字母(A)、列范围(A-C)
+    颜色: 6位RGB或8位ARGB十六进制
+    后面的规则覆盖前面的规则
+
+    返回:
+    [(起始列, 结束列, 奇偶, 颜色)]列表，列号从1开始
+    """
+    rules = []
+    for item in rules_input.replace('，', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '=' not in item:
+            raise ValueError(f"无法解析颜色规则'{item}'，格式为 选择器=颜色，例如 odd=FF0000")
+        selector, color = (part.strip() for part in item.split('=', 1))
+        color = color.lstrip('#').upper()
+        if not re.fullmatch(r'[0-9A-F]{6}|[0-9A-F]{8}', color):
+            raise ValueError(f"无效的颜色'{color}'，请使用6位RGB十六进制，例如 FF0000")
+
+        selector_lower = selector.lower()
+        if selector_lower in ('odd', 'even'):
+            rules.append((1, None, selector_lower, color))
+        elif selector_lower in ('all', '*'):
+            rules.append((1, None, None, color))
+        else:
+            match = re.fullmatch(r'([A-Za-z]{1,3})(?:-([A-Za-z]{1,3}))?', selector)
+            if not match:
+                raise ValueError(f"无效的列选择器'{selector}'，可用: odd、even、all、A、A-C")
+            start = column_index_from_string(match.group(1).upper())
+            end = column_index_from_string(match.group(2).upper()) if match.group(2) else start
+            rules.append((min(start, end), max(start, end), None, color))
+    if not rules:
+        raise ValueError("请至少指定一条颜色规则")
+    return rules
+
+def color_for_column(rules, col_idx):
+    """根据规则确定某列（从1开始）的颜色，没有匹配的规则时返回None"""
+    color = None
+    for start, end, parity, rule_color in rules:
+        if col_idx < start or (end is not None and col_idx > end):
+            continue
+        if parity == 'odd' and col_idx % 2 == 0:
+            continue
+        if parity == 'even' and col_idx % 2 == 1:
+            continue
+        color = rule_color
+    return color
+
+def argb(color):
+    """6位RGB补全为不透明的8位ARGB"""
+    return color if len(color) == 8 else f'FF{color}'
+
+def style_header_openpyxl(input_path, output_path, rules):
+    """加载整个工作簿设置表头颜色，兼容性最好，但大文件耗时和内存与工作表大小成正比"""
+    wb = openpyxl.load_workbook(input_path)
+    ws = wb.active  # 默认第一个sheet
+
+    styled = 0
+    for idx, cell in enumerate(ws[1], start=1):
+        color = color_for_column(rules, idx)
+        if color:
+            font = copy.copy(cell.font)
+            font.color = argb(color)
+            cell.font = font
+            styled += 1
+
+    wb.save(output_path)
+    return styled
+
+def _active_sheet_part(zf):
+    """从workbook.xml和关系文件中找到活动工作表在压缩包内的路径"""
+    workbook = ET.fromstring(zf.read('xl/workbook.xml'))
+    view = workbook.find(f'{{{NS_MAIN}}}bookViews/{{{NS_MAIN}}}workbookView')
+    active_tab = int(view.get('activeTab', 0)) if view is not None else 0
+    sheets = workbook.findall(f'{{{NS_MAIN}}}sheets/{{{NS_MAIN}}}sheet')
+    if not sheets:
+        raise ValueError("工作簿中没有工作表")
+    sheet = sheets[active_tab] if active_tab < len(sheets) else sheets[0]
+    rel_id = sheet.get(f'{{{NS_REL}}}id')
+
+    rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.findall(f'{{{NS_PKG_REL}}}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+    raise ValueError(f"找不到工作表 '{sheet.get('name')}' 对应的XML文件")
+
+def _read_first_row(stream):
+    """
+    从工作表XML流中读取到第一行结束为止
+
+    返回:
+    (已读取的字节, 第一行在其中的起止位置)，没有第一行时位置为None
+    """
+    row_pattern = re.compile(rb'<row\b[^>]*?(?:/>|>.*?</row>)', re.DOTALL)
+    data = b''
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        data += chunk
+        sheet_data = data.find(b'<sheetData')
+        if sheet_data != -1:
+            match = row_pattern.search(data, sheet_data)
+            if match:
+                return data, match.span()
+            if re.search(rb'<sheetData\s*/>|</sheetData>', data[sheet_data:]):
+                return data, None
+        if not chunk:
+            return data, None
+
+def _column_of(cell_tag, position):
+    """单元格的列号：优先取r属性（如B1），没有时按出现位置"""
+    ref = re.search(rb'\sr="([A-Za-z]+)\d*"', cell_tag)
+    return column_index_from_string(ref.group(1).decode().upper()) if ref else position
+
+def _set_attr(tag, name, value):
+    """设置XML开始标签中的属性，不存在时添加"""
+    pattern = re.compile(rf'\s{name}="[^"]*"')
+    if pattern.search(tag):
+        return pattern.sub(f' {name}="{value}"', tag, count=1)
+    return re.sub(r'^(<[\w:]+)', rf'\1 {name}="{value}"', tag, count=1)
+
+def _font_with_color(font_xml, color):
+    """复制字体并替换颜色，<color>放在<name>/<family>/<charset>/<scheme>之前，与Excel生成的顺序一致"""
+    color_tag = f'<color rgb="{argb(color)}"/>'
+    if font_xml.endswith('/>') and '</font>' not in font_xml:
+        return font_xml[:-2].rstrip() + f'>{color_tag}</font>'
+    font_xml = re.sub(r'<color\b[^>]*?(?:/>|>.*?</color>)', '', font_xml, flags=re.DOTALL)
+    anchor = re.search(r'<(?:name|family|charset|scheme)\b|</font>', font_xml)
+    return font_xml[:anchor.start()] + color_tag + font_xml[anchor.start():]
+
+class StyleSheetEditor:
+    """在styles.xml文本上追加字体和单元格格式，不解析或重写其他部分"""
+
+    FONTS_PATTERN = re.compile(r'(<fonts\b[^>]*>)(.*?)(</fonts>)', re.DOTALL)
+    XFS_PATTERN = re.compile(r'(<cellXfs\b[^>]*>)(.*?)(</cellXfs>)', re.DOTALL)
+    FONT_PATTERN = re.compile(r'<font\b[^>]*?(?:/>|>.*?</font>)', re.DOTALL)
+    XF_PATTERN = re.compile(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.DOTALL)
+
+    def __init__(self, xml):
+        self.xml = xml
+        fonts = self.FONTS_PATTERN.search(xml)
+        xfs = self.XFS_PATTERN.search(xml)
+        if not fonts or not xfs:
+            raise ValueError("styles.xml中缺少fonts或cellXfs，无法使用快速模式")
+        self.fonts = self.FONT_PATTERN.findall(fonts.group(2))
+        self.xfs = self.XF_PATTERN.findall(xfs.group(2))
+        self.new_fonts = []
+        self.new_xfs = []
+        self.cache = {}
+
+    def xf_with_color(self, style_idx, color):
+        """返回与style_idx相同但字体颜色为color的单元格格式索引"""
+        key = (style_idx, color)
+        if key in self.cache:
+            return self.cache[key]
+
+        xf = self.xfs[style_idx] if style_idx < len(self.xfs) else self.xfs[0]
+        xf_start = re.match(r'<xf\b[^>]*?/?>', xf).group(0)
+        font_id = re.search(r'\sfontId="(\d+)"', xf_start)
+        font_idx = int(font_id.group(1)) if font_id else 0
+        font = self.fonts[font_idx] if font_idx < len(self.fonts) else self.fonts[0]
+
+        new_font = _font_with_color(font, color)
+        all_fonts = self.fonts + self.new_fonts
+        if new_font in all_fonts:
+            new_font_idx = all_fonts.index(new_font)
+        else:
+            new_font_idx = len(all_fonts)
+            self.new_fonts.append(new_font)
+
+        new_xf_start = _set_attr(_set_attr(xf_start, 'fontId', new_font_idx), 'applyFont', 1)
+        self.new_xfs.append(new_xf_start + xf[len(xf_start):])
+        self.cache[key] = len(self.xfs) + len(self.new_xfs) - 1
+        return self.cache[key]
+
+    def to_xml(self):
+        """生成追加了新字体和格式的styles.xml"""
+        def append(pattern, xml, items, total):
+            match = pattern.search(xml)
+            start_tag = _set_attr(match.group(1), 'count', total)
+            return xml[:match.start()] + start_tag + match.group(2) + ''.join(items) + match.group(3) + xml[match.end():]
+
+        xml = append(self.FONTS_PATTERN, self.xml, self.new_fonts, len(self.fonts) + len(self.new_fonts))
+        return append(self.XFS_PATTERN, xml, self.new_xfs, len(self.xfs) + len(self.new_xfs))
+
+def style_header_fast(input_path, output_path, rules):
+    """
+    快速模式：只修改styles.xml和活动工作表第一行的XML，其余内容流式复制，
+    耗时与表头大小而不是工作表大小相关，不会把整个工作表加载到内存
+
+    只处理表头中已存在的单元格（XML中没有的空单元格不会被创建）。找不到第一行（如使用带命名空间前缀的
+    <x:row>标签）或XML中的第一行不是第1行时抛出ValueError，由style_header改用openpyxl模式
+    """
+    with zipfile.ZipFile(input_path) as zf:
+        sheet_part = _active_sheet_part(zf)
+        styles = StyleSheetEditor(zf.read('xl/styles.xml').decode('utf-8'))
+
+        with zf.open(sheet_part) as sheet_stream:
+            head, row_span = _read_first_row(sheet_stream)
+        original_head_size = len(head)
+
+        if not row_span:
+            raise ValueError("工作表XML中找不到第一行")
+        row_xml = head[row_span[0]:row_span[1]]
+        row_number = re.search(rb'\sr="(\d+)"', re.match(rb'<row\b[^>]*>', row_xml).group(0))
+        if row_number is not None and row_number.group(1) != b'1':
+            raise ValueError(f"工作表XML中的第一行是第{row_number.group(1).decode()}行，表头行不存在")
+
+        def restyle(match):
+            nonlocal position, styled
+            position += 1
+            tag = match.group(0)
+            col_idx = _column_of(tag, position)
+            color = color_for_column(rules, col_idx)
+            if not color:
+                return tag
+            style = re.search(rb'\ss="(\d+)"', tag)
+            new_style = styles.xf_with_color(int(style.group(1)) if style else 0, color)
+            styled += 1
+            return _set_attr(tag.decode('utf-8'), 's', new_style).encode('utf-8')
+
+        styled = 0
+        position = 0
+        row_xml = re.sub(rb'<c\b[^>]*?/?>', restyle, row_xml)
+        head = head[:row_span[0]] + row_xml + head[row_span[1]:]
+
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as out:
+            for info in zf.infolist():
+                new_info = copy.copy(info)
+                if info.filename == 'xl/styles.xml':
+                    out.writestr(new_info, styles.to_xml().encode('utf-8'))
+                elif info.filename == sheet_part:
+                    # 修改过的开头部分加上流式复制的剩余部分
+                    with zf.open(info) as src, out.open(new_info, 'w', force_zip64=True) as dst:
+                        src.read(original_head_size)
+                        dst.write(head)
+                        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                else:
+                    with zf.open(info) as src, out.open(new_info, 'w', force_zip64=info.file_size > 1 << 30) as dst:
+                        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+    return styled
+
+def style_header(input_path, output_path, rules=DEFAULT_COLOR_RULES, mode='fast'):
+    """
+    按颜色规则设置表头（第一行）字体颜色
+
+    参数:
+    input_path: 输入Excel文件路径
+    output_path: 输出文件路径
+    rules: 颜色规则字符串或parse_color_rules的结果
+    mode: 'fast'直接编辑xlsx中的XML（失败时自动回退），'openpyxl'加载整个工作簿
+
+    返回:
+    包含设置的单元格数、实际使用的模式和耗时的字典
+    """
+    if mode not in MODES:
+        raise ValueError(f"未知的处理模式'{mode}'，可选: {', '.join(MODES)}")
+    if isinstance(rules, str):
+        rules = parse_color_rules(rules)
+
+    start_time = time.time()
+    if mode == 'fast':
+        try:
+            styled = style_header_fast(input_path, output_path, rules)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            print(f"快速模式无法处理 {os.path.basename(input_path)}（{e}），改用openpyxl模式")
+            mode = 'openpyxl'
+    if mode == 'openpyxl':
+        styled = style_header_openpyxl(input_path, output_path, rules)
+
+    return {
+        'input': input_path,
+        'output': output_path,
+        'mode': mode,
+        'styled_cells': styled,
+        'elapsed': time.time() - start_time,
+    }
+
+def main():
+    # 获取当前脚本所在目录
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description='设置Excel表头（第一行）字体颜色')
+    parser.add_argument('file', type=str, nargs='?', default=os.path.join(base_dir, '1.xlsx'),
+                        help='Excel文件路径（默认: 脚本目录下的1.xlsx）')
+    parser.add_argument('-o', '--output', type=str, default=os.path.join(base_dir, 'output_py.xlsx'),
+                        help='输出文件路径（默认: 脚本目录下的output_py.xlsx）')
+    parser.add_argument('-r', '--rules', type=str, default=DEFAULT_COLOR_RULES,
+                        help=f'颜色规则，选择器可用odd、even、all、A、A-C，后面的规则覆盖前面的（默认: {DEFAULT_COLOR_RULES}）')
+    parser.add_argument('-m', '--mode', type=str, choices=MODES, default='fast',
+                        help='fast=只修改样式和表头XML（默认），openpyxl=加载整个工作簿')
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    if is_batch_mode(args):
+        try:
+            rules = parse_color_rules(args.rules)
+            results = run_batch_from_args(args, style_header, rules=rules, mode=args.mode)
+        except Exception as e:
+            print(f"错误: {e}")
+            sys.exit(1)
+        if any(not r['ok'] for r in results):
+            sys.exit(1)
+        return
+
+    try:
+        summary = style_header(args.file, args.output, args.rules, args.mode)
+    except Exception as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    print(f"处理完成，已生成 {summary['output']}")
+    print(f"模式: {summary['mode']}，设置了 {summary['styled_cells']} 个表头单元格，耗时 {summary['elapsed']:.2f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import time
+import tracemalloc
+
+# 可选：psutil可以在所有平台上读取进程的常驻内存（RSS），未安装时在Linux上读取/proc
+try:
+    import psutil
+    psutil_available = True
+except ImportError:
+    psutil_available = False
+
+# 每个阶段列出的新增内存最多的分配位置数
+PROFILE_TOP_SITES = 5
+# 记录分配位置时保存的调用栈深度（只用最内层的一帧定位到代码行）
+PROFILE_TRACE_FRAMES = 1
+
+def current_rss():
+    """当前进程的常驻内存（字节），无法读取时返回None"""
+    if psutil_available:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def format_bytes(size):
+    if size is None:
+        return "-"
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{sign}{size:.0f}{unit}" if unit == 'B' else f"{sign}{size:.1f}{unit}"
+        size /= 1024
+    return f"{sign}{size:.2f}GB"
+
+class MemoryProfiler:
+    """
+    按阶段记录内存使用
+
+    begin()开始一次记录，之后每个阶段结束时调用stage(阶段名)，记录该阶段的tracemalloc峰值、
+    阶段结束时仍占用的Python内存和进程RSS，并与上一个阶段结束时的快照比较，找出新增内存最多的分配位置；
+    report()在运行报告中输出各阶段的结果。没有调用start()时所有方法都不做任何事，不影响速度。
+    tracemalloc会明显拖慢分配密集的代码，只在排查内存问题时开启。
+    """
+
+    def __init__(self, top=PROFILE_TOP_SITES):
+        self.top = top
+        self.enabled = False
+        self.stages = []
+        self._snapshot = None
+        self._stage_start = None
+
+    def start(self):
+        """开启内存记录（--profile-memory）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACE_FRAMES)
+        self.enabled = True
+
+    def begin(self):
+        """开始记录一次运行，之后的阶段从这里算起"""
+        if not self.enabled:
+            return
+        self.stages = []
+        self._snapshot = self._take_snapshot()
+        self._stage_start = time.time()
+        tracemalloc.reset_peak()
+
+    def stage(self, name):
+        """记录一个阶段结束时的内存使用"""
+        if not self.enabled:
+            return
+        if self._snapshot is None:
+            self.begin()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self._take_snapshot()
+        sites = [stat for stat in snapshot.compare_to(self._snapshot, 'lineno') if stat.size_diff > 0][:self.top]
+        self.stages.append({
+            'name': name,
+            'seconds': time.time() - self._stage_start,
+            'current': current,
+            'peak': peak,
+            'rss': current_rss(),
+            'sites': [(str(stat.traceback[0]), stat.size_diff, stat.count_diff) for stat in sites],
+        })
+        # 只保留上一个快照，用于下一阶段的比较
+        self._snapshot = snapshot
+        self._stage_start = time.time()
+        tracemalloc.reset_peak()
+
+    def _take_snapshot(self):
+        # 不统计tracemalloc、本模块自身和模块导入的分配
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    def report(self):
+        """输出各阶段的内存峰值、阶段结束时的内存和新增内存最多的分配位置，然后清空记录"""
+        if not self.enabled or not self.stages:
+            return
+        print("\n各阶段内存使用（Python分配由tracemalloc统计，RSS为进程常驻内存）:")
+        for stage in self.stages:
+            print(f"- {stage['name']}: 峰值 {format_bytes(stage['peak'])}，结束时 {format_bytes(stage['current'])}，"
+                  f"RSS {format_bytes(stage['rss'])}，耗时 {stage['seconds']:.1f} 秒")
+            for site, size, count in stage['sites']:
+                print(f"    {format_bytes(size):>9}  {count:+} 个对象  {site}")
+        peak_stage = max(self.stages, key=lambda stage: stage['peak'])
+        print(f"内存峰值最高的阶段: {peak_stage['name']}（{format_bytes(peak_stage['peak'])}）")
+        self.stages = []
+        self._snapshot = None
+
+# 当前进程的内存记录，命令行指定--profile-memory时开启
+profiler = MemoryProfiler()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+# 工具都是仓库根目录下的脚本，测试时直接导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import translate_scheduler
+
+@pytest.fixture
+def scheduler_state(monkeypatch):
+    """重试不真正等待，并恢复进程内共用的调度设置（自动调整并发数、对冲、取消状态）"""
+    monkeypatch.setattr(translate_scheduler.retry_policy, 'max_retries', 1)
+    monkeypatch.setattr(translate_scheduler.retry_policy, 'base_delay', 0.001)
+    monkeypatch.setattr(translate_scheduler.retry_policy, 'max_delay', 0.01)
+    monkeypatch.setattr(translate_scheduler, 'concurrency_bounds', None)
+    monkeypatch.setattr(translate_scheduler, 'hedger', None)
+    monkeypatch.setattr(translate_scheduler, 'cancellation', translate_scheduler.Cancellation())
@@ -0,0 +1,60 @@
+import datetime
+
+import openpyxl
+import pytest
+
+import excel_filter
+
+# 同一列中混有布尔值、数字、文本和空值
+ROWS = [
+    ('a', 1), ('b', '1级'), ('c', 2), ('d', True), ('e', False), ('f', 'x'),
+    ('g', None), ('h', 0), ('i', 1.0), ('j', '１'), ('k', 2.5), ('l', 'True'),
+    ('m', datetime.datetime(2024, 1, 1)),
+]
+
+PREDICATES = [
+    '级=1', '级!=1', '级 in 0,1', '级 not in 1,2', '级>=1', '级<1', '级 between 0,1',
+    '级=True', '级~^T', '级=x', '级!=x',
+]
+
+def write_sheet(path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['名称', '级'])
+    for row in ROWS:
+        ws.append(row)
+    wb.save(path)
+
+def read_rows(path):
+    ws = openpyxl.load_workbook(path).active
+    # 按(类型, 值)比较，True与1、False与0不视为相同
+    return [tuple((type(v).__name__, v) for v in row) for row in ws.iter_rows(values_only=True)]
+
+@pytest.mark.parametrize('cache', ['1', '0'])
+@pytest.mark.parametrize('predicate', PREDICATES)
+def test_backends_match(tmp_path, monkeypatch, cache, predicate):
+    monkeypatch.setenv('EXCEL_PARSE_CACHE', cache)
+    monkeypatch.setenv('EXCEL_PARSE_CACHE_DIR', str(tmp_path / 'cache'))
+    input_path = tmp_path / 'mixed.xlsx'
+    write_sheet(input_path)
+
+    results = {}
+    for backend in ('stream', 'pandas'):
+        output_path = tmp_path / f'{backend}.xlsx'
+        summary = excel_filter.filter_excel(str(input_path), [predicate], str(output_path), backend=backend,
+                                            show_progress=False)
+        results[backend] = (summary['matched_rows'], read_rows(output_path))
+
+    assert results['pandas'] == results['stream']
+
+def test_bool_cells_written_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setenv('EXCEL_PARSE_CACHE', '0')
+    input_path = tmp_path / 'mixed.xlsx'
+    write_sheet(input_path)
+    output_path = tmp_path / 'out.xlsx'
+
+    excel_filter.filter_excel(str(input_path), ['名称 in d,e,h'], str(output_path), backend='pandas')
+
+    assert read_rows(output_path)[1:] == [
+        (('str', 'd'), ('bool', True)), (('str', 'e'), ('bool', False)), (('str', 'h'), ('int', 0)),
+    ]
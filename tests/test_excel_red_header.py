@@ -0,0 +1,35 @@
+import openpyxl
+
+import excel_red_header
+
+def header_colors(path):
+    ws = openpyxl.load_workbook(path).active
+    return [cell.font.color.rgb if cell.font.color else None for cell in ws[1]]
+
+def test_fast_mode_styles_header(tmp_path):
+    input_path = tmp_path / 'input.xlsx'
+    wb = openpyxl.Workbook()
+    wb.active.append(['a', 'b', 'c'])
+    wb.active.append([1, 2, 3])
+    wb.save(input_path)
+
+    result = excel_red_header.style_header(str(input_path), str(tmp_path / 'output.xlsx'))
+    assert result['mode'] == 'fast'
+    assert result['styled_cells'] == 3
+    assert header_colors(tmp_path / 'output.xlsx') == ['FFFF0000', 'FF00B050', 'FFFF0000']
+
+def test_missing_header_row_falls_back(tmp_path):
+    # 第1行为空时，工作表XML中的第一行是第2行
+    input_path = tmp_path / 'input.xlsx'
+    wb = openpyxl.Workbook()
+    wb.active['A2'] = 'x'
+    wb.save(input_path)
+
+    result = excel_red_header.style_header(str(input_path), str(tmp_path / 'output.xlsx'))
+    assert result['mode'] == 'openpyxl'
+
+def test_empty_sheet_falls_back(tmp_path):
+    input_path = tmp_path / 'input.xlsx'
+    openpyxl.Workbook().save(input_path)
+    result = excel_red_header.style_header(str(input_path), str(tmp_path / 'output.xlsx'))
+    assert result['mode'] == 'openpyxl'
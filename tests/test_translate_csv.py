@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+from deep_translator.exceptions import TooManyRequests
+
+import translate_csv
+import translate_scheduler
+
+class FakeTranslator:
+    """假翻译器：返回大写的原文，fail(原文, 第几次调用)为真时抛出error"""
+
+    target = 'en'
+
+    def __init__(self, fail=lambda text, call: False, error=ValueError):
+        self.fail = fail
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def translate(self, text):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.fail(text, call):
+            raise self.error('fake error')
+        return text.upper()
+
+@pytest.fixture
+def controllers(scheduler_state, monkeypatch):
+    """启用自动调整并发数，记录创建的控制器"""
+    created = []
+
+    class RecordingController(translate_scheduler.ConcurrencyController):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(translate_scheduler, 'ConcurrencyController', RecordingController)
+    monkeypatch.setattr(translate_scheduler, 'concurrency_bounds', (1, 8))
+    return created
+
+def register_breaker(translator):
+    # 测试中不让熔断器打开，否则要等待reset_timeout
+    translate_scheduler._breakers[translator] = translate_scheduler.CircuitBreaker('fake', failure_threshold=10 ** 6)
+
+def test_failed_texts_left_missing(scheduler_state):
+    translator = FakeTranslator(fail=lambda text, call: 'bad' in text)
+    register_breaker(translator)
+    texts = ['a', 'b', 'bad', 'c']
+    translations = translate_csv.concurrent_batch_translate(translator, texts, batch_size=2, workers=2)
+    assert translations == {'a': 'A', 'b': 'B', 'c': 'C'}
+    assert translate_csv.batch_translate(translator, ['a', 'bad', 'a'], batch_size=2, delay=0) == ['A', '', 'A']
+
+def test_concurrency_decreases_on_errors(controllers):
+    translator = FakeTranslator(fail=lambda text, call: True)
+    register_breaker(translator)
+    translate_csv.concurrent_batch_translate(translator, [f't{i}' for i in range(8)], batch_size=1, workers=4)
+    controller, = controllers
+    assert controller.current < 4
+    assert any(reason == "请求失败" for _, _, reason in controller.history)
+
+def test_concurrency_decreases_on_throttling(controllers):
+    # 前几个请求返回限流，重试后成功
+    translator = FakeTranslator(fail=lambda text, call: call <= 2, error=TooManyRequests)
+    register_breaker(translator)
+    translations = translate_csv.concurrent_batch_translate(
+        translator, [f't{i}' for i in range(8)], batch_size=1, workers=4)
+    assert len(translations) == 8
+    controller, = controllers
+    assert any(reason == "限流" for _, _, reason in controller.history)
+    assert min(limit for _, limit, _ in controller.history) < 4
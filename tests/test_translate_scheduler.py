@@ -0,0 +1,180 @@
+import threading
+import time
+
+import pytest
+
+import translate_scheduler
+from translate_ai import translate_batch_or_individually
+from translate_scheduler import (BatchScheduler, CircuitBreaker, CircuitOpenError, ConcurrencyController, Hedger,
+                                 Provider, ProviderPool, RateLimiter, RetryPolicy, TranslationAPIError,
+                                 call_translator, parse_retry_after)
+
+class FakeTranslator:
+    """假翻译器：返回大写的原文，fail(原文)为真时抛出ValueError"""
+
+    target = 'en'
+
+    def __init__(self, fail=lambda text: False):
+        self.fail = fail
+
+    def translate(self, text):
+        if self.fail(text):
+            raise ValueError('fake error')
+        return text.upper()
+
+def provider(name, translator, workers=1):
+    # 测试中不让熔断器打开，否则要等待reset_timeout
+    translate_scheduler._breakers[translator] = CircuitBreaker(name, failure_threshold=10 ** 6)
+    return Provider(name, translator, workers=workers)
+
+def test_breaker_opens_and_probe_closes(scheduler_state):
+    translator = FakeTranslator(fail=lambda text: True)
+    breaker = translate_scheduler._breakers[translator] = CircuitBreaker('fake', failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            call_translator(translator, 'a')
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        call_translator(translator, 'a')
+    assert breaker.retry_in() > 0
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    # 半开状态只放行一个探测请求
+    assert not breaker.allow()
+    assert breaker.retry_in() == 1
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    translator.fail = lambda text: False
+    assert call_translator(translator, 'a') == 'A'
+
+def test_failed_probe_reopens(scheduler_state):
+    translator = FakeTranslator(fail=lambda text: True)
+    breaker = translate_scheduler._breakers[translator] = CircuitBreaker('fake', failure_threshold=1, reset_timeout=0.05)
+    with pytest.raises(ValueError):
+        call_translator(translator, 'a')
+    time.sleep(0.06)
+    with pytest.raises(ValueError):
+        call_translator(translator, 'a')
+    assert breaker.state == 'open'
+    assert breaker.open_count == 2
+
+def test_retry_after_honoured_and_backoff_capped():
+    policy = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=10.0)
+    assert policy.backoff(0, retry_after=7) == 7
+    assert policy.backoff(0, retry_after=3600) == 10.0
+    for attempt in range(20):
+        assert 0 < policy.backoff(attempt) <= 10.0
+    assert policy.backoff(10) >= 5.0
+
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after('not a date') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0
+
+def test_throttled_retry_pauses_limiter_for_retry_after():
+    pauses = []
+
+    class RecordingLimiter(RateLimiter):
+        def throttle(self, pause):
+            pauses.append(pause)
+
+    responses = [TranslationAPIError('429', status_code=429, retry_after=0.02), 'ok']
+
+    def func():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    limiter = RecordingLimiter()
+    assert RetryPolicy(max_retries=2, max_delay=5).call(func, limiter) == 'ok'
+    assert pauses == [0.02]
+
+def test_non_retryable_error_not_retried():
+    calls = []
+
+    def func():
+        calls.append(1)
+        raise TranslationAPIError('bad request', status_code=400)
+
+    with pytest.raises(TranslationAPIError):
+        RetryPolicy(max_retries=3, base_delay=0.001).call(func)
+    assert len(calls) == 1
+
+def test_failed_texts_missing_not_source(scheduler_state):
+    translator = FakeTranslator(fail=lambda text: 'bad' in text)
+    scheduler = BatchScheduler(ProviderPool([provider('fake', translator)]), translate_batch_or_individually,
+                               show_progress=False)
+    results, failed = scheduler.run([['a', 'bad1'], ['bad2', 'b']])
+    assert results == {'a': 'A', 'b': 'B'}
+    assert sorted(failed) == ['bad1', 'bad2']
+
+def test_failed_batches_go_to_other_provider(scheduler_state):
+    broken = FakeTranslator(fail=lambda text: True)
+    working = FakeTranslator()
+    pool = ProviderPool([provider('broken', broken, workers=2), provider('working', working)])
+    scheduler = BatchScheduler(pool, translate_batch_or_individually, show_progress=False)
+    batches = [[f't{i}'] for i in range(10)]
+    results, failed = scheduler.run(batches)
+    assert results == {f't{i}': f'T{i}' for i in range(10)}
+    assert failed == []
+
+def test_abandon_after_grace(scheduler_state):
+    translate_scheduler.cancellation.grace = 0.05
+    release = threading.Event()
+
+    def hanging(translator, texts):
+        release.wait(5)
+        return {}
+
+    done = {'skipped': []}
+
+    def on_done(results, failed, skipped):
+        done['skipped'].extend(skipped)
+
+    scheduler = BatchScheduler(ProviderPool([provider('slow', FakeTranslator())]), hanging,
+                               show_progress=False, on_done=on_done)
+    scheduler.start()
+    scheduler.submit([['a'], ['b']])
+    scheduler.close()
+    time.sleep(0.05)
+    translate_scheduler.cancellation.request()
+    scheduler.join()
+    release.set()
+    assert sorted(done['skipped']) == ['a', 'b']
+
+def test_hedge_budget_respected():
+    hedger = Hedger(percentile=50, budget=0.1, min_samples=5, concurrency=4)
+    translator = FakeTranslator()
+
+    def func(translator, batch):
+        time.sleep(batch)
+        return batch
+
+    for _ in range(10):
+        hedger.call(func, translator, 0.001)
+    # 之后的请求都明显超过分位数耗时，对冲次数受预算限制
+    for _ in range(30):
+        hedger.call(func, translator, 0.02)
+    assert 0 < hedger.hedges <= hedger.budget * hedger.calls
+
+def test_aimd_halves_on_throttling_and_stays_in_bounds():
+    controller = ConcurrencyController('fake', 4, 2, 6)
+    controller.acquire()
+    controller.release(0.1, throttled=True)
+    assert controller.current == 2
+    # 冷却期内不重复减小
+    controller.acquire()
+    controller.release(0.1, error=True)
+    assert controller.current == 2
+    controller._cooldown_until = 0
+    controller.acquire()
+    controller.release(0.1, error=True)
+    assert controller.current == 2
+
+    for _ in range(200):
+        controller.acquire()
+        controller.release(0.1)
+        assert 2 <= controller.current <= 6
+    assert controller.current == 6
+    assert controller.history[-1][2] == "增加"
@@ -0,0 +1,114 @@
+import os
+import threading
+
+import openpyxl
+import pytest
+
+import translate_shards
+
+SHARDS = 4
+
+def write_sheet(path, texts):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(['中文'])
+    for text in texts:
+        ws.append([text])
+    wb.save(path)
+
+def export(tmp_path, texts):
+    input_path = tmp_path / 'input.xlsx'
+    write_sheet(input_path, texts)
+    return translate_shards.export_shards(str(input_path), [0], [], SHARDS, str(tmp_path / 'shards'))
+
+def make_stale(path):
+    os.utime(path, (0, 0))
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    manifest = export(tmp_path, ['你好', '世界'])
+    return str(tmp_path / 'shards'), manifest
+
+def test_only_one_claim_succeeds(shard_dir):
+    directory, manifest = shard_dir
+    assert translate_shards.claim_shard(directory, manifest, 0) == 0
+    assert translate_shards.claim_shard(directory, manifest, 0) is None
+
+def test_concurrent_claims_on_stale_lock(shard_dir):
+    directory, manifest = shard_dir
+    lock = translate_shards.shard_paths(directory, 0)['lock']
+    with open(lock, 'w') as f:
+        f.write('old\n')
+    make_stale(lock)
+
+    claims = []
+    barrier = threading.Barrier(8)
+
+    def claim():
+        barrier.wait()
+        claims.append(translate_shards.claim_shard(directory, manifest, 0, lock_timeout=60))
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert claims.count(0) == 1
+    assert not [name for name in os.listdir(directory) if name.endswith('.stale')]
+
+def test_stale_lock_taken_over(shard_dir):
+    directory, manifest = shard_dir
+    lock = translate_shards.shard_paths(directory, 0)['lock']
+    with open(lock, 'w') as f:
+        f.write('old\n')
+    make_stale(lock)
+    assert translate_shards.claim_shard(directory, manifest, 0, lock_timeout=60) == 0
+    with open(lock) as f:
+        assert f.read() != 'old\n'
+
+def test_fresh_lock_put_back_intact(shard_dir):
+    directory, _ = shard_dir
+    lock = translate_shards.shard_paths(directory, 0)['lock']
+    with open(lock, 'w') as f:
+        f.write('other node\n')
+    # 其他节点在检查和改名之间重新创建了锁文件
+    assert not translate_shards._take_over_stale_lock(lock, 60)
+    with open(lock) as f:
+        assert f.read() == 'other node\n'
+    assert not [name for name in os.listdir(directory) if name.endswith('.stale')]
+
+def test_reexport_keeps_unchanged_results(tmp_path):
+    texts = [f'文本{i}' for i in range(20)]
+    export(tmp_path, texts)
+    directory = str(tmp_path / 'shards')
+    for index in range(SHARDS):
+        with open(translate_shards.shard_paths(directory, index)['result'], 'w') as f:
+            f.write('direction,text,translation\n')
+
+    added = '新增文本'
+    changed = translate_shards.shard_of('zh_to_en', added, SHARDS)
+    export(tmp_path, texts + [added])
+    for index in range(SHARDS):
+        assert os.path.exists(translate_shards.shard_paths(directory, index)['result']) == (index != changed)
+
+def test_export_refuses_changed_shard_locked_by_other_node(tmp_path):
+    texts = [f'文本{i}' for i in range(20)]
+    export(tmp_path, texts)
+    directory = str(tmp_path / 'shards')
+    added = '新增文本'
+    paths = translate_shards.shard_paths(directory, translate_shards.shard_of('zh_to_en', added, SHARDS))
+    with open(paths['partial'], 'w') as f:
+        f.write('direction,text,translation\n')
+    with open(paths['lock'], 'w') as f:
+        f.write('other node\n')
+
+    with pytest.raises(ValueError):
+        export(tmp_path, texts + [added])
+    assert os.path.exists(paths['partial'])
+    # 拒绝导出时不写入任何文件，manifest仍是上次导出的内容
+    assert sum(entry['texts'] for entry in translate_shards.load_manifest(directory)['shards']) == len(texts)
+
+    # 锁超时后可以重新导出
+    make_stale(paths['lock'])
+    export(tmp_path, texts + [added])
+    assert not os.path.exists(paths['partial'])
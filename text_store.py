@@ -0,0 +1,111 @@
+from array import array
+
+# 单元格没有需要翻译的文本时的编号
+NO_TEXT = -1
+
+class TextStore:
+    """
+    紧凑的去重文本存储
+
+    每个唯一文本只以UTF-8形式保存一次，所有文本连续存放在同一个bytearray中，用偏移数组定位；
+    单元格只需保存文本编号（整数）。译文同样连续存放，与原文按编号一一对应。
+    查找表只保存文本的哈希值到编号的映射，不保留每个文本的Python字符串对象。
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # 第i个文本为 _buffer[_offsets[i]:_offsets[i + 1]]
+        self._offsets = array('q', [0])
+        # 哈希值 -> 编号；哈希值相同的不同文本放在_collisions中
+        self._index = {}
+        self._collisions = {}
+        self._translation_buffer = bytearray()
+        # 译文在_translation_buffer中的起始位置和长度，长度为-1表示还没有译文
+        self._translation_starts = array('q')
+        self._translation_lengths = array('q')
+        # 每个文本出现的次数（单元格数）
+        self._counts = array('i')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _bytes(self, text_id):
+        return self._buffer[self._offsets[text_id]:self._offsets[text_id + 1]]
+
+    def text(self, text_id):
+        return self._bytes(text_id).decode('utf-8')
+
+    def texts(self):
+        """按编号顺序返回所有文本"""
+        for text_id in range(len(self)):
+            yield self.text(text_id)
+
+    def find(self, text):
+        """文本的编号，不存在时返回None"""
+        text_id = self._index.get(hash(text))
+        if text_id is None:
+            return None
+        if self._bytes(text_id) == text.encode('utf-8'):
+            return text_id
+        return self._collisions.get(text)
+
+    def add(self, text):
+        """加入文本（已存在时不重复保存），返回编号"""
+        key = hash(text)
+        text_id = self._index.get(key)
+        encoded = text.encode('utf-8')
+        if text_id is not None:
+            if self._bytes(text_id) != encoded:
+                text_id = self._collisions.get(text)
+            if text_id is not None:
+                self._counts[text_id] += 1
+                return text_id
+        new_id = len(self)
+        self._buffer += encoded
+        self._offsets.append(len(self._buffer))
+        self._translation_starts.append(0)
+        self._translation_lengths.append(-1)
+        self._counts.append(1)
+        if key not in self._index:
+            self._index[key] = new_id
+        else:
+            self._collisions[text] = new_id
+        return new_id
+
+    def count(self, text_id):
+        """文本出现的次数"""
+        return self._counts[text_id]
+
+    def counts(self):
+        """按编号顺序返回所有文本出现的次数"""
+        return list(self._counts)
+
+    def set_translation(self, text_id, translation):
+        """保存译文；为None时不保存"""
+        if translation is None:
+            return
+        encoded = translation.encode('utf-8')
+        self._translation_starts[text_id] = len(self._translation_buffer)
+        self._translation_lengths[text_id] = len(encoded)
+        self._translation_buffer += encoded
+
+    def translation(self, text_id):
+        """文本的译文，没有译文时返回None"""
+        length = self._translation_lengths[text_id]
+        if length < 0:
+            return None
+        start = self._translation_starts[text_id]
+        return self._translation_buffer[start:start + length].decode('utf-8')
+
+    def untranslated_count(self):
+        return sum(1 for length in self._translation_lengths if length < 0)
+
+    def nbytes(self):
+        """原文、译文和索引数组占用的字节数（不含哈希查找表）"""
+        return (len(self._buffer) + len(self._translation_buffer) + self._offsets.itemsize * len(self._offsets)
+                + self._translation_starts.itemsize * len(self._translation_starts) * 2
+                + self._counts.itemsize * len(self._counts))
+
+def new_cell_ids():
+    """保存一列单元格文本编号的数组（每个单元格4字节）"""
+    return array('i')
@@ -4,16 +4,27 @@ import os
 from tqdm import tqdm
 import string
 import time
-from collections import defaultdict
+from collections import Counter, defaultdict
 import sys
 import argparse
 import re
 import pandas as pd
 import csv
-import concurrent.futures
 import datetime
 import requests
 import json
+import threading
+import itertools
+import queue
+import urllib.parse
+from excel_cache import read_excel_cached
+from text_store import NO_TEXT, TextStore, new_cell_ids
+from dead_letter import DEAD_LETTER_MAX_ATTEMPTS, DeadLetterQueue, dead_letter_path
+import memory_profile
+import translate_scheduler
+from translate_scheduler import (BatchScheduler, CircuitOpenError, Provider, ProviderPool,
+                                 TranslationAPIError, breaker_for, call_translator, limiter_for,
+                                 parse_retry_after)
 # 条件导入dotenv和configparser
 try:
     import dotenv
@@ -36,152 +47,715 @@ def index_to_column_letter(index):
     """将索引转换为列字母（0=A, 1=B, ...）"""
     return string.ascii_uppercase[index]
 
-# 批量翻译函数
-def batch_translate(translator, texts, batch_size=10, delay=1):
-    """批量翻译文本，减少API调用次数"""
-    if not texts:
-        return []
-        
-    # 去重以减少翻译量
-    unique_texts = list(set(texts))
-    print(f"需要翻译 {len(texts)} 个单元格，去重后 {len(unique_texts)} 个唯一文本")
-    
-    # 创建翻译缓存
+# DeepSeek token估算：中日韩字符约0.6个token，其他字符约0.3个token（DeepSeek官方给出的换算比例）
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\u3000-\u303f\uff00-\uffef]')
+# 译文token数与原文token数的估算比例（按目标语言），可根据翻译结束时输出的实际用量调整
+OUTPUT_TOKEN_RATIO = {'en': 1.5, 'zh': 1.0}
+# DeepSeek每批次估算的最大token数（输入和输出取较大者）；deepseek-chat默认最多输出4096个token，留出估算误差的余量
+DEEPSEEK_MAX_BATCH_TOKENS = 2500
+# DeepSeek合并文本的分隔符
+DEEPSEEK_SEPARATOR = " [SEP] "
+# DeepSeek请求超时（连接超时, 读取超时），超时的请求按重试策略重试
+DEEPSEEK_TIMEOUT = (10, 120)
+# DeepSeek连接池大小（并发请求数超过时多出的连接用完即关闭）
+DEEPSEEK_POOL_SIZE = 32
+
+# CSV模式下每个翻译服务同时进行的批量请求数
+DEFAULT_WORKERS = 3
+
+# 流水线模式每次读取的行数，以及读取→翻译→写入各阶段之间最多缓存的块数
+PIPELINE_CHUNK_ROWS = 1000
+PIPELINE_QUEUE_CHUNKS = 4
+
+def utf8_length(text):
+    """文本的UTF-8字节数"""
+    return len(text.encode('utf-8'))
+
+def url_encoded_length(text):
+    """文本作为URL参数发送时编码后的长度（与requests编码参数的方式相同，中文每个字占9个字符）"""
+    return len(urllib.parse.quote_plus(text))
+
+class BatchAdapter:
+    """
+    翻译器的批量翻译方式：用什么分隔符合并多段文本、拆分失败时尝试哪些分隔符变体，以及每个请求的长度上限
+
+    native为True表示翻译器原生支持用该分隔符批量翻译（结果逐段对齐），按长度上限合并尽量多的文本；
+    否则分隔符只是约定，批次大小由batch_size决定，长度上限只用来拆分过长的批次。
+    """
+
+    def __init__(self, separator, alternates=(), max_length=None, measure=len, native=False):
+        self.separator = separator
+        self.alternates = list(alternates)
+        self.max_length = max_length
+        self.measure = measure
+        self.native = native
+
+    def can_join(self, text):
+        """文本本身不包含分隔符，才能和其他文本合并"""
+        return (self.separator.strip() or self.separator) not in text
+
+    def too_long(self, text):
+        return self.max_length is not None and self.measure(text) > self.max_length
+
+    def length(self, texts):
+        return self.measure(self.separator.join(texts))
+
+    def pack(self, texts):
+        """按长度上限依次合并文本，不能合并或超过上限的文本单独成批"""
+        groups = []
+        current = []
+        current_length = 0
+        separator_length = self.measure(self.separator)
+        for text in texts:
+            if not self.can_join(text) or self.too_long(text):
+                groups.append([text])
+                continue
+            text_length = self.measure(text)
+            if current and self.max_length is not None and current_length + separator_length + text_length > self.max_length:
+                groups.append(current)
+                current = []
+                current_length = 0
+            current_length += text_length + (separator_length if current else 0)
+            current.append(text)
+        if current:
+            groups.append(current)
+        return groups
+
+    def split(self, translated, count):
+        """按分隔符拆分翻译结果，数量与原文不符时尝试其他分隔符变体，都不符时返回None"""
+        for separator in [self.separator] + self.alternates:
+            parts = translated.split(separator)
+            if len(parts) == count:
+                return parts
+        return None
+
+# 百度翻译原生支持用换行符分隔的多段文本（结果逐段对齐）。deep_translator把文本放在URL参数中发送，
+# 百分号编码后长度约为UTF-8字节数的3倍，按编码后的长度限制，整个URL不超过常见的8KB上限
+# （编码后的长度不小于UTF-8字节数，同时满足百度每个请求不超过6000字节的要求）
+BAIDU_ADAPTER = BatchAdapter("\n", max_length=6000, measure=url_encoded_length, native=True)
+# MyMemory每个请求必须少于500个字符，用换行符合并多段文本
+MYMEMORY_ADAPTER = BatchAdapter("\n", max_length=499, native=True)
+# Google每个请求必须少于5000个字符
+GOOGLE_ADAPTER = BatchAdapter(" ||| ", max_length=4999)
+# DeepSeek按提示词中约定的分隔符合并，批次大小由token估算决定
+DEEPSEEK_ADAPTER = BatchAdapter(DEEPSEEK_SEPARATOR, alternates=["[SEP]", " [sep] ", "[sep]", " ; ", ";", "。", ". "])
+DEFAULT_ADAPTER = BatchAdapter(" ||| ")
+
+def batch_adapter(translator):
+    """翻译器对应的批量翻译方式"""
+    if isinstance(translator, DeepSeekTranslator):
+        return DEEPSEEK_ADAPTER
+    if isinstance(translator, BaiduTranslator):
+        return BAIDU_ADAPTER
+    if isinstance(translator, MyMemoryTranslator):
+        return MYMEMORY_ADAPTER
+    if isinstance(translator, GoogleTranslator):
+        return GOOGLE_ADAPTER
+    return DEFAULT_ADAPTER
+
+# 拆分超长文本时的句子结束位置
+SENTENCE_END_PATTERN = re.compile(r'(?<=[。！？；.!?;\n])')
+
+def split_long_text(text, max_length, measure=len):
+    """把超过长度上限的文本按句子拆成多段，单个句子仍然超长时按长度硬切"""
+    chunks = []
+    current = ''
+    for piece in SENTENCE_END_PATTERN.split(text):
+        while measure(piece) > max_length:
+            cut = max_length
+            while measure(piece[:cut]) > max_length:
+                cut = max(1, cut * 9 // 10)
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(piece[:cut])
+            piece = piece[cut:]
+        if current and measure(current + piece) > max_length:
+            chunks.append(current)
+            current = ''
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def translate_single(translator, text):
+    """
+    翻译一段文本；超过翻译器长度上限的文本按句子拆开分别翻译再拼接
+    """
+    adapter = batch_adapter(translator)
+    if not adapter.too_long(text):
+        return call_translator(translator, text)
+
+    chunks = split_long_text(text, adapter.max_length, adapter.measure)
+    parts = [call_translator(translator, chunk) for chunk in chunks]
+    # 译成中文时直接拼接，其他语言用空格连接
+    if 'zh' in str(getattr(translator, 'target', '')):
+        return ''.join(part.strip() for part in parts)
+    return ' '.join(part.strip() for part in parts)
+
+def translate_individually(translator, texts, delay=0):
+    """
+    逐个翻译文本，返回翻译成功的{原文: 译文}
+
+    熔断器打开后不再继续请求，剩余文本视为未翻译
+    """
+    translations = {}
+    for text in texts:
+        try:
+            translations[text] = translate_single(translator, text)
+        except CircuitOpenError:
+            break
+        except Exception as e:
+            print(f"翻译失败: {text[:30]}..., 错误: {str(e)}")
+        if delay > 0:
+            time.sleep(delay)
+    return translations
+
+def translate_group(translator, adapter, group):
+    """用一个请求翻译一组已按长度上限合并的文本，结果无法拆分时改为逐个翻译"""
+    if len(group) == 1:
+        return {group[0]: translate_single(translator, group[0])}
+
+    translated = call_translator(translator, adapter.separator.join(group))
+    translated_parts = adapter.split(translated, len(group))
+    if translated_parts is not None:
+        return dict(zip(group, translated_parts))
+
+    # 无法正确拆分，逐个翻译
+    print(f"\n批量拆分异常，切换为逐个翻译...")
+    return translate_individually(translator, group)
+
+def translate_text_batch(translator, batch):
+    """
+    合并翻译一个批次的文本，返回{原文: 译文}（未能翻译的文本不在其中）
+
+    按翻译器的批量翻译方式合并文本（超过长度上限时拆成多个请求），结果无法拆分时改为逐个翻译。
+    所有请求都出错时抛出第一个异常，由调用方决定如何处理；部分请求出错时只返回成功的部分。
+    """
+    adapter = batch_adapter(translator)
+    translations = {}
+    first_error = None
+    for group in adapter.pack(batch):
+        try:
+            translations.update(translate_group(translator, adapter, group))
+        except Exception as e:
+            first_error = first_error or e
+    if first_error is not None and not translations:
+        raise first_error
+    return translations
+
+# DeepSeek-V3（deepseek-chat）价格，美元/百万token；价格调整时修改这里
+DEEPSEEK_PRICING = {'cache_hit': 0.07, 'cache_miss': 0.27, 'output': 1.10}
+
+# DeepSeek按token装箱时每段的文本数：段内装箱，段与段之间保持先后顺序
+PACKING_WINDOW = 5000
+
+# --plan估算耗时用的单个请求耗时（秒），DeepSeek另加生成输出token的时间
+PLAN_REQUEST_SECONDS = {'DeepSeekTranslator': 1.0, 'BaiduTranslator': 0.5, 'GoogleTranslator': 0.5,
+                        'MyMemoryTranslator': 1.0}
+PLAN_DEEPSEEK_TOKENS_PER_SECOND = 40
+# 百度通用文本翻译超出免费额度后的价格，元/百万字符；价格调整时修改这里
+BAIDU_PRICE_PER_MILLION_CHARS = 49
+
+def load_glossary(path):
+    """
+    读取术语表CSV文件：每行两列，第一列为中文，第二列为英文（有表头“中文,英文”时自动跳过）
+
+    返回:
+    [(中文, 英文)]列表
+    """
+    glossary = []
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip() or not row[1].strip():
+                continue
+            if not glossary and row[0].strip() == '中文':
+                continue
+            glossary.append((row[0].strip(), row[1].strip()))
+    return glossary
+
+def build_deepseek_system_prompt(source, target, glossary=None):
+    """
+    构建DeepSeek的系统提示词：翻译要求、分批格式说明和术语表
+
+    提示词只取决于翻译方向和术语表，术语按原文排序，保证同样的设置总是得到逐字节相同的前缀。
+    """
+    source_lang = "中文" if "zh" in source else "英文"
+    target_lang = "英文" if "en" in target else "中文"
+    lines = [
+        f"你是一个专业翻译助手。请将用户发送的{source_lang}文本翻译成{target_lang}，只返回翻译结果，不要有任何解释或额外文字。",
+        "格式要求：",
+        f"1. 用户发送的内容可能包含多段文本，各段之间用“{DEEPSEEK_SEPARATOR.strip()}”分隔。请逐段翻译，"
+        f"保持段落的顺序和数量不变，译文各段之间同样用“{DEEPSEEK_SEPARATOR.strip()}”分隔。",
+        "2. 不要翻译或改动分隔符，不要合并或拆分段落。",
+        "3. 数字、代码、型号、网址和邮箱保持原样。",
+        f"4. 原文中已经是{target_lang}的内容保持原样。",
+    ]
+    if glossary:
+        # 术语表按中文→英文给出，英文→中文时反过来使用
+        pairs = glossary if "zh" in source else [(en, zh) for zh, en in glossary]
+        lines.append("术语表（遇到以下术语时必须使用对应译法）：")
+        lines.extend(f"{src} => {dst}" for src, dst in sorted(set(pairs)))
+    return "\n".join(lines)
+
+def deepseek_cost(usage):
+    """按DEEPSEEK_PRICING估算费用（美元）；API没有返回缓存命中数据时输入token全部按未命中计算"""
+    hit = usage.get('prompt_cache_hit_tokens', 0)
+    miss = usage.get('prompt_cache_miss_tokens', 0)
+    if not hit and not miss:
+        miss = usage.get('prompt_tokens', 0)
+    return (hit * DEEPSEEK_PRICING['cache_hit'] + miss * DEEPSEEK_PRICING['cache_miss']
+            + usage.get('completion_tokens', 0) * DEEPSEEK_PRICING['output']) / 1_000_000
+
+def usage_delta(translator, before):
+    """DeepSeek翻译器从before快照到现在的用量"""
+    return {key: value - before.get(key, 0) for key, value in translator.usage_snapshot().items()}
+
+def all_deepseek_translators(translators):
+    """translators字典（两个翻译方向）中所有不重复的DeepSeek翻译器"""
+    unique = {}
+    for direction_translator in translators.values():
+        for deepseek in deepseek_translators(direction_translator):
+            unique[id(deepseek)] = deepseek
+    return list(unique.values())
+
+def print_run_usage(translators, usage_before):
+    """输出本次运行所有DeepSeek翻译器合计的token用量、缓存命中率和估算费用"""
+    total = defaultdict(int)
+    for deepseek in all_deepseek_translators(translators):
+        for key, value in usage_delta(deepseek, usage_before.get(id(deepseek), {})).items():
+            total[key] += value
+    if not total.get('requests'):
+        return
+    hit = total['prompt_cache_hit_tokens']
+    prompt = total['prompt_tokens']
+    hit_rate = f"，缓存命中 {hit}（{hit / prompt:.1%}）" if prompt else ""
+    print(f"- DeepSeek: {total['requests']} 个请求，输入 {prompt} token{hit_rate}，"
+          f"输出 {total['completion_tokens']} token，估算费用 ${deepseek_cost(total):.4f}")
+
+def snapshot_usage(translators):
+    """记录所有DeepSeek翻译器当前的用量，用于统计本次运行的用量"""
+    return {id(deepseek): deepseek.usage_snapshot() for deepseek in all_deepseek_translators(translators)}
+
+def estimate_tokens(text):
+    """估算文本的token数：中日韩字符和其他字符按不同比例换算"""
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count * CJK_TOKENS_PER_CHAR + (len(text) - cjk_count) * OTHER_TOKENS_PER_CHAR
+
+def estimate_output_tokens(input_tokens, target):
+    """按目标语言估算译文的token数"""
+    ratio = OUTPUT_TOKEN_RATIO['en'] if 'en' in target else OUTPUT_TOKEN_RATIO['zh']
+    return input_tokens * ratio
+
+def deepseek_text_tokens(translator, text):
+    """文本在DeepSeek批次中占用的token数：输入和估算输出取较大者，包含分隔符"""
+    input_tokens = estimate_tokens(text) + estimate_tokens(DEEPSEEK_SEPARATOR)
+    return max(input_tokens, estimate_output_tokens(input_tokens, translator.target))
+
+def first_fit_decreasing(items, weights, capacity):
+    """
+    首次适应递减装箱：按权重从大到小把每个元素放入第一个放得下的箱子，尽量减少箱子数
+
+    用线段树维护各箱子剩余容量的最大值，每次查找第一个放得下的箱子只需O(log n)。
+    权重超过容量的元素单独成箱。
+
+    返回:
+    箱子列表，每个箱子是元素列表
+    """
+    order = sorted(range(len(items)), key=lambda i: weights[i], reverse=True)
+    bins = [[items[i]] for i in order if weights[i] > capacity]
+    order = [i for i in order if weights[i] <= capacity]
+    if not order:
+        return bins
+
+    size = 1
+    while size < len(order):
+        size *= 2
+    # 叶子节点为各箱子的剩余容量（未使用的箱子为满容量），内部节点为子树的最大值
+    tree = [capacity] * (2 * size)
+    packed = []
+    for i in order:
+        weight = weights[i]
+        node = 1
+        while node < size:
+            node = 2 * node if tree[2 * node] >= weight else 2 * node + 1
+        leaf = node - size
+        if leaf == len(packed):
+            packed.append([])
+        packed[leaf].append(items[i])
+        tree[node] -= weight
+        node //= 2
+        while node:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node //= 2
+    return bins + packed
+
+def make_batches(translator, texts, batch_size=10):
+    """
+    将文本分批：DeepSeek按估算的token数装箱，原生支持批量翻译的翻译器（百度、MyMemory）按请求长度上限合并，
+    其他翻译器按固定数量分批
+    """
+    adapter = batch_adapter(translator)
+    if adapter.native:
+        return adapter.pack(texts)
+    if not isinstance(translator, DeepSeekTranslator):
+        return [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+
+    # 中文和英文的token换算差别很大，按估算的token数而不是字符数装箱，减少请求数
+    # 分段装箱，保持文本的大致顺序（batch_translate按出现次数从多到少排列文本）
+    weights = [deepseek_text_tokens(translator, text) for text in texts]
+    batches = []
+    for i in range(0, len(texts), PACKING_WINDOW):
+        batches.extend(first_fit_decreasing(texts[i:i+PACKING_WINDOW], weights[i:i+PACKING_WINDOW],
+                                            DEEPSEEK_MAX_BATCH_TOKENS))
+    return batches
+
+def split_batches(translator, texts, batch_size=10):
+    """
+    translate_unique_texts使用的分批方式：ProviderPool按固定数量分批（由调度器按各服务的容量合并），
+    单个翻译器见make_batches
+    """
+    if isinstance(translator, ProviderPool):
+        return [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+    return make_batches(translator, texts, batch_size)
+
+def deepseek_translators(translator):
+    """translator（单个翻译器或ProviderPool）中的DeepSeek翻译器"""
+    if isinstance(translator, ProviderPool):
+        return [p.translator for p in translator.providers if isinstance(p.translator, DeepSeekTranslator)]
+    return [translator] if isinstance(translator, DeepSeekTranslator) else []
+
+def print_token_usage(translator, usage_before):
+    """输出本次翻译DeepSeek的估算token数和API返回的实际token数"""
+    for deepseek in deepseek_translators(translator):
+        usage = usage_delta(deepseek, usage_before.get(id(deepseek), {}))
+        if not usage.get('requests'):
+            continue
+        print(f"DeepSeek token用量（{usage['requests']} 个请求）: "
+              f"输入 估算 {usage['estimated_prompt_tokens']:.0f} / 实际 {usage['prompt_tokens']}"
+              f"（缓存命中 {usage['prompt_cache_hit_tokens']}，未命中 {usage['prompt_cache_miss_tokens']}），"
+              f"输出 估算 {usage['estimated_completion_tokens']:.0f} / 实际 {usage['completion_tokens']}，"
+              f"估算费用 ${deepseek_cost(usage):.4f}")
+        if usage['estimated_completion_tokens']:
+            print(f"输出token 实际/估算 = {usage['completion_tokens'] / usage['estimated_completion_tokens']:.2f}"
+                  f"（可据此调整OUTPUT_TOKEN_RATIO）")
+
+class TranslationBudget:
+    """
+    翻译预算：单元格覆盖率目标、时间上限（秒）、DeepSeek估算费用上限（美元）和唯一文本数上限，为None的条件不限制
+
+    任一条件达到后不再发出新的批次，已经发出的请求照常完成，没有翻译的文本对应单元格留空。
+    时间和费用从第一次翻译开始计算，覆盖率和唯一文本数按每个翻译方向分别计算。
+    """
+
+    def __init__(self, coverage=None, seconds=None, cost=None, max_texts=None):
+        self.coverage = coverage
+        self.seconds = seconds
+        self.cost = cost
+        self.max_texts = max_texts
+        self.start_time = None
+        # 达到预算的原因，未达到时为None
+        self.reason = None
+        # 因预算没有翻译的唯一文本数（所有方向合计）
+        self.skipped_texts = 0
+        self._usage_before = {}
+        self._deepseeks = []
+
+    def watch(self, translator):
+        """开始统计翻译器（单个翻译器或ProviderPool）的费用"""
+        if self.start_time is None:
+            self.start_time = time.time()
+        for deepseek in deepseek_translators(translator):
+            if id(deepseek) not in self._usage_before:
+                self._usage_before[id(deepseek)] = deepseek.usage_snapshot()
+                self._deepseeks.append(deepseek)
+
+    def spent(self):
+        """已花费的DeepSeek估算费用（美元）"""
+        return sum(deepseek_cost(usage_delta(d, self._usage_before[id(d)])) for d in self._deepseeks)
+
+    def stop_reason(self, coverage):
+        """停止翻译的原因（用于输出），coverage为当前方向的单元格覆盖率"""
+        if self.reason is not None:
+            return self.reason
+        if self.coverage is not None and coverage >= self.coverage:
+            return f"单元格覆盖率达到 {self.coverage:.0%}"
+        return f"只翻译出现次数最多的 {self.max_texts} 个文本"
+
+    def exhausted(self, coverage):
+        """coverage为当前方向的单元格覆盖率；达到任一预算时返回True"""
+        if self.reason is not None:
+            return True
+        if self.coverage is not None and coverage >= self.coverage:
+            # 覆盖率只对当前方向有效，下一个方向重新计算
+            return True
+        if self.seconds is not None and self.start_time is not None and time.time() - self.start_time >= self.seconds:
+            self.reason = f"达到时间上限 {self.seconds:.0f} 秒"
+        elif self.cost is not None and self.spent() >= self.cost:
+            self.reason = f"达到费用上限 ${self.cost:.2f}"
+        return self.reason is not None
+
+class CoverageTracker:
+    """
+    统计翻译进度：已翻译的唯一文本比例和它们覆盖的单元格比例
+
+    counts为{文本: 出现的单元格数}。文本按出现次数从多到少翻译时，单元格覆盖率比唯一文本比例增长快得多。
+    """
+
+    def __init__(self, counts, budget=None):
+        self.counts = counts
+        self.budget = budget
+        self.total_cells = sum(counts.values())
+        self.total_texts = len(counts)
+        self.covered_cells = 0
+        self.done_texts = 0
+        # 因预算用完而没有翻译的文本
+        self.skipped = []
+        self._lock = threading.Lock()
+
+    def record(self, texts):
+        """记录已翻译的文本"""
+        with self._lock:
+            self.done_texts += len(texts)
+            self.covered_cells += sum(self.counts.get(text, 0) for text in texts)
+
+    def coverage(self):
+        return self.covered_cells / self.total_cells if self.total_cells else 1.0
+
+    def postfix(self):
+        texts = self.done_texts / self.total_texts if self.total_texts else 1.0
+        return f"单元格覆盖 {self.coverage():.1%}，唯一文本 {texts:.1%}"
+
+    def should_stop(self):
+        if translate_scheduler.cancellation.requested():
+            return True
+        return self.budget is not None and self.budget.exhausted(self.coverage())
+
+    def skip(self, texts):
+        with self._lock:
+            self.skipped.extend(texts)
+
+def print_partial_summary(budget=None):
+    """取消或预算用完时在结果总结中说明输出的是部分结果"""
+    if translate_scheduler.cancellation.requested():
+        print('- 部分结果：翻译已取消，已完成的译文都已写入，其余单元格留空，可以用--retry-failed继续翻译')
+    elif budget is not None and budget.skipped_texts:
+        print(f'- 部分结果：{budget.skipped_texts} 个唯一文本因预算没有翻译，对应单元格留空，'
+              f'可以用--retry-failed或--incremental继续翻译剩下的单元格')
+
+def translate_batches(translator, batches, delay=1, desc="批次进度", tracker=None):
+    """
+    依次翻译各批次
+
+    熔断器打开期间暂停发送，等熔断器允许探测时，下一个批次作为探测请求发出：成功则继续翻译，
+    失败则熔断器重新打开，再次等待。只有取消或预算用完时才停止。
+    tracker为CoverageTracker时显示单元格覆盖率，预算用完或取消后剩下的批次交给tracker.skip()；
+    没有tracker时取消后剩下的批次记为未翻译。
+
+    返回:
+    (翻译结果{原文: 译文}, 未能翻译的文本列表)
+    """
     translation_cache = {}
-    results = []
-    
-    # 检查翻译器类型，为不同翻译器采用不同策略
+    failed = []
+    breaker = breaker_for(translator)
+    # 设置了速率的翻译器由限速器控制请求间隔，不再固定等待
+    if limiter_for(translator).max_rate:
+        delay = 0
     is_deepseek = isinstance(translator, DeepSeekTranslator)
-    
-    # 如果是DeepSeek-V3，使用更高效的批处理方式
-    if is_deepseek:
-        # DeepSeek可以处理更大的文本，合并更多文本减少API调用
-        max_chars = 3500  # 设置每批次最大字符数
-        current_batch = []
-        current_char_count = 0
-        
-        print("使用DeepSeek-V3进行高效批量翻译...")
-        
-        # 基于字符计数而不是固定批次大小来分批
-        batches = []
-        for text in unique_texts:
-            text_len = len(text)
-            # 如果单条文本就超过限制，单独处理
-            if text_len > max_chars:
-                batches.append([text])
+
+    def should_stop():
+        if tracker is not None:
+            return tracker.should_stop()
+        return translate_scheduler.cancellation.requested()
+
+    progress = tqdm(batches, desc=desc)
+    for i, batch in enumerate(progress):
+        # 熔断期间暂停，分段等待以便及时响应取消和预算；熔断器允许探测后本批次即为探测请求
+        while not should_stop():
+            wait = breaker.retry_in()
+            if wait > 0:
+                time.sleep(min(wait, 1))
                 continue
-                
-            # 如果添加当前文本会超出限制，创建新批次
-            if current_char_count + text_len + len(current_batch) * 5 > max_chars and current_batch:  # 5是分隔符长度
-                batches.append(current_batch)
-                current_batch = [text]
-                current_char_count = text_len
-            else:
-                current_batch.append(text)
-                current_char_count += text_len
-        
-        # 添加最后一个批次
-        if current_batch:
-            batches.append(current_batch)
-            
-        print(f"DeepSeek-V3批处理：将{len(unique_texts)}个文本分为{len(batches)}个批次翻译")
-        
-        for batch in tqdm(batches, desc="DeepSeek翻译进度"):
             try:
-                # 使用特殊分隔符合并文本
-                combined_text = " [SEP] ".join(batch)
-                translated = translator.translate(combined_text)
-                
-                # 尝试拆分翻译结果
-                translated_parts = translated.split(" [SEP] ")
-                
-                # 如果拆分结果与原文数量不符，尝试其他分隔方式
-                if len(translated_parts) != len(batch):
-                    # 尝试识别分隔符的其他可能变体
-                    possible_seps = [" [SEP] ", "[SEP]", " [sep] ", "[sep]", " ; ", ";", "。", ". "]
-                    for sep in possible_seps:
-                        translated_parts = translated.split(sep)
-                        if len(translated_parts) == len(batch):
-                            break
-                
-                # 如果仍然无法正确拆分，逐个翻译
-                if len(translated_parts) != len(batch):
-                    print(f"\n批量拆分异常，切换为逐个翻译...")
-                    for text in batch:
-                        trans = translator.translate(text)
-                        translation_cache[text] = trans
+                if translate_scheduler.hedger is not None:
+                    translation_cache.update(translate_scheduler.hedger.call(translate_text_batch, translator, batch))
                 else:
-                    # 缓存翻译结果
-                    for i, text in enumerate(batch):
-                        if i < len(translated_parts):
-                            translation_cache[text] = translated_parts[i]
-                        else:
-                            # 处理索引越界情况
-                            translation_cache[text] = text
-                            
-                # DeepSeek API可能有速率限制，添加短暂延迟
-                if delay > 0:
-                    time.sleep(delay)
-                    
+                    translation_cache.update(translate_text_batch(translator, batch))
+            except CircuitOpenError:
+                # 请求没有发出（探测失败后熔断器重新打开），等待后重新发送本批次
+                continue
             except Exception as e:
                 print(f"\n批次翻译失败: {str(e)}，切换为逐个翻译...")
-                for text in batch:
-                    try:
-                        trans = translator.translate(text)
-                        translation_cache[text] = trans
-                        time.sleep(0.5)  # 单条翻译添加更短的延迟
-                    except Exception as e:
-                        print(f"单条翻译失败: {text[:30]}..., 错误: {str(e)}")
-                        translation_cache[text] = text  # 失败时用原文
-    else:
-        # 将文本分批处理
-        batches = [unique_texts[i:i+batch_size] for i in range(0, len(unique_texts), batch_size)]
+                # 单条翻译添加更短的延迟
+                translation_cache.update(translate_individually(translator, batch, 0.5 if is_deepseek else 0))
+            break
+        else:
+            # 取消或预算用完，本批次和剩下的批次都不再发送
+            rest = [text for rest in batches[i:] for text in rest]
+            if tracker is not None:
+                tracker.skip(rest)
+            else:
+                failed.extend(rest)
+            break
+        failed.extend(text for text in batch if text not in translation_cache)
+        if tracker is not None:
+            tracker.record([text for text in batch if text in translation_cache])
+            progress.set_postfix_str(tracker.postfix())
+
+        # 批次之间添加延迟，避免API限制
+        if i < len(batches) - 1 and delay > 0:
+            time.sleep(delay)
+    progress.close()
+
+    return translation_cache, failed
+
+def translate_batch_or_individually(translator, batch):
+    """翻译一个批次，整批失败时改为逐个翻译（熔断时直接抛出，由调度器处理）"""
+    try:
+        return translate_text_batch(translator, batch)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        tqdm.write(f"批次翻译失败: {str(e)}，切换为逐个翻译...")
+        return translate_individually(translator, batch, 0.5 if isinstance(translator, DeepSeekTranslator) else 0)
+
+def translate_unique_texts(translator, unique_texts, batch_size=10, delay=1, workers=1, tracker=None):
+    """
+    翻译去重后的文本（按顺序分批发送），返回(翻译结果, 未能翻译的文本列表)
+
+    translator可以是单个翻译器，也可以是ProviderPool（同时使用多个翻译服务，各服务的并发数在创建时指定）。
+    单个翻译器且workers大于1时，由workers个线程并发发送批量请求，请求速率仍受限速器控制。
+    tracker见translate_batches。
+    """
+    if isinstance(translator, ProviderPool):
+        # 多个翻译服务从共享队列中按各自速率取批次
+        print(f"同时使用 {', '.join(translator.names)} 翻译...")
+        start_time = time.time()
+        batches = split_batches(translator, unique_texts, batch_size)
+        scheduler = BatchScheduler(translator, translate_text_batch, tracker=tracker)
+        translation_cache, failed = scheduler.run(batches)
+        scheduler.print_stats(time.time() - start_time)
+        return translation_cache, failed
+
+    is_deepseek = isinstance(translator, DeepSeekTranslator)
+    batches = split_batches(translator, unique_texts, batch_size)
+    desc = "DeepSeek翻译进度" if is_deepseek else "批次进度"
+    if is_deepseek:
+        print("使用DeepSeek-V3进行高效批量翻译...")
+        print(f"DeepSeek-V3批处理：将{len(unique_texts)}个文本分为{len(batches)}个批次翻译")
+    if workers > 1 and len(batches) > 1:
+        # 多个线程从同一队列取批次，结果按原文汇总
+        start_time = time.time()
+        provider = Provider(type(translator).__name__, translator, workers=min(workers, len(batches)))
+        scheduler = BatchScheduler(ProviderPool([provider]), translate_batch_or_individually, desc=desc,
+                                   tracker=tracker)
+        translation_cache, failed = scheduler.run(batches)
+        scheduler.print_stats(time.time() - start_time)
+        return translation_cache, failed
+    return translate_batches(translator, batches, delay, desc, tracker)
+
+def wait_for_breakers(translator):
+    """等待翻译器的熔断器允许探测请求（最多等待一个熔断周期）"""
+    providers = translator.providers if isinstance(translator, ProviderPool) else None
+    breakers = [p.breaker for p in providers] if providers else [breaker_for(translator)]
+    wait = min(b.retry_in() for b in breakers)
+    if wait > 0:
+        print(f"等待 {wait:.0f} 秒后重试...")
+        time.sleep(wait)
+
+def order_by_frequency(texts, counts=None):
+    """
+    去重并按出现次数从多到少排列（次数相同时保持原顺序）
+
+    返回:
+    (Counter{文本: 出现次数}, 唯一文本列表)
+    """
+    text_counts = Counter(texts) if counts is None else Counter(dict(zip(texts, counts)))
+    return text_counts, [text for text, _ in text_counts.most_common()]
+
+# 批量翻译函数
+def batch_translate(translator, texts, batch_size=10, delay=1, failed_texts=None, workers=1, memory=None,
+                    counts=None, budget=None, skipped_texts=None):
+    """
+    批量翻译文本，减少API调用次数
+
+    translator可以是单个翻译器，也可以是ProviderPool（同时使用多个翻译服务）。
+    workers为单个翻译器同时进行的批量请求数。
+    memory为翻译记忆（支持get和update的映射，如dict），其中已有的文本不再翻译，新的翻译结果写入其中。
+    唯一文本按出现的单元格数从多到少翻译，进度条同时显示单元格覆盖率；counts为与texts对应的出现次数
+    （texts已去重时由调用方提供），为None时按texts中的重复次数统计。
+    budget为TranslationBudget，用完时停止翻译，剩下的文本在结果中为None（部分结果）；
+    取消（Ctrl-C）时同样停止翻译，已完成的译文照常返回。因预算或取消没有翻译的文本加入skipped_texts集合（如果提供）。
+    未能翻译的文本不会用原文代替：它们在所有批次完成后重试一次，仍然失败的在结果中为None，
+    并加入failed_texts集合（如果提供）。
+    """
+    if not texts:
+        return []
         
-        for i, batch in enumerate(tqdm(batches, desc="批次进度")):
-            try:
-                # 将多个文本合并为一个长文本，用特殊分隔符隔开
-                combined_text = " ||| ".join(batch)
-                
-                # 翻译合并后的文本
-                translated = translator.translate(combined_text)
-                
-                # 根据同样的分隔符拆分翻译结果
-                translated_parts = translated.split(" ||| ")
-                
-                # 如果翻译结果数量与原文本不符，则逐个翻译
-                if len(translated_parts) != len(batch):
-                    print(f"\n批量翻译结果异常，切换为逐个翻译...")
-                    for text in batch:
-                        try:
-                            trans = translator.translate(text)
-                            translation_cache[text] = trans
-                        except Exception as e:
-                            print(f"翻译失败: {text}, 错误: {str(e)}")
-                            translation_cache[text] = text  # 失败时用原文
-                else:
-                    # 缓存翻译结果
-                    for j, text in enumerate(batch):
-                        translation_cache[text] = translated_parts[j]
-                
-                # 批次之间添加延迟，避免API限制
-                if i < len(batches) - 1 and delay > 0:
-                    time.sleep(delay)
-                    
-            except Exception as e:
-                print(f"\n批次翻译失败，切换为逐个翻译...")
-                for text in batch:
-                    try:
-                        trans = translator.translate(text)
-                        translation_cache[text] = trans
-                    except Exception as e:
-                        print(f"翻译失败: {text}, 错误: {str(e)}")
-                        translation_cache[text] = text  # 失败时用原文
+    # 去重以减少翻译量，出现次数多的文本先翻译
+    text_counts, unique_texts = order_by_frequency(texts, counts)
+    cell_count = sum(text_counts.values())
+    print(f"需要翻译 {cell_count} 个单元格，去重后 {len(unique_texts)} 个唯一文本")
+    usage_before = {id(t): t.usage_snapshot() for t in deepseek_translators(translator)}
+    if budget is not None:
+        budget.watch(translator)
+    
+    remembered = {}
+    if memory is not None:
+        for text in unique_texts:
+            translation = memory.get(text)
+            if translation is not None:
+                remembered[text] = translation
+        if remembered:
+            unique_texts = [text for text in unique_texts if text not in remembered]
+            print(f"翻译记忆命中 {len(remembered)} 个文本，需要翻译 {len(unique_texts)} 个")
+    
+    tracker = CoverageTracker(text_counts, budget)
+    tracker.record(remembered)
+    if budget is not None and budget.max_texts is not None and len(unique_texts) > budget.max_texts:
+        # 只翻译出现次数最多的max_texts个文本
+        tracker.skip(unique_texts[budget.max_texts:])
+        unique_texts = unique_texts[:budget.max_texts]
+    translation_cache, failed = translate_unique_texts(translator, unique_texts, batch_size, delay, workers,
+                                                       tracker) if unique_texts else ({}, [])
+
+    if tracker.skipped:
+        # 没有预算时只有取消会跳过文本
+        reason = "已取消"
+        if budget is not None:
+            budget.skipped_texts += len(tracker.skipped)
+            if not translate_scheduler.cancellation.requested():
+                reason = budget.stop_reason(tracker.coverage())
+        if skipped_texts is not None:
+            skipped_texts.update(tracker.skipped)
+        print(f"\n{reason}，停止翻译：单元格覆盖率 {tracker.coverage():.1%}，"
+              f"{len(tracker.skipped)} 个唯一文本没有翻译，对应单元格留空（部分结果）")
+    # 未能翻译的文本排队重试一次（预算已用完或已取消时不再重试）
+    if failed and tracker.should_stop():
+        print(f"\n{len(failed)} 个文本未能翻译，{'已取消' if translate_scheduler.cancellation.requested() else '预算已用完'}，不再重试")
+    elif failed:
+        print(f"\n{len(failed)} 个文本未能翻译，所有批次完成后重试...")
+        wait_for_breakers(translator)
+        retried, failed = translate_unique_texts(translator, failed, batch_size, delay, workers)
+        translation_cache.update(retried)
+        tracker.record(retried)
+    if failed:
+        print(f"\n仍有 {len(failed)} 个文本未能翻译，对应单元格留空")
+        if failed_texts is not None:
+            failed_texts.update(failed)
+    if budget is not None:
+        print(f"翻译进度：{tracker.postfix()}（{tracker.covered_cells}/{tracker.total_cells} 个单元格）")
+    if memory is not None:
+        memory.update(translation_cache)
+        translation_cache.update(remembered)
+    if translate_scheduler.hedger is not None:
+        translate_scheduler.hedger.print_stats()
+    print_token_usage(translator, usage_before)
     
     # 根据原始顺序返回翻译结果
-    for text in texts:
-        results.append(translation_cache.get(text, text))
-    
-    return results
+    return [translation_cache.get(text) for text in texts]
 
 def display_header():
     """显示应用程序标题"""
@@ -284,120 +858,208 @@ def load_config():
     
     return config
 
+# 各翻译API的名称和默认速率上限（每秒请求数）；收到限流响应时自动降速，之后逐步恢复
+API_NAMES = {1: 'MyMemory', 2: 'Google', 3: '百度', 4: 'DeepSeek-V3'}
+API_RATE_LIMITS = {1: 2.0, 2: 5.0, 3: 1.0, 4: 10.0}
+
+def parse_api_choices(api_input):
+    """解析API选择，如 '4,1' 返回 [4, 1]（去重并保持顺序）"""
+    choices = []
+    for part in api_input.replace('，', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if not part.isdigit() or int(part) not in API_NAMES:
+            raise ValueError(f"无效的API选择 '{part}'，可选值为1-4")
+        if int(part) not in choices:
+            choices.append(int(part))
+    if not choices:
+        raise ValueError("请至少选择一个翻译API")
+    return choices
+
+def parse_api_rates(rate_input):
+    """解析各API的速率设置，如 '4=5,3=1' 返回 {4: 5.0, 3: 1.0}"""
+    rates = {}
+    if not rate_input:
+        return rates
+    for part in rate_input.replace('，', ',').split(','):
+        if not part.strip():
+            continue
+        api, sep, rate = part.partition('=')
+        try:
+            api_choice = int(api.strip())
+            rates[api_choice] = float(rate)
+        except ValueError:
+            raise ValueError(f"无效的速率设置 '{part}'，格式应为 API编号=每秒请求数，如 4=5")
+        if not sep or api_choice not in API_NAMES or rates[api_choice] <= 0:
+            raise ValueError(f"无效的速率设置 '{part}'，格式应为 API编号=每秒请求数，如 4=5")
+    return rates
+
+def combine_translators(translator_pairs, rates=None, workers=1):
+    """
+    将多个API的翻译器组合为ProviderPool，返回与单个API相同结构的translators字典
+
+    参数:
+    translator_pairs: [(API编号, {'zh_to_en': 翻译器, 'en_to_zh': 翻译器})]
+    rates: {API编号: 每秒请求数}，覆盖默认速率
+    workers: 每个API同时进行的请求数
+    """
+    rates = {**API_RATE_LIMITS, **(rates or {})}
+    if len(translator_pairs) == 1:
+        api_choice, translators = translator_pairs[0]
+        for translator in translators.values():
+            limiter_for(translator).set_rate(rates[api_choice])
+        return translators
+
+    translators = {}
+    for direction in ('zh_to_en', 'en_to_zh'):
+        providers = []
+        for api_choice, pair in translator_pairs:
+            translator = pair[direction]
+            if isinstance(translator, DeepSeekTranslator):
+                # DeepSeek按估算的token数一次合并多个批次
+                providers.append(Provider(
+                    API_NAMES[api_choice], translator, rates[api_choice], DEEPSEEK_MAX_BATCH_TOKENS,
+                    lambda texts, t=translator: sum(deepseek_text_tokens(t, text) for text in texts),
+                    workers
+                ))
+            elif batch_adapter(translator).native:
+                # 百度、MyMemory按请求长度上限一次合并多个批次
+                adapter = batch_adapter(translator)
+                providers.append(Provider(API_NAMES[api_choice], translator, rates[api_choice],
+                                          adapter.max_length, adapter.length, workers))
+            else:
+                providers.append(Provider(API_NAMES[api_choice], translator, rates[api_choice], workers=workers))
+        translators[direction] = ProviderPool(providers)
+    return translators
+
+def prompt_translator_pair(api_choice, config):
+    """交互式创建一个API的两个方向的翻译器，初始化失败时返回None"""
+    translators = {}
+
+    if api_choice == 1:  # MyMemory翻译
+        # MyMemory对于中文使用"zh-CN"，对于英文使用"en-GB"
+        translators['zh_to_en'] = MyMemoryTranslator(source='zh-CN', target='en-GB')
+        translators['en_to_zh'] = MyMemoryTranslator(source='en-GB', target='zh-CN')
+        return translators
+
+    elif api_choice == 2:  # Google翻译
+        translators['zh_to_en'] = GoogleTranslator(source='zh-CN', target='en')
+        translators['en_to_zh'] = GoogleTranslator(source='en', target='zh-CN')
+        return translators
+
+    elif api_choice == 3:  # 百度翻译
+        # 尝试从配置中获取，如果没有则提示输入
+        baidu_appid = config['baidu_appid']
+        baidu_key = config['baidu_key']
+
+        if not baidu_appid:
+            baidu_appid = input("请输入百度翻译API的APP ID: ")
+        else:
+            print(f"使用配置中的百度翻译APP ID: {baidu_appid[:4]}***")
+            override = input("是否使用其他APP ID？(y/n，默认n): ").strip().lower()
+            if override == 'y':
+                baidu_appid = input("请输入百度翻译API的APP ID: ")
+
+        if not baidu_key:
+            baidu_key = input("请输入百度翻译API的密钥: ")
+        else:
+            print(f"使用配置中的百度翻译密钥: {baidu_key[:4]}***")
+            override = input("是否使用其他密钥？(y/n，默认n): ").strip().lower()
+            if override == 'y':
+                baidu_key = input("请输入百度翻译API的密钥: ")
+
+        try:
+            translators['zh_to_en'] = BaiduTranslator(
+                appid=baidu_appid,
+                appkey=baidu_key,
+                source='zh', 
+                target='en'
+            )
+            translators['en_to_zh'] = BaiduTranslator(
+                appid=baidu_appid,
+                appkey=baidu_key,
+                source='en',
+                target='zh'
+            )
+            return translators
+        except Exception as e:
+            print(f"初始化百度翻译API失败: {e}")
+            return None
+    elif api_choice == 4:  # DeepSeek-V3
+        # 尝试从配置中获取，如果没有则提示输入
+        deepseek_key = config['deepseek_key']
+        deepseek_url = config['deepseek_url']
+
+        if not deepseek_key:
+            deepseek_key = input("请输入 DeepSeek-V3 API 密钥: ")
+        else:
+            print(f"使用配置中的DeepSeek-V3密钥: {deepseek_key[:4]}***")
+            override = input("是否使用其他密钥？(y/n，默认n): ").strip().lower()
+            if override == 'y':
+                deepseek_key = input("请输入 DeepSeek-V3 API 密钥: ")
+
+        if not deepseek_url:
+            custom_api_url = input("请输入 API URL (回车使用默认): ").strip()
+            deepseek_url = custom_api_url if custom_api_url else None
+        else:
+            print(f"使用配置中的DeepSeek-V3 URL: {deepseek_url}")
+            override = input("是否使用其他URL？(y/n，默认n): ").strip().lower()
+            if override == 'y':
+                custom_api_url = input("请输入 API URL (回车使用默认): ").strip()
+                deepseek_url = custom_api_url if custom_api_url else deepseek_url
+
+        try:
+            translators['zh_to_en'] = DeepSeekTranslator(
+                source='zh-CN', 
+                target='en',
+                api_key=deepseek_key,
+                api_url=deepseek_url
+            )
+            translators['en_to_zh'] = DeepSeekTranslator(
+                source='en', 
+                target='zh-CN',
+                api_key=deepseek_key,
+                api_url=deepseek_url
+            )
+            return translators
+        except Exception as e:
+            print(f"初始化 DeepSeek-V3 API 失败: {e}")
+            return None
+
 def select_translator():
-    """交互式选择翻译API"""
+    """交互式选择翻译API，可以同时选择多个API"""
     print("\n请选择翻译API（某些地区无法使用Google翻译）:")
     print("1. MyMemory翻译 (免费，无需密钥，推荐首选)")
     print("2. Google翻译 (部分地区可能无法访问)")
     print("3. 百度翻译 (需要API ID和密钥)")
     print("4. DeepSeek-V3 (需要API密钥)")
+    print("输入多个编号（如 4,1）可同时使用多个API，按各自速率分担翻译任务")
 
-    translators = {}
-    
     # 加载配置文件和环境变量中的API密钥
     config = load_config()
     
     while True:
-        api_choice = input("请选择翻译API (1-4): ").strip()
-        
         try:
-            if api_choice == '1':  # MyMemory翻译
-                # MyMemory对于中文使用"zh-CN"，对于英文使用"en-GB"
-                translators['zh_to_en'] = MyMemoryTranslator(source='zh-CN', target='en-GB')
-                translators['en_to_zh'] = MyMemoryTranslator(source='en-GB', target='zh-CN')
-                break
-                
-            elif api_choice == '2':  # Google翻译
-                translators['zh_to_en'] = GoogleTranslator(source='zh-CN', target='en')
-                translators['en_to_zh'] = GoogleTranslator(source='en', target='zh-CN')
+            api_choices = parse_api_choices(input("请选择翻译API (1-4): ").strip())
+        except ValueError as e:
+            print(f"{e}，请重新输入")
+            continue
+
+        translator_pairs = []
+        for api_choice in api_choices:
+            try:
+                pair = prompt_translator_pair(api_choice, config)
+            except Exception as e:
+                print(f"初始化翻译API失败: {e}")
+                pair = None
+            if pair is None:
                 break
-                
-            elif api_choice == '3':  # 百度翻译
-                # 尝试从配置中获取，如果没有则提示输入
-                baidu_appid = config['baidu_appid']
-                baidu_key = config['baidu_key']
-                
-                if not baidu_appid:
-                    baidu_appid = input("请输入百度翻译API的APP ID: ")
-                else:
-                    print(f"使用配置中的百度翻译APP ID: {baidu_appid[:4]}***")
-                    override = input("是否使用其他APP ID？(y/n，默认n): ").strip().lower()
-                    if override == 'y':
-                        baidu_appid = input("请输入百度翻译API的APP ID: ")
-                        
-                if not baidu_key:
-                    baidu_key = input("请输入百度翻译API的密钥: ")
-                else:
-                    print(f"使用配置中的百度翻译密钥: {baidu_key[:4]}***")
-                    override = input("是否使用其他密钥？(y/n，默认n): ").strip().lower()
-                    if override == 'y':
-                        baidu_key = input("请输入百度翻译API的密钥: ")
-                
-                try:
-                    translators['zh_to_en'] = BaiduTranslator(
-                        appid=baidu_appid,
-                        appkey=baidu_key,
-                        source='zh', 
-                        target='en'
-                    )
-                    translators['en_to_zh'] = BaiduTranslator(
-                        appid=baidu_appid,
-                        appkey=baidu_key,
-                        source='en',
-                        target='zh'
-                    )
-                    break
-                except Exception as e:
-                    print(f"初始化百度翻译API失败: {e}")
-                    continue
-            elif api_choice == '4':  # DeepSeek-V3
-                # 尝试从配置中获取，如果没有则提示输入
-                deepseek_key = config['deepseek_key']
-                deepseek_url = config['deepseek_url']
-                
-                if not deepseek_key:
-                    deepseek_key = input("请输入 DeepSeek-V3 API 密钥: ")
-                else:
-                    print(f"使用配置中的DeepSeek-V3密钥: {deepseek_key[:4]}***")
-                    override = input("是否使用其他密钥？(y/n，默认n): ").strip().lower()
-                    if override == 'y':
-                        deepseek_key = input("请输入 DeepSeek-V3 API 密钥: ")
-                
-                if not deepseek_url:
-                    custom_api_url = input("请输入 API URL (回车使用默认): ").strip()
-                    deepseek_url = custom_api_url if custom_api_url else None
-                else:
-                    print(f"使用配置中的DeepSeek-V3 URL: {deepseek_url}")
-                    override = input("是否使用其他URL？(y/n，默认n): ").strip().lower()
-                    if override == 'y':
-                        custom_api_url = input("请输入 API URL (回车使用默认): ").strip()
-                        deepseek_url = custom_api_url if custom_api_url else deepseek_url
-                
-                try:
-                    translators['zh_to_en'] = DeepSeekTranslator(
-                        source='zh-CN', 
-                        target='en',
-                        api_key=deepseek_key,
-                        api_url=deepseek_url
-                    )
-                    translators['en_to_zh'] = DeepSeekTranslator(
-                        source='en', 
-                        target='zh-CN',
-                        api_key=deepseek_key,
-                        api_url=deepseek_url
-                    )
-                    break
-                except Exception as e:
-                    print(f"初始化 DeepSeek-V3 API 失败: {e}")
-                    continue
-            else:
-                print("无效选择，请重新输入")
-                
-        except Exception as e:
-            print(f"初始化翻译API失败: {e}")
-            print("请重新选择翻译API")
-    
-    return translators
+            translator_pairs.append((api_choice, pair))
+        else:
+            return combine_translators(translator_pairs)
+
+        print("请重新选择翻译API")
 
 def parse_column_input(column_input):
     """解析用户输入的列名，支持多种分隔符和格式"""
@@ -411,17 +1073,16 @@ def parse_column_input(column_input):
     columns = re.findall(r'[A-Za-z]', column_input)
     return [col.upper() for col in columns]
 
-def select_columns(wb):
+def select_columns(header_values):
     """交互式选择要翻译的列，支持多列选择"""
-    ws = wb.active
-    max_col = ws.max_column
+    max_col = len(header_values)
     
     # 显示表头信息
     print("\n文件中的列信息:")
     headers = {}
     for col_idx in range(1, max_col + 1):
         col_letter = index_to_column_letter(col_idx - 1)
-        header_value = ws.cell(row=1, column=col_idx).value
+        header_value = header_values[col_idx - 1]
         headers[col_letter] = header_value
         print(f"{col_letter}. {header_value}")
     
@@ -509,10 +1170,126 @@ def get_batch_size():
     
     return batch_size
 
-def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10):
-    """执行Excel文件翻译，支持多列翻译"""
+def load_previous_translations(output_path, column_suffixes, key_column=None):
+    """
+    读取上次生成的翻译结果，用于增量翻译
+
+    参数:
+    output_path: 上次生成的_translated文件
+    column_suffixes: {原列名: 翻译列后缀}，如 {'名称': '_en'}
+    key_column: 用于匹配行的键列名，为None时按原文内容匹配
+
+    返回:
+    {原列名: {匹配键: (原文, 译文)}}，上次没有翻译结果的单元格不包含在内
+    """
+    if not os.path.exists(output_path):
+        print(f"没有找到上次的翻译结果 {os.path.basename(output_path)}，将翻译全部单元格")
+        return {}
+    try:
+        previous_df = pd.read_excel(output_path)
+    except Exception as e:
+        print(f"读取上次的翻译结果失败（{e}），将翻译全部单元格")
+        return {}
+    if key_column is not None and key_column not in previous_df.columns:
+        print(f"上次的翻译结果中没有键列 '{key_column}'，改为按原文内容匹配")
+        key_column = None
+
+    previous = {}
+    for col, suffix in column_suffixes.items():
+        translated_col = f"{col}{suffix}"
+        if col not in previous_df.columns or translated_col not in previous_df.columns:
+            continue
+        sources = previous_df[col].tolist()[1:]
+        translations = previous_df[translated_col].tolist()[1:]
+        keys = previous_df[key_column].tolist()[1:] if key_column is not None else sources
+        entries = {}
+        for key, source, translation in zip(keys, sources, translations):
+            if isinstance(source, str) and isinstance(translation, str) and translation:
+                entries[key] = (source, translation)
+        previous[col] = entries
+    return previous
+
+def reuse_previous_translations(df, col, previous, store, key_column=None):
+    """
+    找出原文与上次相同的单元格，复用其译文；其余文本单元格加入store
+
+    返回:
+    (每行的文本编号数组，不需要翻译的行为NO_TEXT, {行号: 复用的译文})
+    """
+    values = df[col].tolist()
+    keys = df[key_column].tolist() if key_column is not None else values
+    ids = new_cell_ids()
+    reused = {}
+    # 跳过表头，只翻译内容
+    ids.append(NO_TEXT)
+    for i in range(1, len(values)):
+        val = values[i]
+        if not isinstance(val, str):
+            ids.append(NO_TEXT)
+            continue
+        entry = previous.get(keys[i]) if previous else None
+        if entry is not None and entry[0] == val:
+            reused[i] = entry[1]
+            ids.append(NO_TEXT)
+        else:
+            ids.append(store.add(val))
+    return ids, reused
+
+def collect_excel_texts(df, zh_to_en_columns, en_to_zh_columns, output_path, incremental=False, key_index=None):
+    """
+    收集DataFrame中需要翻译的文本，增量翻译时复用上次结果中原文没有变化的单元格
+
+    返回:
+    (stores, cell_ids, reused, cell_count) — stores为各方向的TextStore，cell_ids为{列名: 每行的文本编号数组}，
+    reused为{列名: {行号: 复用的译文}}，cell_count为各方向需要翻译的单元格数
+    """
+    # 增量翻译：读取上次的翻译结果
+    previous = {}
+    key_column = None
+    if incremental:
+        if key_index is not None:
+            key_column = df.columns[key_index]
+        print(f"\n增量翻译：读取上次的翻译结果 {os.path.basename(output_path)}"
+              f"（{'按' + str(key_column) + '列匹配行' if key_column is not None else '按原文内容匹配'}）...")
+        column_suffixes = {col: '_en' for col in zh_to_en_columns}
+        column_suffixes.update({col: '_zh' for col in en_to_zh_columns})
+        previous = load_previous_translations(output_path, column_suffixes, key_column)
+    
+    # 收集要翻译的文本，复用上次结果的单元格不再翻译
+    # 唯一文本存入TextStore，单元格只保存文本编号
+    print("正在收集需要翻译的文本...")
+    stores = {'zh_to_en': TextStore(), 'en_to_zh': TextStore()}
+    cell_ids = {}
+    reused = {}
+    cell_count = {'zh_to_en': 0, 'en_to_zh': 0}
+    for direction, columns in (('zh_to_en', zh_to_en_columns), ('en_to_zh', en_to_zh_columns)):
+        for col in columns:
+            cell_ids[col], reused[col] = reuse_previous_translations(df, col, previous.get(col), stores[direction],
+                                                                     key_column)
+            cell_count[direction] += sum(1 for text_id in cell_ids[col] if text_id != NO_TEXT)
+    
+    if incremental:
+        reused_count = sum(len(r) for r in reused.values())
+        total_count = reused_count + sum(cell_count.values())
+        changed = (total_count - reused_count) / total_count if total_count else 0
+        print(f"复用上次的译文 {reused_count} 个单元格，需要翻译 {total_count - reused_count} 个（{changed:.1%}）")
+    return stores, cell_ids, reused, cell_count
+
+def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10, workers=1,
+                         incremental=False, key_index=None, memory=None, budget=None):
+    """
+    执行Excel文件翻译，支持多列翻译
+
+    incremental为True时读取上次生成的_translated文件，原文没有变化的单元格直接复用上次的译文，
+    只翻译新增或修改的单元格。key_index指定按哪一列匹配行（如商品编号），为None时按原文内容匹配。
+    memory为各方向的翻译记忆 {'zh_to_en': ..., 'en_to_zh': ...}，见batch_translate。
+    budget为TranslationBudget，用完时输出部分结果，见batch_translate。
+    """
+    memory = memory or {}
     # 记录开始时间
     start_time = time.time()
+    usage_before = snapshot_usage(translators)
+    memory_profile.profiler.begin()
     
     # 自动生成输出文件名
     name, ext = os.path.splitext(os.path.basename(input_path))
@@ -523,16 +1300,16 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
     print(f"\n正在加载 {os.path.basename(input_path)}...")
     
     # 使用pandas读取Excel文件，而不是openpyxl，可以更方便地处理列的插入
-    df = pd.read_excel(input_path)
+    # 通过解析缓存读取，同一文件再次处理时无需重新解析xlsx
+    df = read_excel_cached(input_path)
     max_row, max_col = df.shape
+    memory_profile.profiler.stage("读取Excel")
     
     print(f"文件加载完成，共有 {max_row} 行，{max_col} 列")
     
     # 收集所有需要翻译的文本
     zh_to_en_columns = []
     en_to_zh_columns = []
-    zh_to_en_texts = []
-    en_to_zh_texts = []
     
     # 将索引转换为列名
     for idx in zh_to_en_indices:
@@ -541,17 +1318,9 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
     for idx in en_to_zh_indices:
         en_to_zh_columns.append(df.columns[idx])
     
-    # 收集要翻译的文本
-    print("正在收集需要翻译的文本...")
-    for col in zh_to_en_columns:
-        # 跳过表头，只翻译内容
-        texts = df[col].iloc[1:].dropna().astype(str).tolist()
-        zh_to_en_texts.extend(texts)
-    
-    for col in en_to_zh_columns:
-        # 跳过表头，只翻译内容
-        texts = df[col].iloc[1:].dropna().astype(str).tolist()
-        en_to_zh_texts.extend(texts)
+    stores, cell_ids, reused, cell_count = collect_excel_texts(df, zh_to_en_columns, en_to_zh_columns, output_path,
+                                                               incremental, key_index)
+    memory_profile.profiler.stage("收集文本")
     
     # 打印开始翻译的信息
     translate_info = []
@@ -563,29 +1332,31 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
         translate_info.append(f"{','.join(en_to_zh_cols)}列(英→中)")
     print(f"\n开始翻译{' 和 '.join(translate_info)}...")
     
-    # 批量翻译
-    zh_to_en_translations = []
-    en_to_zh_translations = []
-    
-    if zh_to_en_texts:
-        print("\n执行中文→英文批量翻译...")
-        zh_to_en_translations = batch_translate(
-            translators['zh_to_en'], 
-            zh_to_en_texts,
-            batch_size=batch_size
+    # 批量翻译，译文按编号存回TextStore
+    # 未能翻译的文本，对应单元格留空，翻译结束后写入重试队列
+    failed_texts = {'zh_to_en': set(), 'en_to_zh': set()}
+    # 因预算或取消没有翻译的文本，同样写入重试队列
+    skipped_texts = {'zh_to_en': set(), 'en_to_zh': set()}
+    
+    for direction, label in (('zh_to_en', '中文→英文'), ('en_to_zh', '英文→中文')):
+        store = stores[direction]
+        if not len(store):
+            continue
+        print(f"\n执行{label}批量翻译（{cell_count[direction]} 个单元格）...")
+        translations = batch_translate(
+            translators[direction],
+            list(store.texts()),
+            batch_size=batch_size,
+            failed_texts=failed_texts[direction],
+            skipped_texts=skipped_texts[direction],
+            workers=workers,
+            memory=memory.get(direction),
+            counts=store.counts(),
+            budget=budget
         )
-    
-    if en_to_zh_texts:
-        print("\n执行英文→中文批量翻译...")
-        en_to_zh_translations = batch_translate(
-            translators['en_to_zh'], 
-            en_to_zh_texts,
-            batch_size=batch_size
-        )
-    
-    # 创建翻译结果的映射字典
-    zh_to_en_map = dict(zip(zh_to_en_texts, zh_to_en_translations)) if zh_to_en_texts else {}
-    en_to_zh_map = dict(zip(en_to_zh_texts, en_to_zh_translations)) if en_to_zh_texts else {}
+        for text_id, translation in enumerate(translations):
+            store.set_translation(text_id, translation)
+    memory_profile.profiler.stage("翻译")
     
     # 将翻译结果插入到DataFrame中，紧跟在原列后面
     print("\n将翻译结果添加到数据...")
@@ -611,10 +1382,13 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
             
             # 创建新列数据
             new_col_data = [f"{df[col].iloc[0]}_en"]  # 表头添加_en后缀
+            store = stores['zh_to_en']
             for i in range(1, len(df)):
-                val = df[col].iloc[i]
-                if pd.notnull(val) and isinstance(val, str):
-                    new_col_data.append(zh_to_en_map.get(val, ""))
+                text_id = cell_ids[col][i]
+                if i in reused[col]:
+                    new_col_data.append(reused[col][i])
+                elif text_id != NO_TEXT:
+                    new_col_data.append(store.translation(text_id) or "")
                 else:
                     new_col_data.append("")
             
@@ -629,20 +1403,27 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
             
             # 创建新列数据
             new_col_data = [f"{df[col].iloc[0]}_zh"]  # 表头添加_zh后缀
+            store = stores['en_to_zh']
             for i in range(1, len(df)):
-                val = df[col].iloc[i]
-                if pd.notnull(val) and isinstance(val, str):
-                    new_col_data.append(en_to_zh_map.get(val, ""))
+                text_id = cell_ids[col][i]
+                if i in reused[col]:
+                    new_col_data.append(reused[col][i])
+                elif text_id != NO_TEXT:
+                    new_col_data.append(store.translation(text_id) or "")
                 else:
                     new_col_data.append("")
             
             # 添加翻译列，紧跟在原列后面
             added_columns += 1
             result_df.insert(col_index + 1, new_col, new_col_data)
+    memory_profile.profiler.stage("构建结果DataFrame")
     
     # 保存为新的Excel文件
     print(f"\n保存翻译结果到 {output_path}")
     result_df.to_excel(output_path, index=False)
+    memory_profile.profiler.stage("保存Excel")
+    failed_queue = save_failed_texts(output_path, translated_columns(zh_to_en_columns, en_to_zh_columns), stores,
+                                     failed_texts, skipped_texts)
     
     # 计算耗时
     end_time = time.time()
@@ -659,188 +1440,318 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
     if en_to_zh_indices:
         en_to_zh_cols = [index_to_column_letter(idx) for idx in en_to_zh_indices]
         print(f'- {", ".join(en_to_zh_cols)}列：英文→中文')
+    print_failed_summary(failed_queue)
+    print_partial_summary(budget)
+    print_run_usage(translators, usage_before)
+    memory_profile.profiler.report()
     
     return output_path
 
-def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10):
-    """通过CSV中间格式执行Excel文件翻译，提高大文件处理效率"""
-    # 记录开始时间
-    start_time = time.time()
-    
-    # 自动生成输出文件名和临时CSV文件名
+def translated_columns(zh_to_en_columns, en_to_zh_columns):
+    """输出文件中原文列与翻译列的对应关系 [(原文列名, 翻译列名, 方向)]"""
+    return ([(col, f"{col}_en", 'zh_to_en') for col in zh_to_en_columns]
+            + [(col, f"{col}_zh", 'en_to_zh') for col in en_to_zh_columns if col not in zh_to_en_columns])
+
+def save_failed_texts(output_path, columns, stores, failed_texts, skipped_texts=None):
+    """
+    把仍然未能翻译的文本写入输出文件对应的重试队列（没有失败时删除旧的队列），返回队列
+
+    参数:
+    columns: translated_columns的返回值
+    failed_texts: {方向: 未能翻译的文本集合}
+    skipped_texts: {方向: 因预算或取消没有翻译的文本集合}
+    """
+    def with_cells(texts_by_direction):
+        return {
+            direction: {text: stores[direction].count(stores[direction].find(text)) for text in texts}
+            for direction, texts in (texts_by_direction or {}).items()
+        }
+
+    path = dead_letter_path(output_path)
+    queue = DeadLetterQueue.load(path) or DeadLetterQueue(path)
+    queue.record_run([{'source': str(source), 'target': str(target), 'direction': direction}
+                      for source, target, direction in columns], with_cells(failed_texts), with_cells(skipped_texts))
+    queue.save()
+    return queue
+
+def print_failed_summary(queue):
+    """在结果总结中输出未能翻译的文本和单元格数"""
+    if not len(queue):
+        return
+    print(f'- 没有翻译的文本 {len(queue)} 个（{queue.cell_count()} 个单元格），对应单元格留空，'
+          f'已保存到 {os.path.basename(queue.path)}，可以用--retry-failed只翻译这些文本')
+    permanent = queue.permanent_cell_count()
+    if permanent:
+        print(f'- 其中 {permanent} 个单元格的文本已累计失败 {DEAD_LETTER_MAX_ATTEMPTS} 次，视为永久失败')
+
+def patch_translated_output(output_path, columns, recovered):
+    """
+    把重试得到的译文补进输出文件中对应的空白翻译单元格（先写临时文件再替换原文件），返回补上的单元格数
+
+    参数:
+    columns: 重试队列中记录的原文列与翻译列的对应关系
+    recovered: {方向: {原文: 译文}}
+    """
+    workbook = openpyxl.load_workbook(output_path)
+    sheet = workbook.active
+    header = [str(cell.value) if cell.value is not None else None for cell in sheet[1]]
+    targets = []
+    for column in columns:
+        translations = recovered.get(column['direction'])
+        if translations and column['source'] in header and column['target'] in header:
+            targets.append((header.index(column['source']), header.index(column['target']), translations))
+    
+    patched = 0
+    for row in sheet.iter_rows(min_row=2):
+        for source_index, target_index, translations in targets:
+            if source_index >= len(row) or target_index >= len(row):
+                continue
+            source, target = row[source_index].value, row[target_index].value
+            if target in (None, "") and isinstance(source, str) and source in translations:
+                row[target_index].value = translations[source]
+                patched += 1
+    if patched:
+        tmp_path = f'{output_path}.{os.getpid()}.tmp.xlsx'
+        try:
+            workbook.save(tmp_path)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            # 保存中断时删除写了一半的临时文件，原输出文件保持不变
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    workbook.close()
+    return patched
+
+def retry_failed_texts(input_path, translators, batch_size=10, workers=1):
+    """
+    只重试上次翻译记录在重试队列中的文本，把译文补进已经生成的输出文件
+
+    累计失败次数达到DEAD_LETTER_MAX_ATTEMPTS的文本视为永久失败，不再重试。
+    """
     name, ext = os.path.splitext(os.path.basename(input_path))
-    output_filename = f'{name}_translated{ext}'
-    output_path = os.path.join(os.path.dirname(input_path), output_filename)
-    temp_csv = os.path.join(os.path.dirname(input_path), f'{name}_temp.csv')
+    output_path = os.path.join(os.path.dirname(input_path), f'{name}_translated{ext}')
+    queue = DeadLetterQueue.load(dead_letter_path(output_path))
+    if queue is None or not len(queue):
+        print(f"没有需要重试的文本（{os.path.basename(dead_letter_path(output_path))} 不存在）")
+        return None
+    if not os.path.exists(output_path):
+        print(f"错误：找不到翻译结果文件 {output_path}")
+        return None
     
+    start_time = time.time()
+    usage_before = snapshot_usage(translators)
+    recovered = {}
+    for direction, label in (('zh_to_en', '中文→英文'), ('en_to_zh', '英文→中文')):
+        texts = queue.retryable(direction)
+        if not texts:
+            continue
+        print(f"\n重试{label}未能翻译的 {len(texts)} 个文本...")
+        failed = set()
+        counts = [queue.texts[direction][text]['cells'] for text in texts]
+        translations = batch_translate(translators[direction], texts, batch_size, failed_texts=failed,
+                                       workers=workers, counts=counts)
+        recovered[direction] = {text: translation for text, translation in zip(texts, translations)
+                                if translation is not None}
+        queue.record_retry(direction, recovered[direction], failed)
+    # 重试中途取消时没有发出的文本仍留在队列中
+    queue.partial = queue.partial and translate_scheduler.cancellation.requested()
+    
+    patched = patch_translated_output(output_path, queue.columns, recovered) if recovered else 0
+    queue.save()
+    
+    elapsed_str = str(datetime.timedelta(seconds=int(time.time() - start_time)))
+    print(f'\n重试完成，补上 {patched} 个单元格，已更新 {output_path}')
+    print(f'总耗时: {elapsed_str} (时:分:秒)')
+    if len(queue):
+        print_failed_summary(queue)
+    else:
+        print(f'- 所有文本都已翻译，已删除 {os.path.basename(queue.path)}')
+    print_partial_summary()
+    print_run_usage(translators, usage_before)
+    return output_path
+
+def excel_to_csv(input_path, csv_path):
+    """将Excel文件转换为CSV中间文件，返回读取的DataFrame"""
     print(f"\n正在加载 {os.path.basename(input_path)} 并转换为CSV...")
     
     # 优化：直接使用pandas读取Excel文件，避免内存占用
     try:
-        df = pd.read_excel(input_path)
-        df.to_csv(temp_csv, index=False, encoding='utf-8-sig')
+        df = read_excel_cached(input_path)
+        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
         print(f"已将Excel转换为临时CSV文件，共 {len(df)} 行数据")
     except Exception as e:
         print(f"Excel转CSV出错: {e}")
         # 尝试使用低内存方式读取
         print("尝试使用低内存模式读取...")
         df = pd.read_excel(input_path, engine='openpyxl')
-        df.to_csv(temp_csv, index=False, encoding='utf-8-sig')
-        
-    # 收集所有需要翻译的文本，使用CSV文件读取以节省内存
+        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+    return df
+
+def extract_csv_texts(csv_path, zh_to_en_columns, en_to_zh_columns):
+    """
+    从CSV中间文件提取需要翻译的文本，每个方向的唯一文本存入一个TextStore，单元格只记录文本编号
+
+    返回:
+    (stores, cell_ids) — stores为{'zh_to_en': TextStore, 'en_to_zh': TextStore}，
+    cell_ids为{方向: {列名: 每行的文本编号数组}}，空单元格为NO_TEXT
+    """
     print("正在从CSV提取需要翻译的文本...")
+    stores = {'zh_to_en': TextStore(), 'en_to_zh': TextStore()}
+    cell_ids = {
+        'zh_to_en': {col: new_cell_ids() for col in zh_to_en_columns},
+        'en_to_zh': {col: new_cell_ids() for col in en_to_zh_columns},
+    }
     
-    # 将索引转换为列名
-    df_columns = list(df.columns)
-    zh_to_en_columns = [df_columns[idx] for idx in zh_to_en_indices] if zh_to_en_indices else []
-    en_to_zh_columns = [df_columns[idx] for idx in en_to_zh_indices] if en_to_zh_indices else []
-    
-    # 提取需要翻译的唯一文本
-    zh_to_en_texts = {}
-    en_to_zh_texts = {}
-    
-    # 使用CSV文件迭代器逐行读取，减少内存消耗
-    with open(temp_csv, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
+    # 使用CSV文件迭代器逐行读取，减少内存消耗；按位置取值，不为每行创建字典
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        targets = [
+            (header.index(col), stores[direction], ids)
+            for direction in ('zh_to_en', 'en_to_zh')
+            for col, ids in cell_ids[direction].items()
+            if col in header
+        ]
         for row in tqdm(reader, desc="提取文本"):
-            # 提取中文->英文需要翻译的文本
-            for col in zh_to_en_columns:
-                if col in row and row[col] and isinstance(row[col], str):
-                    zh_to_en_texts[row[col]] = ""
-            
-            # 提取英文->中文需要翻译的文本
-            for col in en_to_zh_columns:
-                if col in row and row[col] and isinstance(row[col], str):
-                    en_to_zh_texts[row[col]] = ""
+            for position, store, ids in targets:
+                value = row[position] if position < len(row) else ''
+                ids.append(store.add(value) if value else NO_TEXT)
     
     # 统计需要翻译的文本数量
-    print(f"需要翻译的唯一文本: 中->英 {len(zh_to_en_texts)}个, 英->中 {len(en_to_zh_texts)}个")
-    
-    # 检查翻译器类型
-    is_deepseek = any(isinstance(t, DeepSeekTranslator) for t in translators.values())
-    
-    # 批量翻译中文->英文文本
-    if zh_to_en_texts:
-        print("\n执行中文→英文批量翻译...")
-        zh_to_en_list = list(zh_to_en_texts.keys())
-        
-        # DeepSeek可以一次处理更多文本，提高效率
-        if is_deepseek:
-            translations = batch_translate(translators['zh_to_en'], zh_to_en_list, batch_size)
-            for i, text in enumerate(zh_to_en_list):
-                if i < len(translations):
-                    zh_to_en_texts[text] = translations[i]
-        else:
-            # 使用线程池加速翻译，但对于DeepSeek可能会导致API限制
-            batches = [zh_to_en_list[i:i+batch_size] for i in range(0, len(zh_to_en_list), batch_size)]
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                future_to_batch = {
-                    executor.submit(batch_translate, translators['zh_to_en'], batch, 1, 1): i 
-                    for i, batch in enumerate(batches)
-                }
-                
-                for future in tqdm(concurrent.futures.as_completed(future_to_batch), total=len(batches), desc="翻译批次"):
-                    batch_idx = future_to_batch[future]
-                    try:
-                        translations = future.result()
-                        start_idx = batch_idx * batch_size
-                        for i, translation in enumerate(translations):
-                            if start_idx + i < len(zh_to_en_list):
-                                zh_to_en_texts[zh_to_en_list[start_idx + i]] = translation
-                    except Exception as e:
-                        print(f"批次 {batch_idx} 翻译出错: {e}")
-    
-    # 批量翻译英文->中文文本
-    if en_to_zh_texts:
-        print("\n执行英文→中文批量翻译...")
-        en_to_zh_list = list(en_to_zh_texts.keys())
-        
-        # DeepSeek可以一次处理更多文本，提高效率
-        if is_deepseek:
-            translations = batch_translate(translators['en_to_zh'], en_to_zh_list, batch_size)
-            for i, text in enumerate(en_to_zh_list):
-                if i < len(translations):
-                    en_to_zh_texts[text] = translations[i]
-        else:
-            # 使用线程池加速翻译，但对于DeepSeek可能会导致API限制
-            batches = [en_to_zh_list[i:i+batch_size] for i in range(0, len(en_to_zh_list), batch_size)]
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-                future_to_batch = {
-                    executor.submit(batch_translate, translators['en_to_zh'], batch, 1, 1): i 
-                    for i, batch in enumerate(batches)
-                }
-                
-                for future in tqdm(concurrent.futures.as_completed(future_to_batch), total=len(batches), desc="翻译批次"):
-                    batch_idx = future_to_batch[future]
-                    try:
-                        translations = future.result()
-                        start_idx = batch_idx * batch_size
-                        for i, translation in enumerate(translations):
-                            if start_idx + i < len(en_to_zh_list):
-                                en_to_zh_texts[en_to_zh_list[start_idx + i]] = translation
-                    except Exception as e:
-                        print(f"批次 {batch_idx} 翻译出错: {e}")
-    
-    # 逐行处理CSV并应用翻译结果
+    print(f"需要翻译的唯一文本: 中->英 {len(stores['zh_to_en'])}个, 英->中 {len(stores['en_to_zh'])}个")
+    return stores, cell_ids
+
+def apply_csv_translations(csv_path, output_path, zh_to_en_columns, en_to_zh_columns, stores, cell_ids):
+    """
+    逐行把翻译结果写入Excel文件，翻译列紧跟在原列后面，没有译文的单元格留空
+
+    参数:
+    stores, cell_ids: extract_csv_texts的返回值，译文已保存在stores中
+    """
     print("\n将翻译结果应用到CSV数据...")
     
     # 准备新的CSV文件
-    translated_csv = os.path.join(os.path.dirname(input_path), f'{name}_translated.csv')
+    name = os.path.splitext(os.path.basename(output_path))[0]
+    translated_csv = os.path.join(os.path.dirname(output_path), f'{name}.csv')
     
-    with open(temp_csv, 'r', encoding='utf-8-sig') as input_file, \
-         open(translated_csv, 'w', encoding='utf-8-sig', newline='') as output_file:
+    try:
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as input_file, \
+             open(translated_csv, 'w', encoding='utf-8-sig', newline='') as output_file:
         
-        reader = csv.DictReader(input_file)
-        all_columns = reader.fieldnames.copy()
+            reader = csv.reader(input_file)
+            all_columns = next(reader, [])
         
-        # 创建新的列顺序，确保翻译列紧跟在原始列后面
-        new_columns = []
-        for col_name in all_columns:
-            new_columns.append(col_name)
-            # 如果当前列需要中文→英文翻译，在它后面添加对应的翻译列
-            if col_name in zh_to_en_columns:
-                new_columns.append(f"{col_name}_en")
-            # 如果当前列需要英文→中文翻译，在它后面添加对应的翻译列
-            elif col_name in en_to_zh_columns:
-                new_columns.append(f"{col_name}_zh")
+            # 创建新的列顺序，确保翻译列紧跟在原始列后面
+            new_columns = []
+            # 每个原始列之后要插入的翻译列：(文本编号数组, TextStore)，不需要翻译的列为None
+            inserts = []
+            for col_name in all_columns:
+                new_columns.append(col_name)
+                # 如果当前列需要中文→英文翻译，在它后面添加对应的翻译列
+                if col_name in zh_to_en_columns:
+                    new_columns.append(f"{col_name}_en")
+                    inserts.append((cell_ids['zh_to_en'][col_name], stores['zh_to_en']))
+                # 如果当前列需要英文→中文翻译，在它后面添加对应的翻译列
+                elif col_name in en_to_zh_columns:
+                    new_columns.append(f"{col_name}_zh")
+                    inserts.append((cell_ids['en_to_zh'][col_name], stores['en_to_zh']))
+                else:
+                    inserts.append(None)
         
-        writer = csv.DictWriter(output_file, fieldnames=new_columns)
-        writer.writeheader()
+            writer = csv.writer(output_file)
+            writer.writerow(new_columns)
         
-        # 逐行处理数据
-        for row in tqdm(reader, desc="生成结果"):
-            new_row = {key: value for key, value in row.items()}
-            
-            # 添加中文->英文翻译结果
-            for col in zh_to_en_columns:
-                if col in row and row[col] and isinstance(row[col], str):
-                    new_row[f"{col}_en"] = zh_to_en_texts.get(row[col], "")
-                else:
-                    new_row[f"{col}_en"] = ""
-            
-            # 添加英文->中文翻译结果
-            for col in en_to_zh_columns:
-                if col in row and row[col] and isinstance(row[col], str):
-                    new_row[f"{col}_zh"] = en_to_zh_texts.get(row[col], "")
-                else:
-                    new_row[f"{col}_zh"] = ""
-            
-            writer.writerow(new_row)
+            # 逐行处理数据，按行号取出单元格的文本编号，再按编号取出译文
+            for row_number, row in enumerate(tqdm(reader, desc="生成结果")):
+                new_row = []
+                for position, insert in enumerate(inserts):
+                    new_row.append(row[position] if position < len(row) else '')
+                    if insert is not None:
+                        ids, store = insert
+                        text_id = ids[row_number]
+                        new_row.append((store.translation(text_id) or "") if text_id != NO_TEXT else "")
+                writer.writerow(new_row)
+        memory_profile.profiler.stage("生成结果CSV")
+    
+        # 将CSV结果转回Excel格式
+        print("\n将最终结果转换回Excel格式...")
+        result_df = pd.read_csv(translated_csv, encoding='utf-8-sig')
+        memory_profile.profiler.stage("读取结果CSV")
+        result_df.to_excel(output_path, index=False)
+        memory_profile.profiler.stage("保存Excel")
+    finally:
+        # 翻译中断或出错时也清理临时CSV文件
+        if os.path.exists(translated_csv):
+            try:
+                os.remove(translated_csv)
+            except OSError:
+                print(f"注意：无法删除临时CSV文件 {translated_csv}")
+
+def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10, workers=DEFAULT_WORKERS,
+                      memory=None, budget=None):
+    """
+    通过CSV中间格式执行Excel文件翻译，提高大文件处理效率
+
+    分为三个阶段：提取唯一文本（extract_csv_texts）→ 翻译 → 应用翻译结果（apply_csv_translations），
+    translate_shards.py把这三个阶段拆开，分布到多台机器上执行。
+    """
+    # 记录开始时间
+    start_time = time.time()
+    usage_before = snapshot_usage(translators)
     
-    # 将CSV结果转回Excel格式
-    print("\n将最终结果转换回Excel格式...")
-    result_df = pd.read_csv(translated_csv, encoding='utf-8-sig')
-    result_df.to_excel(output_path, index=False)
+    # 自动生成输出文件名和临时CSV文件名
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    output_filename = f'{name}_translated{ext}'
+    output_path = os.path.join(os.path.dirname(input_path), output_filename)
+    temp_csv = os.path.join(os.path.dirname(input_path), f'{name}_temp.csv')
+    memory_profile.profiler.begin()
     
-    # 清理临时文件
     try:
-        os.remove(temp_csv)
-        os.remove(translated_csv)
-        print("已清理临时CSV文件")
-    except:
-        print("注意：无法删除临时CSV文件")
+        df = excel_to_csv(input_path, temp_csv)
+        memory_profile.profiler.stage("Excel转CSV")
+    
+        # 将索引转换为列名
+        df_columns = list(df.columns)
+        # CSV表头中的列名都是字符串
+        zh_to_en_columns = [str(df_columns[idx]) for idx in zh_to_en_indices] if zh_to_en_indices else []
+        en_to_zh_columns = [str(df_columns[idx]) for idx in en_to_zh_indices] if en_to_zh_indices else []
+    
+        # 提取需要翻译的唯一文本
+        stores, cell_ids = extract_csv_texts(temp_csv, zh_to_en_columns, en_to_zh_columns)
+        memory_profile.profiler.stage("提取文本")
+    
+        # 未能翻译的文本，对应单元格留空，翻译结束后写入重试队列
+        failed_texts = {'zh_to_en': set(), 'en_to_zh': set()}
+        # 因预算或取消没有翻译的文本，同样写入重试队列
+        skipped_texts = {'zh_to_en': set(), 'en_to_zh': set()}
+    
+        # 每个方向的唯一文本一次交给batch_translate，由多个线程并发发送批量请求，译文按编号存回TextStore
+        for direction, label in (('zh_to_en', "中文→英文"), ('en_to_zh', "英文→中文")):
+            store = stores[direction]
+            if not len(store):
+                continue
+            print(f"\n执行{label}批量翻译...")
+            translations = batch_translate(translators[direction], list(store.texts()), batch_size,
+                                           failed_texts=failed_texts[direction], skipped_texts=skipped_texts[direction],
+                                           workers=workers,
+                                           memory=(memory or {}).get(direction), counts=store.counts(), budget=budget)
+            for text_id, translation in enumerate(translations):
+                store.set_translation(text_id, translation)
+            del translations
+        memory_profile.profiler.stage("翻译")
+    
+        # 逐行处理CSV并应用翻译结果
+        apply_csv_translations(temp_csv, output_path, zh_to_en_columns, en_to_zh_columns, stores, cell_ids)
+        failed_queue = save_failed_texts(output_path, translated_columns(zh_to_en_columns, en_to_zh_columns), stores,
+                                         failed_texts, skipped_texts)
+    finally:
+        # 清理临时文件（翻译中断或出错时也清理）
+        try:
+            os.remove(temp_csv)
+            print("已清理临时CSV文件")
+        except:
+            print("注意：无法删除临时CSV文件")
     
     # 计算耗时
     end_time = time.time()
@@ -857,9 +1768,511 @@ def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indice
     if en_to_zh_indices:
         en_to_zh_cols = [index_to_column_letter(idx) for idx in en_to_zh_indices]
         print(f'- {", ".join(en_to_zh_cols)}列：英文→中文')
+    print_failed_summary(failed_queue)
+    print_partial_summary(budget)
+    print_run_usage(translators, usage_before)
+    memory_profile.profiler.report()
     
     return output_path
 
+def pipeline_scheduler(translator, workers, on_done):
+    """创建流水线模式使用的调度器，返回(调度器, 分批函数)，与translate_unique_texts的分批和并发方式相同"""
+    if isinstance(translator, ProviderPool):
+        scheduler = BatchScheduler(translator, translate_text_batch, show_progress=False, on_done=on_done)
+    else:
+        provider = Provider(type(translator).__name__, translator, workers=workers)
+        scheduler = BatchScheduler(ProviderPool([provider]), translate_batch_or_individually, show_progress=False,
+                                   on_done=on_done)
+    return scheduler, lambda texts, batch_size: split_batches(translator, texts, batch_size)
+
+def translate_pipelined(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10,
+                        workers=DEFAULT_WORKERS, memory=None):
+    """
+    以流水线方式翻译Excel文件：读取、翻译和写入同时进行
+
+    读取线程按块（PIPELINE_CHUNK_ROWS行）流式读取工作表；主线程把每块中新出现的唯一文本存入TextStore，
+    立即分批交给调度器翻译；写入线程按原顺序逐行等待该行的译文完成后流式写入输出文件。
+    各阶段之间是有界队列，读取不会远远领先于写入，总耗时接近最慢的一个阶段而不是三个阶段之和。
+    只支持xlsx文件（其他格式改用CSV模式）。与CSV模式相同，表头下的所有行都会翻译。
+    """
+    if not input_path.lower().endswith(('.xlsx', '.xlsm')):
+        print("流水线模式只支持xlsx文件，改用CSV模式")
+        return translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size, workers,
+                                 memory)
+    
+    # 记录开始时间
+    start_time = time.time()
+    usage_before = snapshot_usage(translators)
+    memory = memory or {}
+    
+    # 自动生成输出文件名
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    output_filename = f'{name}_translated{ext}'
+    output_path = os.path.join(os.path.dirname(input_path), output_filename)
+    
+    print(f"\n以流水线方式翻译 {os.path.basename(input_path)}（每块 {PIPELINE_CHUNK_ROWS} 行）...")
+    workbook = openpyxl.load_workbook(input_path, read_only=True, data_only=True)
+    sheet = workbook.active
+    rows = sheet.iter_rows(values_only=True)
+    header = list(next(rows, ()))
+    
+    # 每列的翻译方向，同一列同时指定两个方向时按中文→英文处理（与其他模式一致）
+    directions = {idx: 'en_to_zh' for idx in en_to_zh_indices}
+    directions.update({idx: 'zh_to_en' for idx in zh_to_en_indices})
+    targets = sorted(directions.items())
+    suffixes = {'zh_to_en': '_en', 'en_to_zh': '_zh'}
+    
+    stores = {'zh_to_en': TextStore(), 'en_to_zh': TextStore()}
+    failed_ids = {'zh_to_en': set(), 'en_to_zh': set()}
+    # 因取消没有翻译的文本，对应单元格留空
+    skipped_ids = {'zh_to_en': set(), 'en_to_zh': set()}
+    cancellation = translate_scheduler.cancellation
+    # 保护stores、failed_ids和skipped_ids：主线程加入文本，调度器线程写入译文，写入线程读取译文
+    lock = threading.Condition()
+    stage_times = {'read': 0.0, 'write': 0.0}
+    translate_span = [None, None]
+    errors = []
+    
+    def make_on_done(direction):
+        store = stores[direction]
+        direction_memory = memory.get(direction)
+        
+        def on_done(results, failed, skipped):
+            with lock:
+                for text, translation in results.items():
+                    store.set_translation(store.find(text), translation)
+                for text in failed:
+                    failed_ids[direction].add(store.find(text))
+                for text in skipped:
+                    skipped_ids[direction].add(store.find(text))
+                translate_span[1] = time.time()
+                lock.notify_all()
+            if direction_memory is not None and results:
+                direction_memory.update(results)
+        return on_done
+    
+    schedulers = {}
+    for direction in set(directions.values()):
+        scheduler, batcher = pipeline_scheduler(translators[direction], workers, make_on_done(direction))
+        scheduler.start()
+        schedulers[direction] = (scheduler, batcher)
+    
+    read_queue = queue.Queue(PIPELINE_QUEUE_CHUNKS)
+    write_queue = queue.Queue(PIPELINE_QUEUE_CHUNKS)
+    
+    def read_chunks():
+        """读取阶段：按块读取工作表的行"""
+        try:
+            while True:
+                read_start = time.time()
+                chunk = list(itertools.islice(rows, PIPELINE_CHUNK_ROWS))
+                stage_times['read'] += time.time() - read_start
+                if not chunk:
+                    break
+                read_queue.put(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            read_queue.put(None)
+    
+    def wait_translation(direction, text_id):
+        """等待文本翻译完成，返回译文，翻译失败或因取消没有翻译时返回空字符串"""
+        store = stores[direction]
+        with lock:
+            while True:
+                translation = store.translation(text_id)
+                if translation is not None:
+                    return translation
+                if text_id in failed_ids[direction] or text_id in skipped_ids[direction]:
+                    return ""
+                if cancellation.grace_expired():
+                    # 宽限期已过，不再等待还没有返回的请求
+                    skipped_ids[direction].add(text_id)
+                    return ""
+                lock.wait(0.5)
+    
+    def write_rows():
+        """写入阶段：按原顺序写入每一行，翻译列紧跟在原列后面"""
+        try:
+            output = openpyxl.Workbook(write_only=True)
+            output_sheet = output.create_sheet(sheet.title)
+            new_header = []
+            for idx in range(len(header)):
+                new_header.append(header[idx])
+                if idx in directions:
+                    column_name = header[idx] if header[idx] is not None else f"Unnamed: {idx}"
+                    new_header.append(f"{column_name}{suffixes[directions[idx]]}")
+            output_sheet.append(new_header)
+            
+            progress = tqdm(desc="流水线进度（已写入行）", unit="行")
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    break
+                chunk, chunk_ids = item
+                for row, row_ids in zip(chunk, chunk_ids):
+                    new_row = []
+                    translated = iter(row_ids)
+                    for idx in range(max(len(header), len(row))):
+                        new_row.append(row[idx] if idx < len(row) else None)
+                        if idx in directions:
+                            text_id = next(translated)
+                            new_row.append(wait_translation(directions[idx], text_id) if text_id != NO_TEXT else "")
+                    write_start = time.time()
+                    output_sheet.append(new_row)
+                    stage_times['write'] += time.time() - write_start
+                progress.update(len(chunk))
+            progress.close()
+            print(f"\n保存翻译结果到 {output_path}")
+            save_start = time.time()
+            output.save(output_path)
+            stage_times['write'] += time.time() - save_start
+        except Exception as e:
+            errors.append(e)
+            # 继续取走剩下的块，避免主线程阻塞在有界队列上
+            while write_queue.get() is not None:
+                pass
+    
+    reader = threading.Thread(target=read_chunks, daemon=True)
+    writer = threading.Thread(target=write_rows, daemon=True)
+    reader.start()
+    writer.start()
+    
+    # 分发阶段：新出现的唯一文本立即分批交给调度器
+    cells = 0
+    remembered_count = 0
+    try:
+        while True:
+            chunk = read_queue.get()
+            if chunk is None:
+                break
+            chunk_ids = []
+            new_texts = {'zh_to_en': [], 'en_to_zh': []}
+            with lock:
+                for row in chunk:
+                    row_ids = []
+                    for idx, direction in targets:
+                        value = row[idx] if idx < len(row) else None
+                        if not isinstance(value, str) or not value:
+                            row_ids.append(NO_TEXT)
+                            continue
+                        cells += 1
+                        store = stores[direction]
+                        count = len(store)
+                        text_id = store.add(value)
+                        if text_id == count:
+                            # 第一次出现的文本：翻译记忆中已有的直接使用，其余送去翻译
+                            direction_memory = memory.get(direction)
+                            translation = direction_memory.get(value) if direction_memory is not None else None
+                            if translation is not None:
+                                store.set_translation(text_id, translation)
+                                remembered_count += 1
+                            elif cancellation.requested():
+                                # 取消后继续读取和写入剩下的行，新文本不再翻译，对应单元格留空
+                                skipped_ids[direction].add(text_id)
+                            else:
+                                new_texts[direction].append(value)
+                        row_ids.append(text_id)
+                    chunk_ids.append(row_ids)
+            for direction, texts in new_texts.items():
+                if texts:
+                    scheduler, batcher = schedulers[direction]
+                    if translate_span[0] is None:
+                        translate_span[0] = time.time()
+                    scheduler.submit(batcher(texts, batch_size))
+            write_queue.put((chunk, chunk_ids))
+    finally:
+        for scheduler, _ in schedulers.values():
+            scheduler.close()
+        write_queue.put(None)
+    
+    for scheduler, _ in schedulers.values():
+        scheduler.join()
+    # 分段等待，保证主线程可以响应Ctrl-C
+    for thread in (reader, writer):
+        while thread.is_alive():
+            thread.join(0.5)
+    workbook.close()
+    if errors:
+        raise errors[0]
+    column_names = {idx: header[idx] if idx < len(header) and header[idx] is not None else f"Unnamed: {idx}"
+                    for idx, _ in targets}
+    columns = translated_columns([column_names[idx] for idx, direction in targets if direction == 'zh_to_en'],
+                                 [column_names[idx] for idx, direction in targets if direction == 'en_to_zh'])
+    
+    # 未能翻译的文本在所有批次完成后重试一次（与batch_translate相同），译文补进已写入的输出文件
+    recovered = {}
+    for direction, ids in failed_ids.items():
+        if not ids or cancellation.requested():
+            continue
+        store = stores[direction]
+        texts = [store.text(text_id) for text_id in ids]
+        print(f"\n{len(texts)} 个文本未能翻译，所有批次完成后重试...")
+        wait_for_breakers(translators[direction])
+        retried, failed = translate_unique_texts(translators[direction], texts, batch_size, workers=workers)
+        for text, translation in retried.items():
+            store.set_translation(store.find(text), translation)
+        failed_ids[direction] = {store.find(text) for text in failed}
+        if retried:
+            recovered[direction] = retried
+            if memory.get(direction) is not None:
+                memory[direction].update(retried)
+    if recovered:
+        patched = patch_translated_output(
+            output_path,
+            [{'source': str(source), 'target': str(target), 'direction': direction}
+             for source, target, direction in columns],
+            recovered
+        )
+        print(f"重试成功 {sum(len(texts) for texts in recovered.values())} 个文本，已补上 {patched} 个单元格")
+    
+    failed_queue = save_failed_texts(
+        output_path,
+        columns,
+        stores,
+        {direction: {stores[direction].text(text_id) for text_id in ids} for direction, ids in failed_ids.items()},
+        {direction: {stores[direction].text(text_id) for text_id in ids} for direction, ids in skipped_ids.items()}
+    )
+    
+    # 计算耗时
+    elapsed_time = time.time() - start_time
+    elapsed_str = str(datetime.timedelta(seconds=int(elapsed_time)))
+    translate_time = translate_span[1] - translate_span[0] if None not in translate_span else 0
+    
+    print(f'\n翻译完成，已生成 {output_path}')
+    print(f'总耗时: {elapsed_str} (时:分:秒)')
+    print(f"各阶段耗时: 读取 {stage_times['read']:.1f} 秒，翻译 {translate_time:.1f} 秒，"
+          f"写入 {stage_times['write']:.1f} 秒（三者同时进行，总计 {elapsed_time:.1f} 秒）")
+    print(f"共 {cells} 个单元格，唯一文本: 中->英 {len(stores['zh_to_en'])}个, 英->中 {len(stores['en_to_zh'])}个"
+          + (f"，翻译记忆命中 {remembered_count} 个" if remembered_count else ""))
+    for direction, (scheduler, _) in schedulers.items():
+        if workers > 1 or isinstance(translators[direction], ProviderPool):
+            scheduler.print_stats(translate_time)
+    
+    # 输出结果总结
+    if zh_to_en_indices:
+        zh_to_en_cols = [index_to_column_letter(idx) for idx in zh_to_en_indices]
+        print(f'- {", ".join(zh_to_en_cols)}列：中文→英文')
+    if en_to_zh_indices:
+        en_to_zh_cols = [index_to_column_letter(idx) for idx in en_to_zh_indices]
+        print(f'- {", ".join(en_to_zh_cols)}列：英文→中文')
+    print_failed_summary(failed_queue)
+    print_partial_summary()
+    print_run_usage(translators, usage_before)
+    
+    return output_path
+
+def api_name_of(translator):
+    """单个翻译器对应的API名称"""
+    api_classes = {1: MyMemoryTranslator, 2: GoogleTranslator, 3: BaiduTranslator, 4: DeepSeekTranslator}
+    for api_choice, translator_class in api_classes.items():
+        if isinstance(translator, translator_class):
+            return API_NAMES[api_choice]
+    return type(translator).__name__
+
+def estimate_requests(translator, requests, workers=1, delay=1):
+    """
+    估算一组请求的字符数、token数、耗时和费用（不调用API）
+
+    requests为每个请求的文本列表。耗时取并发数下各请求耗时之和与限速器速率限制两者中较大的；
+    单线程且未限速时，与translate_batches相同，请求之间等待delay秒。
+    """
+    estimate = {
+        'requests': len(requests),
+        'chars': sum(len(text) for request in requests for text in request),
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'cost': 0.0,
+        'currency': None,
+    }
+    latencies = [PLAN_REQUEST_SECONDS.get(type(translator).__name__, 0.5)] * len(requests)
+    if isinstance(translator, DeepSeekTranslator):
+        system_tokens = estimate_tokens(translator.system_prompt)
+        text_tokens = 0
+        for i, request in enumerate(requests):
+            input_tokens = sum(estimate_tokens(text) + estimate_tokens(DEEPSEEK_SEPARATOR) for text in request)
+            output_tokens = estimate_output_tokens(input_tokens, translator.target)
+            text_tokens += input_tokens
+            estimate['output_tokens'] += output_tokens
+            latencies[i] += output_tokens / PLAN_DEEPSEEK_TOKENS_PER_SECOND
+        estimate['input_tokens'] = system_tokens * len(requests) + text_tokens
+        # 系统提示词逐字节相同，第一个请求之后按缓存命中计费
+        estimate['cost'] = deepseek_cost({
+            'prompt_cache_hit_tokens': system_tokens * max(0, len(requests) - 1),
+            'prompt_cache_miss_tokens': text_tokens + (system_tokens if requests else 0),
+            'completion_tokens': estimate['output_tokens'],
+        })
+        estimate['currency'] = '$'
+    elif isinstance(translator, BaiduTranslator):
+        estimate['cost'] = estimate['chars'] * BAIDU_PRICE_PER_MILLION_CHARS / 1_000_000
+        estimate['currency'] = '¥'
+
+    rate = limiter_for(translator).max_rate
+    seconds = sum(latencies) / max(1, workers)
+    if rate:
+        seconds = max(seconds, len(requests) / rate)
+    elif workers <= 1 and requests:
+        seconds += (len(requests) - 1) * delay
+    estimate['seconds'] = seconds
+    return estimate
+
+def format_estimate(name, estimate, workers):
+    """一行估算结果"""
+    rate = estimate.get('rate')
+    tokens = (f"，输入约 {estimate['input_tokens']:.0f} token，输出约 {estimate['output_tokens']:.0f} token"
+              if estimate['input_tokens'] else "")
+    cost = f"，估算费用 {estimate['currency']}{estimate['cost']:.4f}" if estimate['currency'] else "，免费"
+    limits = f"速率 {rate:g}/秒，并发 {workers}" if rate else f"并发 {workers}"
+    return (f"- {name}: {estimate['requests']} 个请求，{estimate['chars']} 个字符{tokens}，"
+            f"预计耗时 {datetime.timedelta(seconds=int(estimate['seconds']))}（{limits}）{cost}")
+
+def plan_translation(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10, workers=1,
+                     incremental=False, key_index=None, budget=None):
+    """
+    估算翻译任务的规模，不调用任何翻译API
+
+    与实际翻译相同的方式收集和去重文本（包括增量翻译复用的单元格、按出现次数排序和翻译预算的
+    覆盖率及文本数限制），用与translate_unique_texts相同的分批逻辑（多个API时还按调度器合并批次的方式）
+    得到请求数，再按各API的速率、并发数和价格估算token数、耗时和费用。
+    CSV模式还会翻译数字单元格，实际的单元格数可能略多。
+    """
+    name, ext = os.path.splitext(os.path.basename(input_path))
+    output_path = os.path.join(os.path.dirname(input_path), f'{name}_translated{ext}')
+    
+    print(f"\n正在加载 {os.path.basename(input_path)}...")
+    df = read_excel_cached(input_path)
+    print(f"文件加载完成，共有 {df.shape[0]} 行，{df.shape[1]} 列")
+    zh_to_en_columns = [df.columns[idx] for idx in zh_to_en_indices]
+    en_to_zh_columns = [df.columns[idx] for idx in en_to_zh_indices]
+    stores, _, reused, cell_count = collect_excel_texts(df, zh_to_en_columns, en_to_zh_columns, output_path,
+                                                        incremental, key_index)
+    
+    print("\n翻译计划（估算，未调用任何翻译API）:")
+    total_seconds = 0.0
+    total_cost = defaultdict(float)
+    for direction, label in (('zh_to_en', '中文→英文'), ('en_to_zh', '英文→中文')):
+        store = stores[direction]
+        if not len(store):
+            continue
+        text_counts, unique_texts = order_by_frequency(list(store.texts()), store.counts())
+        planned = unique_texts
+        if budget is not None and budget.max_texts is not None:
+            planned = planned[:budget.max_texts]
+        if budget is not None and budget.coverage is not None:
+            # 按出现次数从多到少，达到覆盖率目标需要的文本数
+            covered = 0
+            for count, text in enumerate(planned, 1):
+                covered += text_counts[text]
+                if covered >= budget.coverage * cell_count[direction]:
+                    planned = planned[:count]
+                    break
+        planned_cells = sum(text_counts[text] for text in planned)
+        print(f"\n{label}: {cell_count[direction]} 个单元格，去重后 {len(unique_texts)} 个唯一文本")
+        if len(planned) < len(unique_texts):
+            print(f"翻译预算内翻译出现次数最多的 {len(planned)} 个文本，"
+                  f"覆盖 {planned_cells / cell_count[direction]:.1%} 的单元格")
+        
+        translator = translators[direction]
+        batches = split_batches(translator, planned, batch_size)
+        print(f"分为 {len(batches)} 个批次")
+        if isinstance(translator, ProviderPool):
+            # 各服务按自己的容量合并批次；同时使用时耗时按各服务的处理速度合计估算
+            estimates = []
+            throughput = 0.0
+            for provider in translator.providers:
+                estimate = estimate_requests(provider.translator, provider.group(batches), provider.workers)
+                estimate['rate'] = provider.limiter.max_rate
+                print(format_estimate(f"{provider.name}（全部由它翻译时）", estimate, provider.workers))
+                estimates.append((provider.name, estimate))
+                if estimate['seconds']:
+                    throughput += 1 / estimate['seconds']
+            seconds = 1 / throughput if throughput else 0
+            # 各服务从共享队列取批次，分担的比例与处理速度成正比，费用按该比例分摊
+            shares = []
+            direction_cost = defaultdict(float)
+            for provider_name, estimate in estimates:
+                share = (1 / estimate['seconds']) / throughput if estimate['seconds'] else 0
+                shares.append(f"{provider_name} {share:.0%}")
+                if estimate['currency']:
+                    direction_cost[estimate['currency']] += estimate['cost'] * share
+            for currency, cost in direction_cost.items():
+                total_cost[currency] += cost
+            print(f"同时使用 {', '.join(translator.names)} 预计耗时 {datetime.timedelta(seconds=int(seconds))}"
+                  f"（按处理速度分担：{'，'.join(shares)}）"
+                  + "".join(f"，估算费用 {currency}{cost:.4f}" for currency, cost in direction_cost.items()))
+        else:
+            request_workers = min(workers, len(batches)) if workers > 1 else 1
+            estimate = estimate_requests(translator, batches, request_workers)
+            estimate['rate'] = limiter_for(translator).max_rate
+            print(format_estimate(api_name_of(translator), estimate, request_workers))
+            seconds = estimate['seconds']
+            if estimate['currency']:
+                total_cost[estimate['currency']] += estimate['cost']
+        total_seconds += seconds
+    
+    reused_count = sum(len(r) for r in reused.values())
+    print(f"\n合计预计翻译耗时 {datetime.timedelta(seconds=int(total_seconds))}"
+          + "".join(f"，估算费用 {currency}{cost:.4f}" for currency, cost in total_cost.items())
+          + (f"（增量翻译复用 {reused_count} 个单元格）" if incremental else ""))
+    if budget is not None and budget.seconds is not None and total_seconds > budget.seconds:
+        print(f"预计超过时间上限 {budget.seconds / 60:.0f} 分钟，将输出部分结果")
+    if budget is not None and budget.cost is not None and total_cost.get('$', 0) > budget.cost:
+        print(f"预计超过费用上限 ${budget.cost:.2f}，将输出部分结果")
+
+def create_translator_pair(api_choice, config, args):
+    """根据命令行参数和配置创建一个API的两个方向的翻译器，缺少密钥时抛出ValueError"""
+    translators = {}
+    if api_choice == 1:  # MyMemory翻译
+        translators['zh_to_en'] = MyMemoryTranslator(source='zh-CN', target='en-GB')
+        translators['en_to_zh'] = MyMemoryTranslator(source='en-GB', target='zh-CN')
+    elif api_choice == 2:  # Google翻译
+        translators['zh_to_en'] = GoogleTranslator(source='zh-CN', target='en')
+        translators['en_to_zh'] = GoogleTranslator(source='en', target='zh-CN')
+    elif api_choice == 3:  # 百度翻译
+        # 优先使用命令行参数，其次使用配置
+        baidu_appid = args.baidu_appid or config['baidu_appid']
+        baidu_key = args.baidu_key or config['baidu_key']
+
+        if not baidu_appid or not baidu_key:
+            raise ValueError("使用百度翻译API需要提供APP ID和密钥，您可以通过命令行参数、环境变量或配置文件提供")
+
+        translators['zh_to_en'] = BaiduTranslator(
+            appid=baidu_appid,
+            appkey=baidu_key,
+            source='zh', 
+            target='en'
+        )
+        translators['en_to_zh'] = BaiduTranslator(
+            appid=baidu_appid,
+            appkey=baidu_key,
+            source='en',
+            target='zh'
+        )
+    elif api_choice == 4:  # DeepSeek-V3
+        # 优先使用命令行参数，其次使用配置
+        deepseek_key = args.deepseek_key or config['deepseek_key']
+        deepseek_url = args.deepseek_url or config['deepseek_url']
+
+        if not deepseek_key:
+            raise ValueError("使用DeepSeek-V3需要提供API密钥，您可以通过命令行参数、环境变量或配置文件提供")
+        glossary = load_glossary(args.glossary) if args.glossary else None
+
+        translators['zh_to_en'] = DeepSeekTranslator(
+            source='zh-CN', 
+            target='en',
+            api_key=deepseek_key,
+            api_url=deepseek_url,
+            glossary=glossary
+        )
+        translators['en_to_zh'] = DeepSeekTranslator(
+            source='en', 
+            target='zh-CN',
+            api_key=deepseek_key,
+            api_url=deepseek_url,
+            glossary=glossary
+        )
+    return translators
+
 def interactive_mode():
     """交互式模式主函数"""
     try:
@@ -871,14 +2284,15 @@ def interactive_mode():
         if not input_path:
             return
         
-        # 加载Excel文件以显示列信息
-        wb = openpyxl.load_workbook(input_path)
+        # 加载Excel文件以显示列信息（写入解析缓存，后续翻译时直接复用）
+        df = read_excel_cached(input_path)
         
         # 选择翻译API
         translators = select_translator()
         
         # 选择要翻译的列
-        zh_to_en_indices, en_to_zh_indices = select_columns(wb)
+        zh_to_en_indices, en_to_zh_indices = select_columns(list(df.columns))
+        del df
         if zh_to_en_indices is None and en_to_zh_indices is None:
             return
         
@@ -888,23 +2302,29 @@ def interactive_mode():
         # 询问是否使用CSV中间格式
         use_csv = input("\n是否使用CSV中间格式加速翻译(适合大文件)？(y/n): ").strip().lower() == 'y'
         
-        # 执行翻译
-        if use_csv:
-            output_path = translate_via_csv(
-                input_path, 
-                translators, 
-                zh_to_en_indices, 
-                en_to_zh_indices, 
-                batch_size
-            )
-        else:
-            output_path = translate_excel_file(
-                input_path, 
-                translators, 
-                zh_to_en_indices, 
-                en_to_zh_indices, 
-                batch_size
-            )
+        # 翻译期间Ctrl-C后不再发出新的请求，等待已发出的请求完成后输出部分结果（与命令行模式相同）；
+        # 选择文件和参数时Ctrl-C仍然直接退出
+        translate_scheduler.cancellation.install()
+        try:
+            # 执行翻译
+            if use_csv:
+                output_path = translate_via_csv(
+                    input_path, 
+                    translators, 
+                    zh_to_en_indices, 
+                    en_to_zh_indices, 
+                    batch_size
+                )
+            else:
+                output_path = translate_excel_file(
+                    input_path, 
+                    translators, 
+                    zh_to_en_indices, 
+                    en_to_zh_indices, 
+                    batch_size
+                )
+        finally:
+            translate_scheduler.cancellation.uninstall()
 
         print("\n感谢使用Excel自动翻译工具！")
         
@@ -933,6 +2353,22 @@ def interactive_mode():
         import traceback
         print(traceback.format_exc())
 
+def configure_scheduler(args, concurrency):
+    """
+    按--min/--max-workers和--hedge*设置自动调整并发数和请求对冲（进程内的所有翻译共用），参数无效时抛出ValueError
+
+    concurrency为同时进行的批次请求数上限，用于分配对冲线程池
+    """
+    if args.max_workers is not None:
+        if not 1 <= args.min_workers <= args.max_workers:
+            raise ValueError("--min-workers应大于0且不超过--max-workers")
+        translate_scheduler.concurrency_bounds = (args.min_workers, args.max_workers)
+    if args.hedge:
+        if not 0 < args.hedge_percentile < 100 or not 0 < args.hedge_budget <= 1:
+            raise ValueError("--hedge-percentile应在0到100之间，--hedge-budget应在0到1之间")
+        translate_scheduler.hedger = translate_scheduler.Hedger(args.hedge_percentile, args.hedge_budget,
+                                                                concurrency=concurrency)
+
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='Excel文件自动翻译工具')
@@ -941,12 +2377,34 @@ def main():
     parser.add_argument('--zh2en', type=str, help='中文翻译成英文的列（如A,B,C等）')
     parser.add_argument('--en2zh', type=str, help='英文翻译成中文的列（如A,B,C等）')
     parser.add_argument('--api', type=int, choices=[1, 2, 3, 4], help='翻译API选择：1=MyMemory, 2=Google, 3=百度, 4=DeepSeek-V3')
+    parser.add_argument('--apis', type=str, help='同时使用多个翻译API，如 4,1（各API按自己的速率分担翻译任务，某个API出错时由其他API接替）')
+    parser.add_argument('--api-rates', type=str, help='各API的速率上限（每秒请求数），如 4=5,3=1')
+    parser.add_argument('--max-retries', type=int, default=3, help='限流、超时和服务端错误的最大重试次数（默认3）')
+    parser.add_argument('--hedge', action='store_true', help='启用请求对冲：批次耗时过长时再发一个相同请求，先返回的生效')
+    parser.add_argument('--hedge-percentile', type=float, default=95, help='触发对冲的耗时分位数（默认95）')
+    parser.add_argument('--hedge-budget', type=float, default=0.1, help='对冲请求占总请求数的比例上限（默认0.1）')
     parser.add_argument('--batch', type=int, default=10, help='批量翻译大小')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'每个翻译API同时进行的批量请求数（默认{DEFAULT_WORKERS}），请求速率仍受--api-rates限制')
+    parser.add_argument('--max-workers', type=int, help='根据耗时和限流自动调整并发数的上限（指定后启用自动调整，--workers为初始并发数）')
+    parser.add_argument('--min-workers', type=int, default=1, help='自动调整并发数的下限（默认1）')
     parser.add_argument('--baidu-appid', type=str, help='百度翻译API的APP ID')
     parser.add_argument('--baidu-key', type=str, help='百度翻译API的密钥')
     parser.add_argument('--deepseek-key', type=str, help='DeepSeek-V3 API的密钥')
     parser.add_argument('--deepseek-url', type=str, help='DeepSeek-V3 API的URL地址')
+    parser.add_argument('--glossary', type=str, help='DeepSeek-V3使用的术语表CSV文件（两列：中文,英文）')
     parser.add_argument('--use-csv', action='store_true', help='使用CSV中间格式加速翻译(适合大文件)')
+    parser.add_argument('--pipeline', action='store_true', help='流水线模式：读取、翻译和写入同时进行（适合大文件，只支持xlsx）')
+    parser.add_argument('--retry-failed', action='store_true', help='只重试上次未能翻译的文本（记录在_failed.json中），把译文补进已生成的翻译结果')
+    parser.add_argument('--plan', action='store_true', help='只估算单元格数、唯一文本数、请求数、token数、耗时和费用，不调用翻译API')
+    parser.add_argument('--coverage', type=float, help='单元格覆盖率达到该百分比（如90）时停止翻译，输出部分结果')
+    parser.add_argument('--max-texts', type=int, help='每个翻译方向只翻译出现次数最多的N个唯一文本，输出部分结果')
+    parser.add_argument('--time-budget', type=float, help='翻译时间上限（分钟），到时停止翻译，输出部分结果')
+    parser.add_argument('--cost-budget', type=float, help='DeepSeek估算费用上限（美元），达到时停止翻译，输出部分结果')
+    parser.add_argument('--incremental', action='store_true', help='增量翻译：复用上次生成的_translated文件中原文未变的译文，只翻译新增或修改的单元格')
+    parser.add_argument('--key-column', type=str, help='增量翻译时用于匹配行的键列（如A），默认按原文内容匹配')
+    parser.add_argument('--cancel-grace', type=float, default=translate_scheduler.Cancellation.DEFAULT_GRACE,
+                        help=f'Ctrl-C后等待已发出请求完成的秒数（默认{translate_scheduler.Cancellation.DEFAULT_GRACE}），之后输出部分结果')
+    parser.add_argument('--profile-memory', action='store_true', help='记录各阶段的内存峰值、RSS和新增内存最多的代码位置（会明显变慢）')
     parser.add_argument('--gen-config', action='store_true', help='生成配置文件模板')
     
     # 解析命令行参数
@@ -987,6 +2445,22 @@ def main():
     
     # 获取配置
     config = load_config()
+    if args.workers < 1:
+        print("错误：--workers必须大于0")
+        return
+    translate_scheduler.retry_policy.max_retries = max(0, args.max_retries)
+    # 对冲线程池按所有API、两个方向（流水线模式同时进行）的最大并发请求数分配，请求不会排队
+    try:
+        api_count = len(parse_api_choices(args.apis)) if args.apis else 1
+    except ValueError:
+        api_count = 1
+    try:
+        configure_scheduler(args, max(args.workers, args.max_workers or 0) * api_count * 2)
+    except ValueError as e:
+        print(f"错误：{e}")
+        return
+    
+    translate_scheduler.cancellation.grace = args.cancel_grace
     
     # 如果指定了交互式模式或没有提供任何参数，则进入交互模式
     if args.interactive or len(sys.argv) == 1:
@@ -998,70 +2472,36 @@ def main():
             parser.print_help()
             return
         
-        if not args.zh2en and not args.en2zh:
+        if not args.zh2en and not args.en2zh and not args.retry_failed:
             print("错误：请至少指定一个翻译方向（--zh2en或--en2zh）")
             parser.print_help()
             return
         
-        # 初始化翻译器
-        translators = {}
-        api_choice = args.api if args.api else 1
-        
+        # 初始化翻译器（--apis可同时使用多个API）
         try:
-            if api_choice == 1:  # MyMemory翻译
-                translators['zh_to_en'] = MyMemoryTranslator(source='zh-CN', target='en-GB')
-                translators['en_to_zh'] = MyMemoryTranslator(source='en-GB', target='zh-CN')
-            elif api_choice == 2:  # Google翻译
-                translators['zh_to_en'] = GoogleTranslator(source='zh-CN', target='en')
-                translators['en_to_zh'] = GoogleTranslator(source='en', target='zh-CN')
-            elif api_choice == 3:  # 百度翻译
-                # 优先使用命令行参数，其次使用配置
-                baidu_appid = args.baidu_appid or config['baidu_appid']
-                baidu_key = args.baidu_key or config['baidu_key']
-                
-                if not baidu_appid or not baidu_key:
-                    print("错误：使用百度翻译API需要提供APP ID和密钥")
-                    print("您可以通过命令行参数、环境变量或配置文件提供")
-                    return
-                
-                translators['zh_to_en'] = BaiduTranslator(
-                    appid=baidu_appid,
-                    appkey=baidu_key,
-                    source='zh', 
-                    target='en'
-                )
-                translators['en_to_zh'] = BaiduTranslator(
-                    appid=baidu_appid,
-                    appkey=baidu_key,
-                    source='en',
-                    target='zh'
-                )
-            elif api_choice == 4:  # DeepSeek-V3
-                # 优先使用命令行参数，其次使用配置
-                deepseek_key = args.deepseek_key or config['deepseek_key']
-                deepseek_url = args.deepseek_url or config['deepseek_url']
-                
-                if not deepseek_key:
-                    print("错误：使用DeepSeek-V3需要提供API密钥")
-                    print("您可以通过命令行参数、环境变量或配置文件提供")
-                    return
-                
-                translators['zh_to_en'] = DeepSeekTranslator(
-                    source='zh-CN', 
-                    target='en',
-                    api_key=deepseek_key,
-                    api_url=deepseek_url
-                )
-                translators['en_to_zh'] = DeepSeekTranslator(
-                    source='en', 
-                    target='zh-CN',
-                    api_key=deepseek_key,
-                    api_url=deepseek_url
-                )
+            api_choices = parse_api_choices(args.apis) if args.apis else [args.api if args.api else 1]
+            translator_pairs = [
+                (api_choice, create_translator_pair(api_choice, config, args))
+                for api_choice in api_choices
+            ]
+            translators = combine_translators(translator_pairs, parse_api_rates(args.api_rates), args.workers)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return
         except Exception as e:
             print(f"初始化翻译API失败: {e}")
             return
         
+        # Ctrl-C后不再发出新的请求，等待已发出的请求完成后输出部分结果
+        translate_scheduler.cancellation.install()
+        if args.profile_memory:
+            memory_profile.profiler.start()
+        
+        # 重试上次未能翻译的文本，列和方向记录在重试队列中
+        if args.retry_failed:
+            retry_failed_texts(args.file, translators, args.batch, args.workers)
+            return
+        
         # 解析列参数
         zh_to_en_indices = []
         en_to_zh_indices = []
@@ -1084,25 +2524,66 @@ def main():
                     print(f"错误：无效的列名 '{col}'")
                     return
         
+        key_index = None
+        if args.key_column:
+            try:
+                key_index = column_letter_to_index(args.key_column.strip())
+            except:
+                print(f"错误：无效的列名 '{args.key_column}'")
+                return
+        
         # 检查文件是否太大，推荐使用CSV模式
         try:
             file_size_mb = os.path.getsize(args.file) / (1024 * 1024)
-            if file_size_mb > 50 and not args.use_csv:
+            if file_size_mb > 50 and not args.use_csv and not args.pipeline and not args.incremental and not args.plan:
                 print(f"警告：文件大小为 {file_size_mb:.1f}MB，建议使用CSV模式处理大文件")
                 use_csv = input("是否使用CSV模式处理？(y/n): ").strip().lower() == 'y'
             else:
                 use_csv = args.use_csv
         except:
             use_csv = args.use_csv
+        budget = None
+        if args.coverage is not None or args.max_texts is not None or args.time_budget is not None \
+                or args.cost_budget is not None:
+            budget = TranslationBudget(
+                coverage=args.coverage / 100 if args.coverage is not None else None,
+                seconds=args.time_budget * 60 if args.time_budget is not None else None,
+                cost=args.cost_budget,
+                max_texts=args.max_texts
+            )
+        if args.plan:
+            plan_translation(args.file, translators, zh_to_en_indices, en_to_zh_indices, args.batch, args.workers,
+                             args.incremental, key_index, budget)
+            return
+        
+        use_pipeline = args.pipeline
+        if (use_csv or use_pipeline) and args.incremental:
+            print("增量翻译只需翻译少量单元格，不使用CSV模式和流水线模式")
+            use_csv = use_pipeline = False
+        if use_pipeline and budget is not None:
+            # 流水线模式边读取边翻译，无法预先按出现次数排序
+            print("翻译预算需要先统计全部文本的出现次数，改用CSV模式")
+            use_csv, use_pipeline = True, False
         
         # 执行翻译
-        if use_csv:
+        if use_pipeline:
+            translate_pipelined(
+                args.file,
+                translators,
+                zh_to_en_indices,
+                en_to_zh_indices,
+                args.batch,
+                args.workers
+            )
+        elif use_csv:
             translate_via_csv(
                 args.file, 
                 translators, 
                 zh_to_en_indices, 
                 en_to_zh_indices, 
-                args.batch
+                args.batch,
+                args.workers,
+                budget=budget
             )
         else:
             translate_excel_file(
@@ -1110,77 +2591,109 @@ def main():
                 translators, 
                 zh_to_en_indices, 
                 en_to_zh_indices, 
-                args.batch
+                args.batch,
+                args.workers,
+                args.incremental,
+                key_index,
+                budget=budget
             )
 
 # 添加 DeepSeek 翻译器类
 class DeepSeekTranslator:
     """DeepSeek-V3 翻译器实现"""
     
-    def __init__(self, source='zh-CN', target='en', api_key=None, api_url=None):
+    def __init__(self, source='zh-CN', target='en', api_key=None, api_url=None, glossary=None):
         self.source = source
         self.target = target
         self.api_key = api_key
+        # 系统提示词只构建一次：所有请求的前缀逐字节相同，才能命中DeepSeek的上下文硬盘缓存
+        self.system_prompt = build_deepseek_system_prompt(source, target, glossary)
         # 根据官方文档修正URL
         base_url = api_url or "https://api.deepseek.com"
         # 确保URL末尾不包含斜杠，然后添加端点路径
         if base_url.endswith('/'):
             base_url = base_url[:-1]
         self.api_url = f"{base_url}/chat/completions"
+        # 复用HTTPS连接，连接池大小足够多个线程并发请求
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=DEEPSEEK_POOL_SIZE))
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=DEEPSEEK_POOL_SIZE))
+        # 累计的请求数和token用量（估算值和API返回的实际值），多个线程共用
+        self.usage = defaultdict(int)
+        self._usage_lock = threading.Lock()
+
+    def usage_snapshot(self):
+        """当前累计用量的副本"""
+        with self._usage_lock:
+            return dict(self.usage)
+
+    def _record_usage(self, text, usage):
+        """记录一次成功请求的估算token数和实际token数（包括缓存命中和未命中的输入token）"""
+        input_tokens = estimate_tokens(text)
+        with self._usage_lock:
+            self.usage['requests'] += 1
+            self.usage['estimated_prompt_tokens'] += estimate_tokens(self.system_prompt) + input_tokens
+            self.usage['estimated_completion_tokens'] += estimate_output_tokens(input_tokens, self.target)
+            self.usage['prompt_tokens'] += usage.get('prompt_tokens', 0)
+            self.usage['completion_tokens'] += usage.get('completion_tokens', 0)
+            self.usage['prompt_cache_hit_tokens'] += usage.get('prompt_cache_hit_tokens', 0)
+            self.usage['prompt_cache_miss_tokens'] += usage.get('prompt_cache_miss_tokens', 0)
         
     def translate(self, text):
-        """使用 DeepSeek API 翻译文本"""
+        """使用 DeepSeek API 翻译文本，请求失败时抛出异常（TranslationAPIError或requests的异常）"""
         if not text.strip():
             return ""
             
         source_lang = "中文" if "zh" in self.source else "英文"
         target_lang = "英文" if "en" in self.target else "中文"
         
-        try:
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            # 打印请求信息用于调试
-            print(f"\n正在请求DeepSeek API: {self.api_url}")
-            print(f"源语言: {source_lang}, 目标语言: {target_lang}")
-            print(f"API密钥前4位: {self.api_key[:4] if self.api_key and len(self.api_key) > 4 else '未提供'}")
-            
-            # 使用官方推荐的模型名称
-            payload = {
-                "model": "deepseek-chat",  # 根据文档，已全面升级为DeepSeek-V3
-                "messages": [
-                    {"role": "system", "content": f"你是一个专业翻译助手。请将下面的{source_lang}文本翻译成{target_lang}，只返回翻译结果，不要有任何解释或额外文字。"},
-                    {"role": "user", "content": text}
-                ],
-                "temperature": 0.3  # 使用较低的温度提高翻译一致性
-            }
-            
-            # 尝试调用API
-            try:
-                response = requests.post(self.api_url, headers=headers, json=payload)
-                print(f"API响应状态码: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    translation = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    return translation
-                else:
-                    print(f"翻译API错误 (代码: {response.status_code}): {response.text}")
-                    print(f"\n请检查以下内容:")
-                    print(f"1. API密钥是否正确")
-                    print(f"2. API URL是否正确 ({self.api_url})")
-                    print(f"3. 您的DeepSeek账户是否有效，以及是否有调用此API的权限")
-                    print(f"4. 网络连接是否正常")
-                    return text  # 失败时返回原文本
-            except Exception as e:
-                print(f"API请求出错: {str(e)}")
-                return text
-                
-        except Exception as e:
-            print(f"翻译过程中出错: {str(e)}")
-            return text  # 异常时返回原文本
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        # 打印请求信息用于调试
+        print(f"\n正在请求DeepSeek API: {self.api_url}")
+        print(f"源语言: {source_lang}, 目标语言: {target_lang}")
+        print(f"API密钥前4位: {self.api_key[:4] if self.api_key and len(self.api_key) > 4 else '未提供'}")
+        
+        # 使用官方推荐的模型名称
+        payload = {
+            "model": "deepseek-chat",  # 根据文档，已全面升级为DeepSeek-V3
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": text}
+            ],
+            "temperature": 0.3  # 使用较低的温度提高翻译一致性
+        }
+        
+        # 调用API，失败时抛出异常而不是返回原文，由调用方重试或记录为未翻译
+        response = self.session.post(self.api_url, headers=headers, json=payload, timeout=DEEPSEEK_TIMEOUT)
+        print(f"API响应状态码: {response.status_code}")
+        
+        if response.status_code != 200:
+            if response.status_code in (401, 403):
+                print(f"\n请检查以下内容:")
+                print(f"1. API密钥是否正确")
+                print(f"2. API URL是否正确 ({self.api_url})")
+                print(f"3. 您的DeepSeek账户是否有效，以及是否有调用此API的权限")
+            raise TranslationAPIError(
+                f"翻译API错误 (代码: {response.status_code}): {response.text[:200]}",
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+            )
+        
+        result = response.json()
+        translation = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+        if not translation:
+            raise TranslationAPIError("翻译API返回了空结果", status_code=response.status_code)
+        self._record_usage(text, result.get("usage") or {})
+        return translation
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    try:
+        main()
+    except KeyboardInterrupt:
+        # 第二次Ctrl-C：立即退出，不写入输出文件
+        print("\n已中断")
+        sys.exit(130)
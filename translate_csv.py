@@ -10,9 +10,15 @@ import argparse
 import re
 import pandas as pd
 import csv
-import concurrent.futures
+from excel_cache import read_excel_cached
+import translate_scheduler
+from translate_scheduler import BatchScheduler, Provider, ProviderPool, limiter_for
+from translate_ai import API_RATE_LIMITS, translate_batch_or_individually, translate_batches
 import datetime
 
+# CSV模式下同时进行的批量请求数
+DEFAULT_WORKERS = 5
+
 def column_letter_to_index(column_letter):
     """将列字母转换为索引（A=0, B=1, ...）"""
     return string.ascii_uppercase.index(column_letter.upper())
@@ -21,9 +27,16 @@ def index_to_column_letter(index):
     """将索引转换为列字母（0=A, 1=B, ...）"""
     return string.ascii_uppercase[index]
 
+def default_rate(translator):
+    """翻译器对应API的默认速率上限（每秒请求数），与translate_ai.py相同"""
+    for api_class, api_choice in ((MyMemoryTranslator, 1), (GoogleTranslator, 2), (BaiduTranslator, 3)):
+        if isinstance(translator, api_class):
+            return API_RATE_LIMITS[api_choice]
+    return None
+
 # 批量翻译函数
 def batch_translate(translator, texts, batch_size=10, delay=1):
-    """批量翻译文本，减少API调用次数"""
+    """批量翻译文本，减少API调用次数；未能翻译的文本返回空字符串"""
     if not texts:
         return []
         
@@ -31,58 +44,33 @@ def batch_translate(translator, texts, batch_size=10, delay=1):
     unique_texts = list(set(texts))
     print(f"需要翻译 {len(texts)} 个单元格，去重后 {len(unique_texts)} 个唯一文本")
     
-    # 创建翻译缓存
-    translation_cache = {}
-    results = []
-    
-    # 将文本分批处理
+    # 将文本分批处理，请求经过translate_ai.py的重试策略、熔断器和限速器
     batches = [unique_texts[i:i+batch_size] for i in range(0, len(unique_texts), batch_size)]
-    
-    for i, batch in enumerate(tqdm(batches, desc="批次进度")):
-        try:
-            # 将多个文本合并为一个长文本，用特殊分隔符隔开
-            combined_text = " ||| ".join(batch)
-            
-            # 翻译合并后的文本
-            translated = translator.translate(combined_text)
-            
-            # 根据同样的分隔符拆分翻译结果
-            translated_parts = translated.split(" ||| ")
-            
-            # 如果翻译结果数量与原文本不符，则逐个翻译
-            if len(translated_parts) != len(batch):
-                print(f"\n批量翻译结果异常，切换为逐个翻译...")
-                for text in batch:
-                    try:
-                        trans = translator.translate(text)
-                        translation_cache[text] = trans
-                    except Exception as e:
-                        print(f"翻译失败: {text}, 错误: {str(e)}")
-                        translation_cache[text] = text  # 失败时用原文
-            else:
-                # 缓存翻译结果
-                for j, text in enumerate(batch):
-                    translation_cache[text] = translated_parts[j]
-            
-            # 批次之间添加延迟，避免API限制
-            if i < len(batches) - 1 and delay > 0:
-                time.sleep(delay)
-                
-        except Exception as e:
-            print(f"\n批次翻译失败，切换为逐个翻译...")
-            for text in batch:
-                try:
-                    trans = translator.translate(text)
-                    translation_cache[text] = trans
-                except Exception as e:
-                    print(f"翻译失败: {text}, 错误: {str(e)}")
-                    translation_cache[text] = text  # 失败时用原文
+    translation_cache, failed = translate_batches(translator, batches, delay)
+    if failed:
+        print(f"{len(failed)} 个文本未能翻译，对应单元格留空")
     
     # 根据原始顺序返回翻译结果
-    for text in texts:
-        results.append(translation_cache.get(text, text))
-    
-    return results
+    return [translation_cache.get(text, "") for text in texts]
+
+def concurrent_batch_translate(translator, texts, batch_size=10, workers=DEFAULT_WORKERS):
+    """
+    多线程并发翻译：唯一文本按batch_size分批，workers个线程从同一队列取批次，
+    每个批次合并为一次请求，返回{原文: 译文}（未能翻译的文本不在其中）
+
+    请求与translate_ai.py相同，经过重试策略、熔断器和限速器（未设置速率时使用该API的默认速率）
+    """
+    batches = [texts[i:i+batch_size] for i in range(0, len(texts), batch_size)]
+    start_time = time.time()
+    rate = None if limiter_for(translator).max_rate else default_rate(translator)
+    provider = Provider(type(translator).__name__, translator, rate, workers=min(workers, max(len(batches), 1)))
+    scheduler = BatchScheduler(ProviderPool([provider]), translate_batch_or_individually, desc="翻译批次")
+    translations, failed = scheduler.run(batches)
+    if provider.concurrency is not None:
+        scheduler.print_stats(time.time() - start_time)
+    if failed:
+        print(f"{len(failed)} 个文本未能翻译，对应单元格留空")
+    return translations
 
 def display_header():
     """显示应用程序标题"""
@@ -306,7 +294,7 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
     print(f"\n正在加载 {os.path.basename(input_path)}...")
     
     # 使用pandas读取Excel文件，而不是openpyxl，可以更方便地处理列的插入
-    df = pd.read_excel(input_path)
+    df = read_excel_cached(input_path)
     max_row, max_col = df.shape
     
     print(f"文件加载完成，共有 {max_row} 行，{max_col} 列")
@@ -426,7 +414,10 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
     elapsed_time = end_time - start_time
     elapsed_str = str(datetime.timedelta(seconds=int(elapsed_time)))
     
-    print(f'\n翻译完成，已生成 {output_path}')
+    if translate_scheduler.cancellation.requested():
+        print(f'\n翻译已取消，已完成的译文已写入 {output_path}，其余单元格留空')
+    else:
+        print(f'\n翻译完成，已生成 {output_path}')
     print(f'总耗时: {elapsed_str} (时:分:秒)')
     
     # 输出结果总结
@@ -439,7 +430,7 @@ def translate_excel_file(input_path, translators, zh_to_en_indices, en_to_zh_ind
     
     return output_path
 
-def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10):
+def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indices, batch_size=10, workers=DEFAULT_WORKERS):
     """通过CSV中间格式执行Excel文件翻译，提高大文件处理效率"""
     # 记录开始时间
     start_time = time.time()
@@ -453,7 +444,7 @@ def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indice
     print(f"\n正在加载 {os.path.basename(input_path)} 并转换为CSV...")
     
     # 使用pandas读取Excel文件
-    df = pd.read_excel(input_path)
+    df = read_excel_cached(input_path)
     
     # 收集所有需要翻译的文本
     zh_to_en_columns = []
@@ -494,66 +485,16 @@ def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indice
     
     print(f"需要翻译的唯一文本: 中->英 {len(zh_to_en_texts)}个, 英->中 {len(en_to_zh_texts)}个")
     
-    # 批量翻译
+    # 批量翻译：多个线程并发发送批量请求，结果按原文对应
     if zh_to_en_texts:
         print("\n执行中文→英文批量翻译...")
-        # 将字典的键转为列表以便批量翻译
-        texts_to_translate = list(zh_to_en_texts.keys())
-        
-        # 使用线程池进行并行翻译以提高效率
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # 分批处理文本
-            batches = [texts_to_translate[i:i+batch_size] for i in range(0, len(texts_to_translate), batch_size)]
-            
-            # 创建翻译任务
-            future_to_batch = {
-                executor.submit(batch_translate, translators['zh_to_en'], batch, 1, 0.5): i 
-                for i, batch in enumerate(batches)
-            }
-            
-            # 收集结果
-            batch_idx = 0
-            for future in tqdm(concurrent.futures.as_completed(future_to_batch), total=len(batches), desc="翻译批次"):
-                batch_idx = future_to_batch[future]
-                try:
-                    translations = future.result()
-                    # 更新翻译结果字典
-                    start_idx = batch_idx * batch_size
-                    for i, translation in enumerate(translations):
-                        if start_idx + i < len(texts_to_translate):
-                            zh_to_en_texts[texts_to_translate[start_idx + i]] = translation
-                except Exception as e:
-                    print(f"批次 {batch_idx} 翻译出错: {e}")
+        zh_to_en_texts.update(concurrent_batch_translate(
+            translators['zh_to_en'], list(zh_to_en_texts.keys()), batch_size, workers))
     
     if en_to_zh_texts:
         print("\n执行英文→中文批量翻译...")
-        # 将字典的键转为列表以便批量翻译
-        texts_to_translate = list(en_to_zh_texts.keys())
-        
-        # 使用线程池进行并行翻译以提高效率
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            # 分批处理文本
-            batches = [texts_to_translate[i:i+batch_size] for i in range(0, len(texts_to_translate), batch_size)]
-            
-            # 创建翻译任务
-            future_to_batch = {
-                executor.submit(batch_translate, translators['en_to_zh'], batch, 1, 0.5): i 
-                for i, batch in enumerate(batches)
-            }
-            
-            # 收集结果
-            batch_idx = 0
-            for future in tqdm(concurrent.futures.as_completed(future_to_batch), total=len(batches), desc="翻译批次"):
-                batch_idx = future_to_batch[future]
-                try:
-                    translations = future.result()
-                    # 更新翻译结果字典
-                    start_idx = batch_idx * batch_size
-                    for i, translation in enumerate(translations):
-                        if start_idx + i < len(texts_to_translate):
-                            en_to_zh_texts[texts_to_translate[start_idx + i]] = translation
-                except Exception as e:
-                    print(f"批次 {batch_idx} 翻译出错: {e}")
+        en_to_zh_texts.update(concurrent_batch_translate(
+            translators['en_to_zh'], list(en_to_zh_texts.keys()), batch_size, workers))
     
     # 将翻译结果插入到DataFrame中，紧跟在原列后面
     print("\n将翻译结果添加到数据...")
@@ -595,7 +536,10 @@ def translate_via_csv(input_path, translators, zh_to_en_indices, en_to_zh_indice
     elapsed_time = end_time - start_time
     elapsed_str = str(datetime.timedelta(seconds=int(elapsed_time)))
     
-    print(f'\n翻译完成，已生成 {output_path}')
+    if translate_scheduler.cancellation.requested():
+        print(f'\n翻译已取消，已完成的译文已写入 {output_path}，其余单元格留空')
+    else:
+        print(f'\n翻译完成，已生成 {output_path}')
     print(f'总耗时: {elapsed_str} (时:分:秒)')
     
     # 输出结果总结
@@ -636,23 +580,28 @@ def interactive_mode():
         # 询问是否使用CSV中间格式
         use_csv = input("\n是否使用CSV中间格式加速翻译(适合大文件)？(y/n): ").strip().lower() == 'y'
         
-        # 执行翻译
-        if use_csv:
-            output_path = translate_via_csv(
-                input_path, 
-                translators, 
-                zh_to_en_indices, 
-                en_to_zh_indices, 
-                batch_size
-            )
-        else:
-            output_path = translate_excel_file(
-                input_path, 
-                translators, 
-                zh_to_en_indices, 
-                en_to_zh_indices, 
-                batch_size
-            )
+        # 翻译期间Ctrl-C后不再发出新的请求，等待已发出的请求完成后输出部分结果
+        translate_scheduler.cancellation.install()
+        try:
+            # 执行翻译
+            if use_csv:
+                output_path = translate_via_csv(
+                    input_path, 
+                    translators, 
+                    zh_to_en_indices, 
+                    en_to_zh_indices, 
+                    batch_size
+                )
+            else:
+                output_path = translate_excel_file(
+                    input_path, 
+                    translators, 
+                    zh_to_en_indices, 
+                    en_to_zh_indices, 
+                    batch_size
+                )
+        finally:
+            translate_scheduler.cancellation.uninstall()
 
         print("\n感谢使用Excel自动翻译工具！")
         
@@ -690,13 +639,28 @@ def main():
     parser.add_argument('--en2zh', type=str, help='英文翻译成中文的列（如A,B,C等）')
     parser.add_argument('--api', type=int, choices=[1, 2, 3], help='翻译API选择：1=MyMemory, 2=Google, 3=百度')
     parser.add_argument('--batch', type=int, default=10, help='批量翻译大小')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'CSV模式下同时进行的批量请求数（默认{DEFAULT_WORKERS}）')
+    parser.add_argument('--max-workers', type=int, help='根据耗时和错误自动调整并发数的上限（指定后启用自动调整，--workers为初始并发数）')
+    parser.add_argument('--min-workers', type=int, default=1, help='自动调整并发数的下限（默认1）')
     parser.add_argument('--baidu-appid', type=str, help='百度翻译API的APP ID')
     parser.add_argument('--baidu-key', type=str, help='百度翻译API的密钥')
     parser.add_argument('--use-csv', action='store_true', help='使用CSV中间格式加速翻译(适合大文件)')
+    parser.add_argument('--cancel-grace', type=float, default=translate_scheduler.Cancellation.DEFAULT_GRACE,
+                        help=f'Ctrl-C后等待已发出请求完成的秒数（默认{translate_scheduler.Cancellation.DEFAULT_GRACE}），之后输出部分结果')
     
     # 解析命令行参数
     args = parser.parse_args()
     
+    if args.workers < 1:
+        print("错误：--workers必须大于0")
+        return
+    if args.max_workers is not None:
+        if not 1 <= args.min_workers <= args.max_workers:
+            print("错误：--min-workers应大于0且不超过--max-workers")
+            return
+        translate_scheduler.concurrency_bounds = (args.min_workers, args.max_workers)
+    translate_scheduler.cancellation.grace = args.cancel_grace
+    
     # 如果指定了交互式模式或没有提供任何参数，则进入交互模式
     if args.interactive or len(sys.argv) == 1:
         interactive_mode()
@@ -766,6 +730,9 @@ def main():
                     print(f"错误：无效的列名 '{col}'")
                     return
         
+        # Ctrl-C后不再发出新的请求，等待已发出的请求完成后输出部分结果
+        translate_scheduler.cancellation.install()
+        
         # 执行翻译
         if args.use_csv:
             translate_via_csv(
@@ -773,7 +740,8 @@ def main():
                 translators, 
                 zh_to_en_indices, 
                 en_to_zh_indices, 
-                args.batch
+                args.batch,
+                args.workers
             )
         else:
             translate_excel_file(
@@ -0,0 +1,955 @@
+import concurrent.futures
+import email.utils
+import random
+import signal
+import threading
+import time
+import weakref
+from collections import deque
+import requests
+from deep_translator.exceptions import BaiduAPIerror, RequestError, ServerException, TooManyRequests
+from tqdm import tqdm
+
+# 熔断器默认参数：连续失败多少次后打开，打开后多少秒允许一次探测请求
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# 可以重试的HTTP状态码（限流、超时和服务端临时错误）
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# deep_translator的ServerException只保留错误信息，按信息判断是否可以重试
+RETRYABLE_SERVER_ERRORS = {'ERR_TOO_MANY_REQUESTS', 'ERR_INTERNAL_SERVER_ERROR', 'ERR_SERVICE_NOT_AVAIBLE', 'API server error'}
+
+# 百度翻译可以重试的错误信息（54003访问频率受限、52001请求超时、52002系统错误）
+BAIDU_RETRYABLE_ERRORS = ('Invalid Access Limit', 'TIMEOUT', 'SYSTEM ERROR')
+
+class TranslationAPIError(Exception):
+    """翻译API返回错误（非200状态码或无法解析的响应）"""
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        # 服务端要求的等待秒数（Retry-After响应头）
+        self.retry_after = retry_after
+
+def parse_retry_after(value):
+    """解析Retry-After响应头（秒数或HTTP日期），返回等待秒数，无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_time = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_time.timestamp() - time.time())
+
+class CircuitOpenError(Exception):
+    """熔断器打开，暂停调用该翻译服务"""
+
+class CircuitBreaker:
+    """
+    翻译服务熔断器
+
+    连续失败达到阈值后打开，打开期间不再调用该服务；经过reset_timeout秒后进入半开状态，
+    只放行一个探测请求：成功则关闭熔断器恢复正常，失败则重新打开。
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_in(self):
+        """距离允许下一次请求还有多少秒，0表示现在就可以请求"""
+        with self._lock:
+            if self.state == 'closed':
+                return 0
+            if self.state == 'half_open':
+                # 探测请求进行中时稍后再检查
+                return 1 if self._probe_in_flight else 0
+            return max(0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def available(self):
+        """现在是否可以请求（不占用半开状态的探测名额）"""
+        return self.retry_in() == 0
+
+    def allow(self):
+        """申请发出一个请求；半开状态下只有第一个申请者获得探测名额"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                print(f"\n{self.name} 已恢复，继续翻译")
+            self.state = 'closed'
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.open_count += 1
+                self._probe_in_flight = False
+                print(f"\n{self.name} 连续失败 {self.failures} 次，暂停调用 {self.reset_timeout} 秒")
+
+class RateLimiter:
+    """
+    令牌桶限速器：平均每秒最多发出rate个请求
+
+    max_rate为None时不限速。同一个翻译器的所有线程共用一个限速器。
+    收到限流响应（429）时暂停发出请求并把速率减半，之后每次成功逐步恢复到max_rate，
+    这样可以贴近服务端的真实限制运行，而不必预先设置一个远低于限制的速率。
+    """
+
+    # 限流后速率最低降到max_rate的多少
+    MIN_RATE_FRACTION = 0.05
+    # 每次成功恢复max_rate的多少
+    RECOVERY_FRACTION = 0.05
+
+    def __init__(self, rate=None, burst=1):
+        self.burst = max(1, burst)
+        self.set_rate(rate)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self.throttle_count = 0
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """设置速率上限（每秒请求数），None表示不限速"""
+        self.max_rate = rate or None
+        self.rate = self.max_rate
+
+    def acquire(self):
+        """等待直到可以发出下一个请求"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, pause):
+        """收到限流响应：所有线程暂停pause秒，速率减半"""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + pause)
+            self.throttle_count += 1
+            if self.max_rate:
+                self.rate = max(self.max_rate * self.MIN_RATE_FRACTION, self.rate / 2)
+            # 暂停结束后重新积累令牌，避免所有线程同时发出请求
+            self._tokens = 0.0
+            self._updated = max(now, self._paused_until)
+
+    def record_success(self):
+        """请求成功，速率逐步恢复"""
+        if self.max_rate and self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.RECOVERY_FRACTION)
+
+class RetryPolicy:
+    """
+    翻译请求的重试策略
+
+    只重试可以恢复的错误（限流、服务端临时错误、超时和连接失败）。等待时间优先使用服务端给出的
+    Retry-After，否则按指数退避（base_delay * 2^重试次数，不超过max_delay）并加随机抖动，
+    避免多个线程同时重试。限流错误还会通知限速器暂停并降低速率。
+    """
+
+    def __init__(self, max_retries=3, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def classify(self, error):
+        """
+        判断错误是否可以重试
+
+        返回:
+        (是否可以重试, 服务端要求的等待秒数或None, 是否为限流错误)
+        """
+        if isinstance(error, TranslationAPIError):
+            status = error.status_code
+            return status in RETRYABLE_STATUS_CODES, error.retry_after, status == 429
+        if isinstance(error, TooManyRequests):
+            return True, None, True
+        if isinstance(error, ServerException):
+            message = str(error)
+            return message in RETRYABLE_SERVER_ERRORS, None, message == 'ERR_TOO_MANY_REQUESTS'
+        if isinstance(error, BaiduAPIerror):
+            throttled = 'Access Limit' in error.api_message
+            return any(m in error.api_message for m in BAIDU_RETRYABLE_ERRORS), None, throttled
+        if isinstance(error, (RequestError, requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+            return True, None, False
+        return False, None, False
+
+    def backoff(self, attempt, retry_after=None):
+        """第attempt次重试（从0开始）前的等待秒数"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        # 全抖动：在[delay/2, delay]之间随机
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, func, limiter=None):
+        """调用func()，可以重试的错误按策略等待后重试，重试次数用完或不可重试时抛出最后的异常"""
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                result = func()
+            except Exception as e:
+                retryable, retry_after, throttled = self.classify(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                if throttled and limiter is not None:
+                    limiter.throttle(delay)
+                else:
+                    time.sleep(delay)
+                continue
+            if limiter is not None:
+                limiter.record_success()
+            return result
+
+# 所有翻译请求共用的重试策略，可通过命令行参数修改重试次数
+retry_policy = RetryPolicy()
+
+# 每个翻译器实例对应一个熔断器和一个限速器，在所有线程中共用
+_breakers = weakref.WeakKeyDictionary()
+_limiters = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+
+def _registry_get(registry, translator, factory):
+    with _registry_lock:
+        value = registry.get(translator)
+        if value is None:
+            value = factory()
+            registry[translator] = value
+        return value
+
+def breaker_for(translator):
+    """获取翻译器对应的熔断器"""
+    return _registry_get(_breakers, translator, lambda: CircuitBreaker(type(translator).__name__))
+
+def limiter_for(translator):
+    """获取翻译器对应的限速器（默认不限速，通过set_rate设置速率）"""
+    return _registry_get(_limiters, translator, RateLimiter)
+
+def call_translator(translator, text):
+    """
+    通过熔断器、限速器和重试策略调用翻译器翻译一段文本
+
+    熔断器打开时抛出CircuitOpenError，不发出请求；重试用完后的失败计入熔断器一次
+    """
+    breaker = breaker_for(translator)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} 暂停调用中")
+    try:
+        result = retry_policy.call(lambda: translator.translate(text), limiter_for(translator))
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
+
+class LatencyTracker:
+    """记录最近的请求耗时，用于计算分位数"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+class Hedger:
+    """
+    对冲请求
+
+    批次请求的耗时超过该翻译器最近耗时的指定分位数时，再发出一个相同的请求（发给同一服务或备用服务），
+    先返回的成功结果生效，另一个请求如果还没开始就取消，已经发出的则丢弃其结果。
+    对冲请求数不超过总请求数的budget比例，避免服务整体变慢时成倍增加负载。
+    concurrency为同时进行的批次请求数上限（所有服务和方向合计），线程池按每个请求最多一个对冲请求分配线程，
+    请求不会在线程池中排队；耗时从请求实际开始时计算。
+    """
+
+    def __init__(self, percentile=95, budget=0.1, min_samples=20, concurrency=8):
+        self.percentile = percentile
+        self.budget = budget
+        # 样本数不足时不对冲，避免用不可靠的分位数触发
+        self.min_samples = min_samples
+        self._executor = concurrent.futures.ThreadPoolExecutor(2 * concurrency, thread_name_prefix='hedge')
+        self._trackers = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.cancelled = 0
+        self.discarded = 0
+
+    def _tracker(self, translator):
+        with self._lock:
+            tracker = self._trackers.get(translator)
+            if tracker is None:
+                tracker = self._trackers[translator] = LatencyTracker()
+            return tracker
+
+    def _reserve_hedge(self):
+        """在预算内占用一次对冲名额"""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+    @staticmethod
+    def _timed(func, translator, batch, started):
+        """执行请求，started记录实际开始的时间，返回(结果, 耗时)"""
+        started['time'] = time.monotonic()
+        started['event'].set()
+        result = func(translator, batch)
+        return result, time.monotonic() - started['time']
+
+    def call(self, func, translator, batch, hedge_translator=None):
+        """
+        调用func(translator, batch)，超过分位数耗时仍未返回时用func(hedge_translator, batch)对冲
+
+        hedge_translator为None时对冲请求发给同一个翻译器。两个请求都失败时抛出先失败的异常。
+        """
+        with self._lock:
+            self.calls += 1
+        tracker = self._tracker(translator)
+        threshold = tracker.percentile(self.percentile) if len(tracker) >= self.min_samples else None
+
+        started = {'event': threading.Event()}
+        primary = self._executor.submit(self._timed, func, translator, batch, started)
+        try:
+            if threshold is not None:
+                # 从主请求实际开始时计时
+                started['event'].wait()
+                threshold = max(0, threshold - (time.monotonic() - started['time']))
+            result, elapsed = primary.result(timeout=threshold)
+            tracker.add(elapsed)
+            return result
+        except concurrent.futures.TimeoutError:
+            pass
+
+        if not self._reserve_hedge():
+            result, elapsed = primary.result()
+            tracker.add(elapsed)
+            return result
+
+        hedge = self._executor.submit(self._timed, func, hedge_translator or translator, batch,
+                                      {'event': threading.Event()})
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    first_error = first_error or future.exception()
+                    continue
+                result, elapsed = future.result()
+                # 对冲请求先返回时，主请求的耗时至少是从它开始到现在的时间，同样计入样本
+                tracker.add(elapsed if future is primary else time.monotonic() - started['time'])
+                with self._lock:
+                    if future is hedge:
+                        self.hedge_wins += 1
+                    for other in pending:
+                        if other.cancel():
+                            self.cancelled += 1
+                        else:
+                            self.discarded += 1
+                return result
+        raise first_error
+
+    def print_stats(self):
+        if not self.calls:
+            return
+        print(f"请求对冲: 共 {self.calls} 个批次请求，对冲 {self.hedges} 次"
+              f"（{self.hedges / self.calls:.1%}，上限 {self.budget:.0%}，触发条件为耗时超过第{self.percentile:g}百分位），"
+              f"对冲请求先返回 {self.hedge_wins} 次，取消 {self.cancelled} 个、丢弃 {self.discarded} 个较慢的请求")
+
+# 请求对冲，默认关闭，通过命令行参数启用
+hedger = None
+
+class ConcurrencyController:
+    """
+    按加性增、乘性减（AIMD）自动调整一个翻译服务同时进行的请求数
+
+    每完成约一个并发数的成功请求，并发数加1；请求出错或遇到限流（429）时并发数减半，
+    每个文本的平均耗时超过基线的LATENCY_TOLERANCE倍时减为原来的3/4。基线是耗时的指数平均值出现过的最小值，
+    并缓慢上调以适应文本长度的变化。并发数限制在[min_limit, max_limit]之间，每次变化记录在history中。
+    """
+
+    # 每个文本的耗时超过基线多少倍视为服务变慢
+    LATENCY_TOLERANCE = 2.0
+    ERROR_DECREASE = 0.5
+    LATENCY_DECREASE = 0.75
+    # 耗时指数平均的权重
+    EWMA_WEIGHT = 0.2
+    # 基线每个样本最多上调的比例
+    BASELINE_DRIFT = 0.01
+    # 样本数不足时不按耗时调整
+    MIN_SAMPLES = 5
+
+    def __init__(self, name, initial, min_limit, max_limit):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.in_flight = 0
+        self.samples = 0
+        self.ewma = None
+        self.baseline = None
+        self._cooldown_until = 0.0
+        self._start = None
+        self._cond = threading.Condition()
+        # [(开始后的秒数, 并发数, 原因)]
+        self.history = []
+
+    @property
+    def current(self):
+        return int(self.limit)
+
+    def acquire(self):
+        """等待直到同时进行的请求数低于当前并发数"""
+        with self._cond:
+            if self._start is None:
+                self._start = time.monotonic()
+                self.history.append((0.0, self.current, "初始"))
+            while self.in_flight >= self.current:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, error=False, throttled=False):
+        """
+        请求结束
+
+        参数:
+        latency: 每个文本的平均耗时（秒），为None时（如请求未发出）不调整并发数
+        error: 请求是否失败
+        throttled: 请求期间是否遇到限流
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self._adjust(latency, error, throttled)
+            self._cond.notify_all()
+
+    def _adjust(self, latency, error, throttled):
+        now = time.monotonic()
+        self.samples += 1
+        self.ewma = latency if self.ewma is None else \
+            self.EWMA_WEIGHT * latency + (1 - self.EWMA_WEIGHT) * self.ewma
+        self.baseline = self.ewma if self.baseline is None else \
+            min(self.ewma, self.baseline * (1 + self.BASELINE_DRIFT))
+
+        if throttled or error:
+            self._decrease(now, self.ERROR_DECREASE, "限流" if throttled else "请求失败")
+        elif self.samples >= self.MIN_SAMPLES and latency > self.baseline * self.LATENCY_TOLERANCE:
+            self._decrease(now, self.LATENCY_DECREASE, "耗时升高")
+        elif self.limit < self.max_limit:
+            before = self.current
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if self.current != before:
+                self.history.append((now - self._start, self.current, "增加"))
+
+    def _decrease(self, now, factor, reason):
+        # 减小后，已经发出的请求还会陆续报告同样的问题，冷却期内不再重复减小
+        if now < self._cooldown_until:
+            return
+        before = self.current
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._cooldown_until = now + max(1.0, (self.ewma or 0) * before)
+        if self.current != before:
+            self.history.append((now - self._start, self.current, reason))
+
+    def describe_history(self, max_entries=20):
+        """并发数随时间的变化，如 '0s:3 → 4.2s:4 → 10.1s:2(限流)'"""
+        entries = self.history[-max_entries:]
+        parts = [f"{t:.1f}s:{limit}" + (f"({reason})" if reason not in ("初始", "增加") else "")
+                 for t, limit, reason in entries]
+        prefix = "… → " if len(self.history) > max_entries else ""
+        return prefix + " → ".join(parts)
+
+# 自动调整并发数的范围(最小, 最大)，为None时使用固定并发数；通过命令行参数启用
+concurrency_bounds = None
+
+class Provider:
+    """调度器中的一个翻译服务：翻译器实例、限速、并发数、每次取批次的容量，以及运行统计"""
+
+    def __init__(self, name, translator, rate=None, capacity=None, weigh=None, workers=1):
+        self.name = name
+        self.translator = translator
+        self.limiter = limiter_for(translator)
+        # 未指定速率时保留翻译器已有的限速设置
+        if rate is not None:
+            self.limiter.set_rate(rate)
+        self.breaker = breaker_for(translator)
+        self.breaker.name = name
+        # 每次最多合并的批次总量（如DeepSeek按估算的token数一次处理多个批次）；为None时每次只取一个批次
+        self.capacity = capacity
+        # 计算一组文本占用容量的函数，默认按字符数
+        self.weigh = weigh or (lambda texts: sum(len(t) for t in texts))
+        # 同时进行的请求数（工作线程数），请求速率仍受限速器控制
+        self.workers = max(1, workers)
+        # 启用自动调整时按最大并发数启动线程，由控制器决定实际同时进行的请求数
+        self.concurrency = None
+        if concurrency_bounds is not None:
+            min_workers, max_workers = concurrency_bounds
+            self.concurrency = ConcurrencyController(name, self.workers, min_workers, max_workers)
+            self.workers = self.concurrency.max_limit
+        self.batches = 0
+        self.texts = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def fits(self, count, weight, item_weight):
+        """已合并count个批次、占用weight时，能否再合并一个占用item_weight的批次（至少取一个批次）"""
+        return not count or bool(self.capacity and weight + item_weight <= self.capacity)
+
+    def group(self, batches):
+        """按调度器取批次的方式把批次合并为请求（用于估算请求数），返回每个请求的文本列表"""
+        requests = []
+        current = []
+        count = weight = 0
+        for batch in batches:
+            item_weight = self.weigh(batch)
+            if not self.fits(count, weight, item_weight):
+                requests.append(current)
+                current = []
+                count = weight = 0
+            current.extend(batch)
+            count += 1
+            weight += item_weight
+        if current:
+            requests.append(current)
+        return requests
+
+class ProviderPool:
+    """同时使用的多个翻译服务，代替单个翻译器传给batch_translate"""
+
+    def __init__(self, providers):
+        if not providers:
+            raise ValueError("至少需要一个翻译服务")
+        self.providers = list(providers)
+
+    @property
+    def names(self):
+        return [p.name for p in self.providers]
+
+class _WorkItem:
+    """队列中的一个批次，记录已经翻译失败过的翻译服务"""
+    __slots__ = ('texts', 'weights', 'failed_by')
+
+    def __init__(self, texts):
+        self.texts = texts
+        # 各翻译服务计算的容量占用，按服务名缓存
+        self.weights = {}
+        self.failed_by = set()
+
+    def weight(self, provider):
+        if provider.name not in self.weights:
+            self.weights[provider.name] = provider.weigh(self.texts)
+        return self.weights[provider.name]
+
+class Cancellation:
+    """
+    优雅取消
+
+    第一次Ctrl-C（或SIGTERM）后不再发出新的批次，已经发出的请求在宽限期内完成，已完成的译文照常写入输出；
+    超过宽限期时放弃还没有返回的请求，再按一次Ctrl-C立即中断（抛出KeyboardInterrupt）。
+    """
+
+    # 等待已发出请求完成的默认宽限期（秒）
+    DEFAULT_GRACE = 30
+
+    def __init__(self, grace=DEFAULT_GRACE):
+        self.grace = grace
+        self._event = threading.Event()
+        self._requested_at = None
+        self._previous_handlers = {}
+
+    def install(self):
+        """注册信号处理函数（只能在主线程中调用）"""
+        for signum in (signal.SIGINT, getattr(signal, 'SIGTERM', None)):
+            if signum is not None:
+                self._previous_handlers.setdefault(signum, signal.signal(signum, self._handle))
+
+    def uninstall(self):
+        """恢复注册前的信号处理函数（如交互模式翻译结束后，Ctrl-C重新可以直接退出）"""
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    def _handle(self, signum, frame):
+        if self._event.is_set():
+            raise KeyboardInterrupt
+        self.request()
+        tqdm.write(f"\n收到中断信号，不再发出新的请求，等待已发出的请求完成（最多 {self.grace:.0f} 秒），"
+                   f"已完成的译文会写入输出文件；再按一次Ctrl-C立即退出")
+
+    def request(self):
+        if not self._event.is_set():
+            self._requested_at = time.monotonic()
+            self._event.set()
+
+    def requested(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """等待取消，返回是否已取消"""
+        return self._event.wait(timeout)
+
+    def grace_expired(self):
+        return self._event.is_set() and time.monotonic() - self._requested_at >= self.grace
+
+# 当前进程的取消状态，命令行程序启动时注册信号处理
+cancellation = Cancellation()
+
+class BatchScheduler:
+    """
+    多翻译服务调度器
+
+    所有批次放入共享队列，每个翻译服务按其并发数启动工作线程，按各自的速率和容量从队列中取批次，
+    处理得快的服务自然会取走更多批次。某个服务翻译失败的批次放回队列，由还没有试过它的服务处理，
+    所有服务都失败的批次记为失败。熔断器打开的服务暂停取批次，其余服务接替。
+
+    run()一次翻译所有批次；流水线中可以用start()启动工作线程，边读取边submit()批次，
+    读取完毕后close()，再用join()等待所有批次完成。
+    取消（cancellation）后不再发出新的批次，队列中的批次和宽限期内没有返回的批次记为跳过。
+    """
+
+    def __init__(self, pool, translate_batch, show_progress=True, desc="多服务翻译进度", on_done=None, tracker=None):
+        """
+        参数:
+        pool: ProviderPool（只有一个翻译服务时即为单个翻译器的并发批量翻译）
+        translate_batch: 翻译一个批次的函数，调用方式为 translate_batch(translator, texts)，
+                         返回{原文: 译文}（未能翻译的文本不在其中），整批失败时抛出异常
+        show_progress: 是否显示进度条
+        desc: 进度条说明
+        on_done: 文本完成时的回调 on_done(results, failed, skipped)，results为{原文: 译文}，failed为翻译失败的文本列表，
+                 skipped为因取消没有翻译的文本列表（有tracker时交给tracker）；在调度器的锁内调用，应尽快返回。
+                 指定后结果只交给回调，不再汇总到run()/join()的返回值中
+        tracker: 翻译进度（如单元格覆盖率）和预算，需支持record(texts)、postfix()、should_stop()和skip(texts)；
+                 should_stop()为真时不再发出新的批次，队列中剩下的文本交给skip()
+        """
+        self.pool = pool
+        self.translate_batch = translate_batch
+        self.show_progress = show_progress
+        self.desc = desc
+        self.on_done = on_done
+        self.tracker = tracker
+        self._cond = threading.Condition()
+
+    def run(self, batches):
+        """
+        翻译所有批次
+
+        返回:
+        (results, failed) — results为{原文: 译文}，failed为所有服务都翻译失败的文本列表
+        """
+        self.start()
+        self.submit(batches)
+        self.close()
+        return self.join()
+
+    def start(self):
+        """启动工作线程，此后可以继续submit()批次"""
+        self._queue = deque()
+        # 失败后放回的批次单独存放，数量很少，取批次时优先检查
+        self._retry = []
+        self._pending = 0
+        self._closed = False
+        # 已经取走、还没有返回的批次；宽限期过后放弃等待时记为跳过
+        self._in_flight = set()
+        self._abandoned = False
+        self._results = {}
+        self._failed = []
+        self._provider_names = set(self.pool.names)
+        self._progress = tqdm(total=0, desc=self.desc, disable=not self.show_progress)
+
+        self._threads = [
+            threading.Thread(target=self._worker, args=(provider,), daemon=True)
+            for provider in self.pool.providers
+            for _ in range(provider.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, batches):
+        """加入新的批次"""
+        items = [_WorkItem(list(batch)) for batch in batches if batch]
+        with self._cond:
+            self._queue.extend(items)
+            self._pending += len(items)
+            self._progress.total += sum(len(item.texts) for item in items)
+            self._progress.refresh()
+            self._cond.notify_all()
+
+    def close(self):
+        """不再有新的批次，队列中的批次完成后工作线程退出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def join(self):
+        """等待所有批次完成，返回值同run()；取消后超过宽限期时不再等待还没有返回的请求"""
+        # 分段等待，保证主线程可以响应Ctrl-C
+        for thread in self._threads:
+            while thread.is_alive() and not cancellation.grace_expired():
+                thread.join(0.5)
+        with self._cond:
+            if any(thread.is_alive() for thread in self._threads):
+                self._abandon()
+            self._progress.close()
+            return dict(self._results), list(self._failed)
+
+    def _abandon(self):
+        """放弃等待还没有返回的请求，其文本记为跳过；之后返回的结果不再处理（调用时需持有锁）"""
+        self._skip_queued()
+        texts = [text for item in self._in_flight for text in item.texts]
+        self._in_flight.clear()
+        self._abandoned = True
+        self._pending = 0
+        self._skip(texts)
+        self._progress.write(f"宽限期已过，放弃 {len(texts)} 个还没有返回的文本")
+        self._cond.notify_all()
+
+    def _skip(self, texts):
+        """记录因预算或取消没有翻译的文本（调用时需持有锁）"""
+        if not texts:
+            return
+        if self.tracker is not None:
+            self.tracker.skip(texts)
+        elif self.on_done is not None:
+            self.on_done({}, [], texts)
+
+    def _finished(self):
+        """所有批次都已完成且不会再有新的批次（调用时需持有锁）"""
+        return self._pending == 0 and self._closed
+
+    def _take(self, provider):
+        """为翻译服务取下一组批次，没有可处理的批次时等待；全部完成时返回None"""
+        with self._cond:
+            while True:
+                if cancellation.requested() or (self.tracker is not None and self.tracker.should_stop()):
+                    self._skip_queued()
+                if self._finished() or self._abandoned:
+                    return None
+
+                items = []
+                weight = 0
+
+                def fits(item):
+                    return provider.fits(len(items), weight, item.weight(provider))
+
+                for item in list(self._retry):
+                    if provider.name in item.failed_by or not fits(item):
+                        continue
+                    self._retry.remove(item)
+                    items.append(item)
+                    weight += item.weight(provider)
+                while self._queue and fits(self._queue[0]):
+                    item = self._queue.popleft()
+                    items.append(item)
+                    weight += item.weight(provider)
+
+                if items:
+                    self._in_flight.update(items)
+                    return items
+                # 队列暂时为空，或剩下的批次都是本服务失败过的：等新的批次或其他服务处理完
+                self._cond.wait()
+
+    def _skip_queued(self):
+        """预算用完或取消：队列中还没有发出的批次不再翻译（调用时需持有锁）"""
+        items = list(self._queue) + self._retry
+        if not items:
+            return
+        self._queue.clear()
+        self._retry = []
+        self._pending -= len(items)
+        self._skip([text for item in items for text in item.texts])
+        self._cond.notify_all()
+
+    def _worker(self, provider):
+        while True:
+            # 熔断期间不取批次，由其他服务接替
+            wait = provider.breaker.retry_in()
+            if wait > 0:
+                with self._cond:
+                    if self._finished() or self._abandoned:
+                        return
+                    self._cond.wait(min(wait, 1))
+                continue
+
+            # 自动调整并发数时，同时进行的请求数由控制器限制
+            concurrency = provider.concurrency
+            if concurrency is not None:
+                concurrency.acquire()
+            items = self._take(provider)
+            if items is None:
+                if concurrency is not None:
+                    concurrency.release()
+                return
+
+            texts = [text for item in items for text in item.texts]
+            throttle_count = provider.limiter.throttle_count
+            start_time = time.time()
+            try:
+                if hedger is not None:
+                    translations = hedger.call(self.translate_batch, provider.translator, texts,
+                                               self._hedge_target(provider, texts))
+                else:
+                    translations = self.translate_batch(provider.translator, texts)
+            except CircuitOpenError:
+                if concurrency is not None:
+                    concurrency.release()
+                # 其他线程刚刚打开了熔断器，批次原样放回
+                self._give_back(items)
+                continue
+            except Exception as e:
+                elapsed = time.time() - start_time
+                if concurrency is not None:
+                    concurrency.release(elapsed / len(texts), True,
+                                        provider.limiter.throttle_count > throttle_count)
+                with self._cond:
+                    if self._abandoned:
+                        return
+                    provider.busy_time += elapsed
+                    provider.errors += 1
+                self._requeue(provider, items, e)
+                continue
+
+            missing = [text for text in texts if text not in translations]
+            if concurrency is not None:
+                concurrency.release((time.time() - start_time) / len(texts), len(missing) == len(texts),
+                                    provider.limiter.throttle_count > throttle_count)
+            with self._cond:
+                if self._abandoned:
+                    return
+                self._in_flight.difference_update(items)
+                provider.busy_time += time.time() - start_time
+                provider.batches += 1
+                provider.texts += len(texts) - len(missing)
+                done = {text: translations[text] for text in texts if text in translations}
+                if self.on_done is not None:
+                    self.on_done(done, [], [])
+                else:
+                    self._results.update(done)
+                self._pending -= len(items)
+                if self.tracker is not None:
+                    self.tracker.record(done)
+                    self._progress.set_postfix_str(self.tracker.postfix(), refresh=False)
+                self._progress.update(len(texts) - len(missing))
+                if missing:
+                    # 批次中个别文本没有翻译成功，作为新的批次交给其他服务
+                    item = _WorkItem(missing)
+                    item.failed_by.add(provider.name)
+                    self._pending += 1
+                    self._fail_or_retry(item)
+                self._cond.notify_all()
+
+    def _hedge_target(self, provider, texts):
+        """
+        选择对冲请求的目标：可以处理同样大小批次的其他可用服务中平均耗时最短的，没有时用同一服务
+        """
+        candidates = [
+            p for p in self.pool.providers
+            if p is not provider and p.breaker.available()
+            and (p.capacity is None if provider.capacity is None else (p.capacity or 0) >= p.weigh(texts))
+        ]
+        if not candidates:
+            return provider.translator
+        fastest = min(candidates, key=lambda p: p.busy_time / p.batches if p.batches else float('inf'))
+        return fastest.translator
+
+    def _give_back(self, items):
+        with self._cond:
+            if self._abandoned:
+                return
+            self._in_flight.difference_update(items)
+            self._retry.extend(items)
+            self._cond.notify_all()
+
+    def _fail_or_retry(self, item):
+        """所有服务都失败过的批次记为失败，否则放回队列（调用时需持有锁）"""
+        if self._provider_names <= item.failed_by:
+            if self.on_done is not None:
+                self.on_done({}, item.texts, [])
+            else:
+                self._failed.extend(item.texts)
+            self._pending -= 1
+            self._progress.update(len(item.texts))
+        else:
+            self._retry.append(item)
+
+    def _requeue(self, provider, items, error):
+        """把失败的批次放回队列交给其他服务；所有服务都失败过的批次记为失败"""
+        with self._cond:
+            if self._abandoned:
+                return
+            self._in_flight.difference_update(items)
+            for item in items:
+                item.failed_by.add(provider.name)
+                self._fail_or_retry(item)
+            self._progress.write(f"{provider.name} 翻译失败（{error}），{len(items)} 个批次转交其他服务")
+            self._cond.notify_all()
+
+    def print_stats(self, elapsed):
+        """输出每个翻译服务处理的批次、文本数、错误数和平均耗时"""
+        print(f"\n各翻译服务统计（总耗时 {elapsed:.1f} 秒）:")
+        for p in self.pool.providers:
+            avg = p.busy_time / (p.batches + p.errors) if p.batches + p.errors else 0
+            breaker_info = f"，熔断 {p.breaker.open_count} 次" if p.breaker.open_count else ""
+            throttle_info = f"，限流 {p.limiter.throttle_count} 次" if p.limiter.throttle_count else ""
+            workers = p.workers if p.concurrency is None else f"{p.concurrency.min_limit}-{p.concurrency.max_limit}"
+            print(f"- {p.name}（并发 {workers}）: {p.batches} 个请求，{p.texts} 个文本，失败 {p.errors} 次{breaker_info}{throttle_info}，"
+                  f"平均每次 {avg:.2f} 秒")
+            if p.concurrency is not None:
+                c = p.concurrency
+                print(f"  并发数自动调整 {max(0, len(c.history) - 1)} 次，最终为 {c.current}: {c.describe_history()}")
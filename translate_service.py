@@ -0,0 +1,442 @@
+import argparse
+import datetime
+import http.server
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from urllib.parse import urlparse
+import memory_profile
+import translate_scheduler
+from translate_ai import (
+    API_NAMES, DEFAULT_WORKERS, column_letter_to_index, combine_translators, configure_scheduler,
+    create_translator_pair, load_config, parse_api_choices, parse_api_rates, parse_column_input,
+    translate_excel_file, translate_via_csv
+)
+
+# 默认监听地址
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 等待执行的任务数上限，队列满时拒绝新任务
+DEFAULT_QUEUE_SIZE = 100
+# 同时执行的任务数
+DEFAULT_JOB_WORKERS = 2
+# 翻译记忆每个方向最多保存的文本数
+DEFAULT_MEMORY_ENTRIES = 200000
+# 保留状态的已完成任务数
+MAX_FINISHED_JOBS = 1000
+
+class TranslationMemory:
+    """
+    线程安全的翻译记忆：{原文: 译文}，超过容量时淘汰最久未使用的文本
+
+    提供get和update，可以直接作为batch_translate的memory参数。
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        with self._lock:
+            translation = self._entries.get(text)
+            if translation is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(text)
+            return translation
+
+    def update(self, translations):
+        with self._lock:
+            for text, translation in translations.items():
+                if translation is None:
+                    continue
+                self._entries[text] = translation
+                self._entries.move_to_end(text)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class Job:
+    """一个翻译任务"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, spec):
+        self.id = str(next(Job._ids))
+        self.spec = spec
+        self.status = 'queued'
+        self.output = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'status': self.status,
+            'file': self.spec['file'],
+            'output': self.output,
+            'error': self.error,
+            'created': datetime.datetime.fromtimestamp(self.created).isoformat(timespec='seconds'),
+            'wait_seconds': round((self.started or now) - self.created, 3),
+            'run_seconds': round((self.finished or now) - self.started, 3) if self.started else None,
+        }
+
+class TranslationService:
+    """
+    常驻的翻译服务：翻译器、连接池、解析缓存和翻译记忆在各任务之间复用
+
+    任务放入有界队列，由固定数量的工作线程依次执行；队列满时拒绝新任务，由调用方稍后重试。
+
+    进程内共用的调度设置（自动调整并发数、请求对冲）在服务启动时按命令行参数设置一次，所有任务相同，
+    任务不会修改它们。取消状态表示停止服务：收到Ctrl-C后正在执行的任务不再发出新的请求并输出部分结果，
+    排队的任务不再执行，也不再接收新任务。内存记录按运行记录各阶段，开启时任务依次执行，不会互相交错。
+    """
+
+    def __init__(self, config, args, queue_size=DEFAULT_QUEUE_SIZE, job_workers=DEFAULT_JOB_WORKERS,
+                 memory_entries=DEFAULT_MEMORY_ENTRIES):
+        self.config = config
+        self.args = args
+        self.rates = parse_api_rates(args.api_rates)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.job_workers = job_workers
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        # {API编号元组: translators字典}，同一组API的所有任务共用翻译器（及其限速器、熔断器和连接池）
+        self._translators = {}
+        self._translators_lock = threading.Lock()
+        self.memory = {
+            'zh_to_en': TranslationMemory(memory_entries),
+            'en_to_zh': TranslationMemory(memory_entries),
+        }
+        self.started = time.time()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_time = 0.0
+        self._stats_lock = threading.Lock()
+        # 开启内存记录时各任务依次执行
+        self._profile_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.job_workers):
+            threading.Thread(target=self._worker, name=f'job-worker-{i + 1}', daemon=True).start()
+
+    @property
+    def stopping(self):
+        return translate_scheduler.cancellation.requested()
+
+    def wait_stopped(self):
+        """等待取消，并等到正在执行的任务结束、排队的任务都已标记为取消"""
+        translate_scheduler.cancellation.wait()
+        self._queue.join()
+
+    def translators_for(self, api_choices):
+        """取得一组API的翻译器，第一次使用时创建"""
+        key = tuple(api_choices)
+        with self._translators_lock:
+            if key not in self._translators:
+                translator_pairs = [
+                    (api_choice, create_translator_pair(api_choice, self.config, self.args))
+                    for api_choice in api_choices
+                ]
+                self._translators[key] = combine_translators(translator_pairs, self.rates, self.args.workers)
+                print(f"已创建翻译器: {', '.join(API_NAMES[c] for c in api_choices)}")
+            return self._translators[key]
+
+    def parse_job(self, body):
+        """
+        校验任务参数，返回规范化的任务说明，参数无效时抛出ValueError
+
+        参数与命令行相同：file（必需）、zh2en、en2zh、api/apis、batch、use_csv、incremental、key_column
+        """
+        if not isinstance(body, dict):
+            raise ValueError("请求内容应为JSON对象")
+        path = body.get('file')
+        if not path or not isinstance(path, str):
+            raise ValueError("缺少file参数（Excel文件路径）")
+        if not os.path.exists(path):
+            raise ValueError(f"找不到文件 {path}")
+
+        def indices(value):
+            if not value:
+                return []
+            try:
+                return [column_letter_to_index(col) for col in parse_column_input(value)]
+            except (ValueError, AttributeError):
+                raise ValueError(f"无效的列名 '{value}'")
+
+        zh_to_en_indices = indices(body.get('zh2en'))
+        en_to_zh_indices = indices(body.get('en2zh'))
+        if not zh_to_en_indices and not en_to_zh_indices:
+            raise ValueError("请至少指定一个翻译方向（zh2en或en2zh）")
+        apis = body.get('apis') or str(body.get('api') or self.args.api or 1)
+        key_column = body.get('key_column')
+        try:
+            batch_size = int(body.get('batch', self.args.batch))
+        except (TypeError, ValueError):
+            raise ValueError("batch应为整数")
+        if batch_size < 1:
+            raise ValueError("batch必须大于0")
+        return {
+            'file': path,
+            'zh_to_en_indices': zh_to_en_indices,
+            'en_to_zh_indices': en_to_zh_indices,
+            'api_choices': parse_api_choices(str(apis)),
+            'batch': batch_size,
+            'use_csv': bool(body.get('use_csv', False)) and not body.get('incremental'),
+            'incremental': bool(body.get('incremental', False)),
+            'key_index': indices(key_column)[0] if key_column else None,
+        }
+
+    def submit(self, body):
+        """提交任务，返回Job；参数无效时抛出ValueError，队列已满时抛出queue.Full"""
+        job = Job(self.parse_job(body))
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._trim_jobs()
+        return job
+
+    def _trim_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ('done', 'failed', 'cancelled')]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._jobs_lock:
+            return [job.to_dict() for job in self._jobs.values()]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if self.stopping:
+                job.status = 'cancelled'
+                job.error = '服务正在停止，任务未执行'
+                job.finished = time.time()
+                self._queue.task_done()
+                continue
+            job.status = 'running'
+            job.started = time.time()
+            try:
+                job.output = self._run(job.spec)
+                job.status = 'done'
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = 'failed'
+                traceback.print_exc()
+            job.finished = time.time()
+            with self._stats_lock:
+                self.busy_time += job.finished - job.started
+                if job.status == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._queue.task_done()
+
+    def _run(self, spec):
+        translators = self.translators_for(spec['api_choices'])
+        if memory_profile.profiler.enabled:
+            with self._profile_lock:
+                return self._translate(spec, translators)
+        return self._translate(spec, translators)
+
+    def _translate(self, spec, translators):
+        print(f"\n开始任务: {spec['file']}")
+        if spec['use_csv']:
+            return translate_via_csv(spec['file'], translators, spec['zh_to_en_indices'], spec['en_to_zh_indices'],
+                                     spec['batch'], self.args.workers, memory=self.memory)
+        return translate_excel_file(spec['file'], translators, spec['zh_to_en_indices'], spec['en_to_zh_indices'],
+                                    spec['batch'], self.args.workers, spec['incremental'], spec['key_index'],
+                                    memory=self.memory)
+
+    def stats(self):
+        with self._jobs_lock:
+            statuses = [job.status for job in self._jobs.values()]
+        with self._translators_lock:
+            translator_keys = list(self._translators)
+        with self._stats_lock:
+            return {
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'queued': statuses.count('queued'),
+                'running': statuses.count('running'),
+                'cancelled': statuses.count('cancelled'),
+                'stopping': self.stopping,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'queue_size': self._queue.maxsize,
+                'job_workers': self.job_workers,
+                'busy_seconds': round(self.busy_time, 1),
+                'translators': [[API_NAMES[c] for c in key] for key in translator_keys],
+                'memory': {
+                    direction: {'entries': len(m), 'hits': m.hits, 'misses': m.misses}
+                    for direction, m in self.memory.items()
+                },
+            }
+
+class ServiceRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    HTTP接口:
+    POST /jobs        提交任务（JSON），返回202和任务状态；队列已满时返回503
+    GET  /jobs        所有任务的状态
+    GET  /jobs/<id>   单个任务的状态
+    GET  /stats       服务统计（队列、任务数、翻译记忆命中率等）
+    """
+
+    service = None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/')
+        if path == '/stats':
+            self._send_json(200, self.service.stats())
+        elif path == '/jobs':
+            self._send_json(200, self.service.list_jobs())
+        elif path.startswith('/jobs/'):
+            job = self.service.get_job(path[len('/jobs/'):])
+            if job is None:
+                self._send_json(404, {'error': '任务不存在'})
+            else:
+                self._send_json(200, job.to_dict())
+        else:
+            self._send_json(404, {'error': '未知的路径'})
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/jobs':
+            self._send_json(404, {'error': '未知的路径'})
+            return
+        if self.service.stopping:
+            self._send_json(503, {'error': '服务正在停止，不再接收新任务'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            job = self.service.submit(body)
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except queue.Full:
+            self._send_json(503, {'error': '任务队列已满，请稍后重试'})
+            return
+        self._send_json(202, job.to_dict())
+
+    def address_string(self):
+        # Unix套接字的客户端地址为空字符串
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        print(f"[{self.log_date_time_string()}] {self.address_string()} {format % args}")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """监听Unix套接字的HTTP服务"""
+    daemon_threads = True
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None):
+    """创建HTTP服务，指定unix_socket时监听Unix套接字，否则监听host:port"""
+    handler = type('Handler', (ServiceRequestHandler,), {'service': service})
+    if unix_socket:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("当前系统不支持Unix套接字")
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return UnixHTTPServer(unix_socket, handler)
+    return http.server.ThreadingHTTPServer((host, port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description='Excel翻译常驻服务：复用翻译器、连接和翻译记忆，通过HTTP接口接收翻译任务')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'监听地址（默认{DEFAULT_HOST}）')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口（默认{DEFAULT_PORT}）')
+    parser.add_argument('--socket', type=str, help='改为监听Unix套接字文件')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help=f'等待执行的任务数上限（默认{DEFAULT_QUEUE_SIZE}）')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOB_WORKERS, help=f'同时执行的任务数（默认{DEFAULT_JOB_WORKERS}）')
+    parser.add_argument('--memory-entries', type=int, default=DEFAULT_MEMORY_ENTRIES, help=f'翻译记忆每个方向最多保存的文本数（默认{DEFAULT_MEMORY_ENTRIES}）')
+    parser.add_argument('--api', type=int, choices=[1, 2, 3, 4], help='任务未指定API时使用的翻译API（默认1）')
+    parser.add_argument('--api-rates', type=str, help='各API的速率上限（每秒请求数），如 4=5,3=1')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'每个翻译API同时进行的批量请求数（默认{DEFAULT_WORKERS}）')
+    parser.add_argument('--max-workers', type=int, help='根据耗时和限流自动调整并发数的上限（指定后启用自动调整，--workers为初始并发数）')
+    parser.add_argument('--min-workers', type=int, default=1, help='自动调整并发数的下限（默认1）')
+    parser.add_argument('--hedge', action='store_true', help='启用请求对冲：批次耗时过长时再发一个相同请求，先返回的生效')
+    parser.add_argument('--hedge-percentile', type=float, default=95, help='触发对冲的耗时分位数（默认95）')
+    parser.add_argument('--hedge-budget', type=float, default=0.1, help='对冲请求占总请求数的比例上限（默认0.1）')
+    parser.add_argument('--max-retries', type=int, default=3, help='限流、超时和服务端错误的最大重试次数（默认3）')
+    parser.add_argument('--batch', type=int, default=10, help='任务未指定时的批量翻译大小')
+    parser.add_argument('--cancel-grace', type=float, default=translate_scheduler.Cancellation.DEFAULT_GRACE,
+                        help=f'Ctrl-C后等待正在执行的任务中已发出请求完成的秒数（默认{translate_scheduler.Cancellation.DEFAULT_GRACE}）')
+    parser.add_argument('--profile-memory', action='store_true', help='记录每个任务各阶段的内存使用（任务改为依次执行，会明显变慢）')
+    parser.add_argument('--baidu-appid', type=str, help='百度翻译API的APP ID')
+    parser.add_argument('--baidu-key', type=str, help='百度翻译API的密钥')
+    parser.add_argument('--deepseek-key', type=str, help='DeepSeek-V3 API的密钥')
+    parser.add_argument('--deepseek-url', type=str, help='DeepSeek-V3 API的URL地址')
+    parser.add_argument('--glossary', type=str, help='DeepSeek-V3使用的术语表CSV文件（两列：中文,英文）')
+    args = parser.parse_args()
+
+    if args.queue_size < 1 or args.jobs < 1 or args.workers < 1:
+        print("错误：--queue-size、--jobs和--workers必须大于0")
+        return
+    translate_scheduler.retry_policy.max_retries = max(0, args.max_retries)
+    # 对冲线程池按所有任务、所有API和两个方向同时进行的最大请求数分配
+    try:
+        configure_scheduler(args, max(args.workers, args.max_workers or 0) * len(API_NAMES) * 2 * args.jobs)
+    except ValueError as e:
+        print(f"错误：{e}")
+        return
+    if args.profile_memory:
+        memory_profile.profiler.start()
+
+    try:
+        service = TranslationService(load_config(), args, args.queue_size, args.jobs, args.memory_entries)
+        server = create_server(service, args.host, args.port, args.socket)
+    except (ValueError, OSError) as e:
+        print(f"错误：{e}")
+        return
+    service.start()
+    # Ctrl-C后不再接收和开始新任务，正在执行的任务输出部分结果后停止服务；再按一次Ctrl-C立即退出
+    translate_scheduler.cancellation.grace = args.cancel_grace
+    translate_scheduler.cancellation.install()
+    threading.Thread(target=lambda: (service.wait_stopped(), server.shutdown()), daemon=True).start()
+    address = args.socket or f"http://{args.host}:{args.port}"
+    print(f"翻译服务已启动: {address}（同时执行 {args.jobs} 个任务，队列上限 {args.queue_size}）")
+    try:
+        server.serve_forever()
+        print("\n翻译服务已停止")
+    except KeyboardInterrupt:
+        print("\n翻译服务已停止")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import translate_scheduler
+from excel_cache import file_content_hash
+from translate_ai import (
+    API_NAMES, DEFAULT_WORKERS, apply_csv_translations, batch_translate, column_letter_to_index, combine_translators,
+    create_translator_pair, excel_to_csv, extract_csv_texts, load_config, parse_api_choices, parse_api_rates,
+    parse_column_input
+)
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+DIRECTIONS = ('zh_to_en', 'en_to_zh')
+# 每翻译这么多文本保存一次进度
+CHECKPOINT_TEXTS = 1000
+# 锁文件超过这么多秒没有更新时视为处理该分片的节点已经退出
+DEFAULT_LOCK_TIMEOUT = 600
+# 处理分片期间更新锁文件的间隔（秒）
+HEARTBEAT_INTERVAL = 30
+
+def shard_of(direction, text, shard_count):
+    """文本所属的分片编号，只取决于方向和文本内容，重新导出时保持不变"""
+    digest = hashlib.blake2b(f'{direction}\t{text}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+def shard_paths(shard_dir, index):
+    """分片的各个文件：待翻译文本、翻译进度、完成结果和锁文件"""
+    base = os.path.join(shard_dir, f'shard_{index:04d}')
+    return {
+        'texts': base + '.csv',
+        'partial': base + '.partial.csv',
+        'result': base + '.done.csv',
+        'lock': base + '.lock',
+    }
+
+def load_manifest(shard_dir):
+    path = os.path.join(shard_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise ValueError(f"目录 '{shard_dir}' 中没有{MANIFEST_NAME}，请先执行export")
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"{MANIFEST_NAME}的版本不受支持，请重新执行export")
+    return manifest
+
+def _write_atomic(path, write):
+    """先写入临时文件再替换，其他节点不会读到写了一半的文件"""
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+def _write_rows(path, header, rows):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+    _write_atomic(path, write)
+
+def _read_translations(path):
+    """读取分片的翻译结果，返回{(方向, 原文): 译文}"""
+    translations = {}
+    if not os.path.exists(path):
+        return translations
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for row in csv.DictReader(f):
+            if row.get('translation'):
+                translations[(row['direction'], row['text'])] = row['translation']
+    return translations
+
+def _lock_is_fresh(lock_path, lock_timeout):
+    """锁文件存在且在lock_timeout秒内更新过，即有节点正在处理该分片"""
+    try:
+        return time.time() - os.path.getmtime(lock_path) <= lock_timeout
+    except OSError:
+        return False
+
+def export_shards(input_path, zh_to_en_indices, en_to_zh_indices, shard_count, shard_dir,
+                  lock_timeout=DEFAULT_LOCK_TIMEOUT):
+    """
+    提取需要翻译的唯一文本，按内容哈希分为shard_count个分片文件，并写入manifest.json
+
+    重复导出同一文件时分片内容不变，已完成的分片结果继续有效；分片内容变化（如输入文件被修改）时，
+    该分片旧的进度和结果会被删除。内容变化的分片正由其他节点处理（锁文件未超时）时拒绝导出，
+    不写入任何文件。
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    source_csv = os.path.join(shard_dir, 'source.csv')
+    df = excel_to_csv(input_path, source_csv)
+    df_columns = list(df.columns)
+    zh_to_en_columns = [str(df_columns[idx]) for idx in zh_to_en_indices]
+    en_to_zh_columns = [str(df_columns[idx]) for idx in en_to_zh_indices]
+    stores, _ = extract_csv_texts(source_csv, zh_to_en_columns, en_to_zh_columns)
+    os.remove(source_csv)
+
+    shards = [[] for _ in range(shard_count)]
+    for direction in DIRECTIONS:
+        for text in stores[direction].texts():
+            shards[shard_of(direction, text, shard_count)].append((direction, text))
+
+    try:
+        old_shards = {s['index']: s['hash'] for s in load_manifest(shard_dir)['shards']}
+    except (ValueError, KeyError):
+        old_shards = {}
+
+    hashes = []
+    for rows in shards:
+        rows.sort()
+        hashes.append(hashlib.sha1('\n'.join(f'{d}\t{t}' for d, t in rows).encode('utf-8')).hexdigest())
+    busy = [index for index, content_hash in enumerate(hashes)
+            if old_shards.get(index) != content_hash and _lock_is_fresh(shard_paths(shard_dir, index)['lock'], lock_timeout)]
+    if busy:
+        raise ValueError(f"分片 {', '.join(map(str, busy))} 的内容已变化但正由其他节点处理，请等待处理结束后再重新导出")
+
+    shard_entries = []
+    for index, (rows, content_hash) in enumerate(zip(shards, hashes)):
+        paths = shard_paths(shard_dir, index)
+        if old_shards.get(index) != content_hash:
+            for key in ('partial', 'result'):
+                if os.path.exists(paths[key]):
+                    os.remove(paths[key])
+        _write_rows(paths['texts'], ['direction', 'text'], rows)
+        shard_entries.append({'index': index, 'file': os.path.basename(paths['texts']),
+                              'texts': len(rows), 'hash': content_hash})
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'input': os.path.abspath(input_path),
+        'input_hash': file_content_hash(input_path),
+        'zh_to_en_indices': list(zh_to_en_indices),
+        'en_to_zh_indices': list(en_to_zh_indices),
+        'zh_to_en_columns': zh_to_en_columns,
+        'en_to_zh_columns': en_to_zh_columns,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'shards': shard_entries,
+    }
+    def write_manifest(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    _write_atomic(os.path.join(shard_dir, MANIFEST_NAME), write_manifest)
+    sizes = [entry['texts'] for entry in shard_entries]
+    print(f"已导出 {sum(sizes)} 个唯一文本到 {shard_count} 个分片（每个分片 {min(sizes)}-{max(sizes)} 个）: {shard_dir}")
+    return manifest
+
+def claim_shard(shard_dir, manifest, index=None, lock_timeout=DEFAULT_LOCK_TIMEOUT, exclude=()):
+    """
+    锁定一个分片，返回分片编号；指定index时只尝试该分片，exclude中的分片跳过。没有可处理的分片时返回None
+
+    锁文件用O_EXCL创建，多个节点（共享目录）同时领取时只有一个成功；
+    锁文件超过lock_timeout秒没有更新时视为原节点已退出，可以重新领取：先把超时的锁文件改名
+    （只有一个节点能改名成功），改名后再次检查它确实已超时，再重新创建锁文件。
+    """
+    indices = [index] if index is not None else [s['index'] for s in manifest['shards']]
+    for i in indices:
+        paths = shard_paths(shard_dir, i)
+        if i in exclude or os.path.exists(paths['result']):
+            continue
+        for _ in range(2):
+            try:
+                fd = os.open(paths['lock'], os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if _lock_is_fresh(paths['lock'], lock_timeout) or not _take_over_stale_lock(paths['lock'], lock_timeout):
+                    break
+                print(f"分片 {i} 的锁已超时，重新领取")
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(f'{socket.gethostname()} {os.getpid()} {datetime.datetime.now().isoformat(timespec="seconds")}\n')
+            return i
+    return None
+
+def _take_over_stale_lock(lock_path, lock_timeout):
+    """
+    移走超时的锁文件，成功时返回True
+
+    检查超时和删除之间其他节点可能已经接管并创建了新的锁文件，直接删除会删掉新锁。
+    这里先把锁文件改名为本节点独有的文件名（多个节点同时改名时只有一个成功），再检查改名后的文件：
+    确实已超时则删除；是其他节点刚创建的新锁时原样放回，返回False。
+    """
+    taken_path = f'{lock_path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.stale'
+    try:
+        os.rename(lock_path, taken_path)
+    except FileNotFoundError:
+        # 锁文件已被移走或释放，直接重新领取
+        return True
+    except OSError:
+        return False
+    if _lock_is_fresh(taken_path, lock_timeout):
+        try:
+            # 用硬链接放回，不会覆盖期间新创建的锁文件
+            os.link(taken_path, lock_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # 文件系统不支持硬链接时改名放回
+            os.replace(taken_path, lock_path)
+            return False
+        os.remove(taken_path)
+        return False
+    os.remove(taken_path)
+    return True
+
+def release_shard(shard_dir, index):
+    try:
+        os.remove(shard_paths(shard_dir, index)['lock'])
+    except OSError:
+        pass
+
+def _heartbeat(lock_path, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            os.utime(lock_path)
+        except OSError:
+            return
+
+def translate_shard(shard_dir, index, translators, batch_size=10, workers=DEFAULT_WORKERS):
+    """
+    翻译一个分片（调用前需要先用claim_shard锁定）
+
+    每翻译CHECKPOINT_TEXTS个文本重写一次进度文件（先写临时文件再替换，中断时不会留下写了一半的文件），
+    重新执行时只翻译剩下的文本。
+    全部翻译成功后进度文件改名为完成结果；有未能翻译的文本时保留进度文件，重新执行时重试这些文本。
+
+    返回:
+    未能翻译的文本数
+    """
+    paths = shard_paths(shard_dir, index)
+    with open(paths['texts'], 'r', encoding='utf-8-sig', newline='') as f:
+        rows = [(row['direction'], row['text']) for row in csv.DictReader(f)]
+    done = _read_translations(paths['partial'])
+    print(f"\n分片 {index}: 共 {len(rows)} 个文本，之前已完成 {sum(1 for r in rows if r in done)} 个")
+
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(paths['lock'], stop), daemon=True).start()
+    failed = 0
+    try:
+        for direction in DIRECTIONS:
+            remaining = [text for d, text in rows if d == direction and (d, text) not in done]
+            for start in range(0, len(remaining), CHECKPOINT_TEXTS):
+                chunk = remaining[start:start + CHECKPOINT_TEXTS]
+                failed_texts = set()
+                translations = batch_translate(translators[direction], chunk, batch_size,
+                                               failed_texts=failed_texts, workers=workers)
+                done.update(((direction, text), translation)
+                            for text, translation in zip(chunk, translations) if translation)
+                _write_rows(paths['partial'], ['direction', 'text', 'translation'],
+                            ([d, text, translation] for (d, text), translation in done.items()))
+                failed += len(failed_texts)
+    finally:
+        stop.set()
+
+    if failed:
+        print(f"分片 {index}: {failed} 个文本未能翻译，保留进度，重新执行work时重试")
+    else:
+        os.replace(paths['partial'], paths['result'])
+        print(f"分片 {index}: 已完成")
+    return failed
+
+def merge_shards(shard_dir, output_path=None, force=False):
+    """
+    把所有分片的翻译结果应用到原Excel文件，生成_translated文件
+
+    未完成分片中已翻译的文本同样会被应用，其余单元格留空。输入文件在导出后被修改时拒绝合并（force为True时除外）。
+    """
+    manifest = load_manifest(shard_dir)
+    input_path = manifest['input']
+    if file_content_hash(input_path) != manifest['input_hash']:
+        if not force:
+            raise ValueError(f"输入文件 {input_path} 在导出分片后已被修改，请重新执行export（或使用--force强制合并）")
+        print(f"警告：输入文件 {input_path} 在导出分片后已被修改")
+
+    if output_path is None:
+        name, ext = os.path.splitext(os.path.basename(input_path))
+        output_path = os.path.join(os.path.dirname(input_path), f'{name}_translated{ext}')
+    source_csv = os.path.join(shard_dir, 'source.csv')
+    excel_to_csv(input_path, source_csv)
+    try:
+        stores, cell_ids = extract_csv_texts(source_csv, manifest['zh_to_en_columns'], manifest['en_to_zh_columns'])
+        incomplete = []
+        for entry in manifest['shards']:
+            paths = shard_paths(shard_dir, entry['index'])
+            if os.path.exists(paths['result']):
+                results = _read_translations(paths['result'])
+            else:
+                results = _read_translations(paths['partial'])
+                incomplete.append((entry['index'], len(results), entry['texts']))
+            for (direction, text), translation in results.items():
+                text_id = stores[direction].find(text)
+                if text_id is not None:
+                    stores[direction].set_translation(text_id, translation)
+        for index, done, total in incomplete:
+            print(f"警告：分片 {index} 未完成（{done}/{total}），未翻译的单元格留空")
+        apply_csv_translations(source_csv, output_path, manifest['zh_to_en_columns'], manifest['en_to_zh_columns'],
+                               stores, cell_ids)
+    finally:
+        os.remove(source_csv)
+    print(f"\n合并完成，已生成 {output_path}（{len(manifest['shards']) - len(incomplete)}/{len(manifest['shards'])} 个分片已完成）")
+    return output_path
+
+def print_status(shard_dir, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+    manifest = load_manifest(shard_dir)
+    counts = {'完成': 0, '处理中': 0, '中断': 0, '未开始': 0}
+    for entry in manifest['shards']:
+        paths = shard_paths(shard_dir, entry['index'])
+        if os.path.exists(paths['result']):
+            state = '完成'
+        elif _lock_is_fresh(paths['lock'], lock_timeout):
+            state = '处理中'
+        elif os.path.exists(paths['partial']):
+            state = '中断'
+        else:
+            state = '未开始'
+        counts[state] += 1
+        done = entry['texts'] if state == '完成' else len(_read_translations(paths['partial']))
+        print(f"分片 {entry['index']:4d}: {state}  {done}/{entry['texts']}")
+    print(f"\n共 {len(manifest['shards'])} 个分片: " + "，".join(f"{k} {v}" for k, v in counts.items()))
+
+def add_api_arguments(parser):
+    """添加翻译API相关的参数（与translate_ai.py相同）"""
+    parser.add_argument('--api', type=int, choices=[1, 2, 3, 4], help='翻译API选择：1=MyMemory, 2=Google, 3=百度, 4=DeepSeek-V3')
+    parser.add_argument('--apis', type=str, help='同时使用多个翻译API，如 4,1')
+    parser.add_argument('--api-rates', type=str, help='各API的速率上限（每秒请求数），如 4=5,3=1')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'每个翻译API同时进行的批量请求数（默认{DEFAULT_WORKERS}）')
+    parser.add_argument('--max-retries', type=int, default=3, help='限流、超时和服务端错误的最大重试次数（默认3）')
+    parser.add_argument('--batch', type=int, default=10, help='批量翻译大小')
+    parser.add_argument('--baidu-appid', type=str, help='百度翻译API的APP ID')
+    parser.add_argument('--baidu-key', type=str, help='百度翻译API的密钥')
+    parser.add_argument('--deepseek-key', type=str, help='DeepSeek-V3 API的密钥')
+    parser.add_argument('--deepseek-url', type=str, help='DeepSeek-V3 API的URL地址')
+    parser.add_argument('--glossary', type=str, help='DeepSeek-V3使用的术语表CSV文件（两列：中文,英文）')
+
+def main():
+    parser = argparse.ArgumentParser(description='分片翻译：导出唯一文本到多个分片，由多台机器分别翻译后合并')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='提取需要翻译的唯一文本并分片')
+    export_parser.add_argument('-f', '--file', type=str, required=True, help='Excel文件路径')
+    export_parser.add_argument('--zh2en', type=str, help='中文翻译成英文的列（如A,B,C等）')
+    export_parser.add_argument('--en2zh', type=str, help='英文翻译成中文的列（如A,B,C等）')
+    export_parser.add_argument('-n', '--shards', type=int, required=True, help='分片数')
+    export_parser.add_argument('-o', '--shard-dir', type=str, required=True, help='分片目录（多台机器共享时使用共享目录）')
+    export_parser.add_argument('--lock-timeout', type=int, default=DEFAULT_LOCK_TIMEOUT, help=f'锁文件超过多少秒未更新视为节点已退出（默认{DEFAULT_LOCK_TIMEOUT}）')
+
+    work_parser = subparsers.add_parser('work', help='翻译分片（默认依次领取所有未完成的分片）')
+    work_parser.add_argument('shard_dir', type=str, help='分片目录')
+    work_parser.add_argument('--shard', type=int, help='只翻译指定编号的分片')
+    work_parser.add_argument('--lock-timeout', type=int, default=DEFAULT_LOCK_TIMEOUT, help=f'锁文件超过多少秒未更新视为节点已退出（默认{DEFAULT_LOCK_TIMEOUT}）')
+    add_api_arguments(work_parser)
+
+    merge_parser = subparsers.add_parser('merge', help='把所有分片的翻译结果应用到Excel文件')
+    merge_parser.add_argument('shard_dir', type=str, help='分片目录')
+    merge_parser.add_argument('--output', type=str, help='输出文件路径（默认为原文件旁的_translated文件）')
+    merge_parser.add_argument('--force', action='store_true', help='输入文件在导出后被修改时仍然合并')
+
+    status_parser = subparsers.add_parser('status', help='查看各分片的进度')
+    status_parser.add_argument('shard_dir', type=str, help='分片目录')
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'export':
+            if not args.zh2en and not args.en2zh:
+                raise ValueError("请至少指定一个翻译方向（--zh2en或--en2zh）")
+            if args.shards < 1:
+                raise ValueError("--shards必须大于0")
+            zh_to_en_indices = [column_letter_to_index(c) for c in parse_column_input(args.zh2en)]
+            en_to_zh_indices = [column_letter_to_index(c) for c in parse_column_input(args.en2zh)]
+            export_shards(args.file, zh_to_en_indices, en_to_zh_indices, args.shards, args.shard_dir, args.lock_timeout)
+        elif args.command == 'work':
+            if args.workers < 1:
+                raise ValueError("--workers必须大于0")
+            manifest = load_manifest(args.shard_dir)
+            translate_scheduler.retry_policy.max_retries = max(0, args.max_retries)
+            config = load_config()
+            api_choices = parse_api_choices(args.apis) if args.apis else [args.api if args.api else 1]
+            translators = combine_translators(
+                [(api_choice, create_translator_pair(api_choice, config, args)) for api_choice in api_choices],
+                parse_api_rates(args.api_rates), args.workers
+            )
+            print(f"使用 {', '.join(API_NAMES[c] for c in api_choices)} 翻译分片")
+            # 本次已处理过的分片不再领取，未能全部翻译的分片留给之后重新执行
+            processed = set()
+            while True:
+                index = claim_shard(args.shard_dir, manifest, args.shard, args.lock_timeout, processed)
+                if index is None:
+                    break
+                try:
+                    translate_shard(args.shard_dir, index, translators, args.batch, args.workers)
+                finally:
+                    release_shard(args.shard_dir, index)
+                processed.add(index)
+            print(f"\n本节点处理了 {len(processed)} 个分片" if processed else "\n没有可处理的分片（已完成或正由其他节点处理）")
+        elif args.command == 'merge':
+            merge_shards(args.shard_dir, args.output, args.force)
+        elif args.command == 'status':
+            print_status(args.shard_dir)
+    except ValueError as e:
+        print(f"错误：{e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()